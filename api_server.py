@@ -8,12 +8,31 @@
 from flask import Flask, request, send_file, jsonify
 from flask_cors import CORS
 import os
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from report_generator import (
     generate_daily_report,
     generate_weekly_report,
     generate_monthly_report,
-    generate_custom_report
+    generate_custom_report,
+    generate_team_report,
+    invalidate_mapping_cache,
+    run_report,
+    get_report_data_version,
+    check_export_format,
+    EXPORT_FORMATS,
+    DB_POOL_SIZE,
+    get_connection_pool,
+    init_worker_connection_pool,
+    PoolExhausted,
+    METRICS_ENABLED,
+    METRICS_HISTOGRAM
 )
 
 app = Flask(__name__)
@@ -24,6 +43,204 @@ REPORT_DIR = './reports'
 if not os.path.exists(REPORT_DIR):
     os.makedirs(REPORT_DIR)
 
+# 异步任务配置
+JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))  # 同时生成报表的最大线程数
+JOB_MAX_PENDING = int(os.environ.get('REPORT_JOB_MAX_PENDING', 20))  # 排队+运行中的任务上限
+JOB_RETENTION_SECONDS = int(os.environ.get('REPORT_JOB_RETENTION_SECONDS', 3600))  # 已完成任务记录保留时间
+
+# 报表结果缓存：按 报表类型 + 参数 + 源数据版本 寻址，命中时直接返回已生成的文件
+CACHE_DIR = os.path.join(REPORT_DIR, 'cache')
+CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_MB', 2048)) * 1024 * 1024  # 缓存目录总大小上限
+CACHE_MAX_AGE_SECONDS = int(os.environ.get('REPORT_CACHE_MAX_AGE_SECONDS', 7 * 24 * 3600))  # 超过此时间未使用则淘汰
+CACHE_IGNORED_PARAMS = ('streaming',)  # 只影响生成方式、不影响报表内容的参数
+CACHE_LOCK = threading.Lock()
+if not os.path.exists(CACHE_DIR):
+    os.makedirs(CACHE_DIR)
+
+# 批量报表并行配置
+# 线程模式共用本进程的数据库连接池，并发数默认取连接池的一半，给其他请求留出连接；
+# 进程模式绕开 GIL（openpyxl 构建工作簿是 CPU 密集型），每个子进程各自建立一个小连接池
+BATCH_MODE = os.environ.get('REPORT_BATCH_MODE', 'thread')  # thread / process
+BATCH_WORKERS = int(os.environ.get('REPORT_BATCH_WORKERS', max(1, DB_POOL_SIZE // 2)))
+BATCH_PROCESS_POOL_SIZE = 2  # 每个子进程的连接池大小（同一时刻只生成一个报表）
+BATCH_EXECUTORS = {}
+BATCH_EXECUTORS_LOCK = threading.Lock()
+
+# 数据库连接池背压：连接已全部占用且排队等待数达到上限时，新的同步报表请求直接返回 503，
+# 让客户端稍后重试，而不是排队后在报表生成到一半时因取不到连接而失败
+POOL_SHED_MAX_WAITING = int(os.environ.get('REPORT_POOL_SHED_MAX_WAITING', 2))
+POOL_RETRY_AFTER_SECONDS = int(os.environ.get('REPORT_POOL_RETRY_AFTER_SECONDS', 5))
+POOL_SHED_PATHS = (
+    '/api/reports/daily',
+    '/api/reports/weekly',
+    '/api/reports/monthly',
+    '/api/reports/custom',
+    '/api/reports/team',
+    '/api/reports/batch',
+)
+
+
+# ==================== 报表类型与结果缓存 ====================
+# 报表类型 -> (生成函数, 必填参数, 可选参数, 下载文件名（不含扩展名，扩展名随 format 参数）)
+REPORT_TYPES = {
+    'daily': (
+        generate_daily_report,
+        ['report_date'],
+        ['accounts', 'streaming', 'format'],
+        lambda p: f"日报_{p['report_date']}"
+    ),
+    'weekly': (
+        generate_weekly_report,
+        ['week1_start', 'week1_end', 'week2_start', 'week2_end'],
+        ['accounts', 'streaming', 'format'],
+        lambda p: f"周报_{p['week2_start']}_to_{p['week2_end']}"
+    ),
+    'monthly': (
+        generate_monthly_report,
+        ['month1_start', 'month1_end', 'month2_start', 'month2_end'],
+        ['accounts', 'streaming', 'format'],
+        lambda p: f"月报_{p['month2_start']}_to_{p['month2_end']}"
+    ),
+    'custom': (
+        generate_custom_report,
+        ['period1_start', 'period1_end', 'period2_start', 'period2_end'],
+        ['shop_ids', 'accounts', 'streaming', 'format'],
+        lambda p: f"自定义报表_{p['period2_start']}_to_{p['period2_end']}"
+    ),
+    'team': (
+        generate_team_report,
+        ['period1_start', 'period1_end', 'period2_start', 'period2_end'],
+        ['shop_ids', 'accounts'],
+        lambda p: f"团队汇总_{p['period2_start']}_to_{p['period2_end']}"
+    ),
+}
+
+
+def _report_cache_key(report_type, params):
+    """缓存键：报表类型 + 影响报表内容的参数 + 源数据版本"""
+    key_params = {}
+    for name, value in params.items():
+        if name in CACHE_IGNORED_PARAMS or value in (None, '', []):
+            continue
+        if name == 'format' and value == 'xlsx':
+            continue  # 默认格式不计入，与增加 format 参数前的缓存键一致
+        if isinstance(value, list):
+            # 门店/账号筛选与顺序无关
+            value = sorted(str(v) for v in value)
+        key_params[name] = value
+
+    version = get_report_data_version(report_type, params)
+    raw = json.dumps([report_type, key_params, version], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def evict_report_cache():
+    """淘汰报表缓存：先删除超过最长保留时间的文件，再按最近使用时间从旧到新删除，直到总大小不超过上限"""
+    with CACHE_LOCK:
+        now = time.time()
+        entries = []
+        for name in os.listdir(CACHE_DIR):
+            if not name.endswith(tuple(extension for extension, _ in EXPORT_FORMATS.values())):
+                continue
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > CACHE_MAX_AGE_SECONDS:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+def get_or_generate_report(report_type, params, progress_callback=None):
+    """
+    获取报表文件：缓存命中时直接返回已生成的文件，否则生成并写入缓存
+
+    参数:
+        report_type: str, daily / weekly / monthly / custom / team
+        params: dict, 对应生成函数的参数
+        progress_callback: callable, 可选，生成进度回调
+
+    返回:
+        (文件路径, 是否命中缓存)；没有数据时返回 (None, False)
+    """
+    key = _report_cache_key(report_type, params)
+    extension = EXPORT_FORMATS[params.get('format') or 'xlsx'][0]
+    cached_file = os.path.abspath(os.path.join(CACHE_DIR, f'{key}{extension}'))
+
+    if os.path.exists(cached_file):
+        try:
+            os.utime(cached_file)  # 刷新最近使用时间
+            return cached_file, True
+        except FileNotFoundError:
+            pass  # 刚好被淘汰，重新生成
+
+    # 先写临时文件再原子替换，避免其他请求读到写了一半的文件
+    temp_file = f'{cached_file}.{uuid.uuid4().hex}.part'
+    generator = REPORT_TYPES[report_type][0]
+    try:
+        filename = generator(output_filename=temp_file, progress_callback=progress_callback, **params)
+        if not filename:
+            return None, False
+        os.replace(temp_file, cached_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    evict_report_cache()
+    return cached_file, False
+
+
+def send_report_file(filename, report_type, params):
+    """以附件形式返回报表文件，下载文件名的扩展名和 MIME 类型随 format 参数"""
+    extension, mimetype = EXPORT_FORMATS[params.get('format') or 'xlsx']
+    return send_file(
+        filename,
+        as_attachment=True,
+        download_name=REPORT_TYPES[report_type][3](params) + extension,
+        mimetype=mimetype
+    )
+
+
+def service_unavailable(message):
+    """503 响应（带 Retry-After）"""
+    response = jsonify({'error': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(POOL_RETRY_AFTER_SECONDS)
+    return response
+
+
+def error_response(e):
+    """报表接口异常转为 JSON 错误响应：数据库连接排队超时返回 503，其余返回 500"""
+    if isinstance(e, PoolExhausted):
+        return service_unavailable(str(e))
+    return jsonify({'error': str(e)}), 500
+
+
+@app.before_request
+def shed_load_when_pool_saturated():
+    """数据库连接池饱和时拒绝新的同步报表请求"""
+    if request.method != 'POST' or request.path not in POOL_SHED_PATHS:
+        return None
+    pool = get_connection_pool()
+    if not hasattr(pool, 'stats'):
+        return None  # 注入的连接池不提供占用统计时不做背压
+    stats = pool.stats()
+    if stats['in_use'] >= stats['pool_size'] and stats['waiting'] >= POOL_SHED_MAX_WAITING:
+        return service_unavailable('数据库连接繁忙，请稍后重试（或使用 /api/jobs 异步任务）')
+    return None
+
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -34,6 +251,43 @@ def health_check():
     })
 
 
+@app.route('/api/cache/mappings/invalidate', methods=['POST'])
+def api_invalidate_mapping_cache():
+    """使门店/商圈映射缓存失效（账号、门店或商圈配置变更后调用）"""
+    invalidate_mapping_cache()
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def api_get_metrics():
+    """
+    报表生成性能埋点（本进程内的直方图）及数据库连接池占用/排队统计
+    埋点按报表类型分组，每个 span 给出次数、总耗时、平均/最大耗时、分位数估算、分桶计数及 rows 等字段合计
+    进程模式的批量报表在子进程中生成，不计入这里的统计
+    """
+    pool = get_connection_pool()
+
+    with JOBS_LOCK:
+        job_counts = {}
+        for job in JOBS.values():
+            job_counts[job['status']] = job_counts.get(job['status'], 0) + 1
+
+    return jsonify({
+        'enabled': METRICS_ENABLED,
+        'since': datetime.fromtimestamp(METRICS_HISTOGRAM.since).isoformat(),
+        'jobs': job_counts,
+        'pool': pool.stats() if hasattr(pool, 'stats') else None,
+        'reports': METRICS_HISTOGRAM.snapshot()
+    })
+
+
+@app.route('/api/metrics/reset', methods=['POST'])
+def api_reset_metrics():
+    """清空埋点统计（例如压测前后各取一次）"""
+    METRICS_HISTOGRAM.reset()
+    return jsonify({'status': 'ok'})
+
+
 @app.route('/api/reports/daily', methods=['POST'])
 def api_generate_daily_report():
     """
@@ -41,10 +295,13 @@ def api_generate_daily_report():
 
     请求体 (JSON):
     {
-        "report_date": "2025-12-12"
+        "report_date": "2025-12-12",
+        "accounts": ["13718175572a"],  # 可选，只生成这些账号下的门店
+        "streaming": false,  # 可选，true 为流式写入模式（门店很多时降低内存占用）
+        "format": "xlsx"  # 可选，xlsx（默认）/ csv / ndjson / parquet，非 xlsx 时每门店一行、不生成 Excel
     }
 
-    返回: Excel 文件下载
+    返回: 报表文件下载（Excel 或 format 指定的格式）
     """
     try:
         data = request.json
@@ -53,24 +310,29 @@ def api_generate_daily_report():
         if not report_date:
             return jsonify({'error': '缺少参数 report_date'}), 400
 
-        # 生成报表
-        filename = generate_daily_report(
-            report_date=report_date,
-            output_filename=os.path.join(REPORT_DIR, f'日报_{report_date}.xlsx')
-        )
+        try:
+            report_format = check_export_format(data.get('format'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 生成报表（相同参数且源数据未变化时直接返回缓存文件）
+        params = {
+            'report_date': report_date,
+            'accounts': data.get('accounts'),
+            'streaming': bool(data.get('streaming', False)),
+            'format': report_format
+        }
+        filename, cache_hit = get_or_generate_report('daily', params)
 
         if filename:
-            return send_file(
-                filename,
-                as_attachment=True,
-                download_name=os.path.basename(filename),
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+            response = send_report_file(filename, 'daily', params)
+            response.headers['X-Report-Cache'] = 'hit' if cache_hit else 'miss'
+            return response
         else:
             return jsonify({'error': f'{report_date} 没有数据'}), 404
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/api/reports/weekly', methods=['POST'])
@@ -83,10 +345,13 @@ def api_generate_weekly_report():
         "week1_start": "2025-11-10",
         "week1_end": "2025-11-16",
         "week2_start": "2025-11-17",
-        "week2_end": "2025-11-23"
+        "week2_end": "2025-11-23",
+        "accounts": ["13718175572a"],  # 可选，只统计这些账号下的门店
+        "streaming": false,  # 可选，true 为流式写入模式
+        "format": "xlsx"  # 可选，xlsx（默认）/ csv / ndjson / parquet
     }
 
-    返回: Excel 文件下载
+    返回: 报表文件下载（Excel 或 format 指定的格式）
     """
     try:
         data = request.json
@@ -98,27 +363,32 @@ def api_generate_weekly_report():
         if not all([week1_start, week1_end, week2_start, week2_end]):
             return jsonify({'error': '缺少必要参数'}), 400
 
-        # 生成报表
-        filename = generate_weekly_report(
-            week1_start=week1_start,
-            week1_end=week1_end,
-            week2_start=week2_start,
-            week2_end=week2_end,
-            output_filename=os.path.join(REPORT_DIR, f'周报_{week2_start}_to_{week2_end}.xlsx')
-        )
+        try:
+            report_format = check_export_format(data.get('format'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 生成报表（相同参数且源数据未变化时直接返回缓存文件）
+        params = {
+            'week1_start': week1_start,
+            'week1_end': week1_end,
+            'week2_start': week2_start,
+            'week2_end': week2_end,
+            'accounts': data.get('accounts'),
+            'streaming': bool(data.get('streaming', False)),
+            'format': report_format
+        }
+        filename, cache_hit = get_or_generate_report('weekly', params)
 
         if filename:
-            return send_file(
-                filename,
-                as_attachment=True,
-                download_name=os.path.basename(filename),
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+            response = send_report_file(filename, 'weekly', params)
+            response.headers['X-Report-Cache'] = 'hit' if cache_hit else 'miss'
+            return response
         else:
             return jsonify({'error': '没有数据'}), 404
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/api/reports/monthly', methods=['POST'])
@@ -131,10 +401,13 @@ def api_generate_monthly_report():
         "month1_start": "2025-09-01",
         "month1_end": "2025-09-30",
         "month2_start": "2025-10-01",
-        "month2_end": "2025-10-31"
+        "month2_end": "2025-10-31",
+        "accounts": ["13718175572a"],  # 可选，只统计这些账号下的门店
+        "streaming": false,  # 可选，true 为流式写入模式
+        "format": "xlsx"  # 可选，xlsx（默认）/ csv / ndjson / parquet
     }
 
-    返回: Excel 文件下载
+    返回: 报表文件下载（Excel 或 format 指定的格式）
     """
     try:
         data = request.json
@@ -146,27 +419,32 @@ def api_generate_monthly_report():
         if not all([month1_start, month1_end, month2_start, month2_end]):
             return jsonify({'error': '缺少必要参数'}), 400
 
-        # 生成报表
-        filename = generate_monthly_report(
-            month1_start=month1_start,
-            month1_end=month1_end,
-            month2_start=month2_start,
-            month2_end=month2_end,
-            output_filename=os.path.join(REPORT_DIR, f'月报_{month2_start}_to_{month2_end}.xlsx')
-        )
+        try:
+            report_format = check_export_format(data.get('format'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 生成报表（相同参数且源数据未变化时直接返回缓存文件）
+        params = {
+            'month1_start': month1_start,
+            'month1_end': month1_end,
+            'month2_start': month2_start,
+            'month2_end': month2_end,
+            'accounts': data.get('accounts'),
+            'streaming': bool(data.get('streaming', False)),
+            'format': report_format
+        }
+        filename, cache_hit = get_or_generate_report('monthly', params)
 
         if filename:
-            return send_file(
-                filename,
-                as_attachment=True,
-                download_name=os.path.basename(filename),
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+            response = send_report_file(filename, 'monthly', params)
+            response.headers['X-Report-Cache'] = 'hit' if cache_hit else 'miss'
+            return response
         else:
             return jsonify({'error': '没有数据'}), 404
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
 
 
 @app.route('/api/reports/custom', methods=['POST'])
@@ -180,10 +458,13 @@ def api_generate_custom_report():
         "period1_end": "2025-11-09",
         "period2_start": "2025-11-10",
         "period2_end": "2025-11-25",
-        "shop_ids": [1001, 1002, 1003]  # 可选，不传则查询所有门店
+        "shop_ids": [1001, 1002, 1003],  # 可选，不传则查询所有门店
+        "accounts": ["13718175572a"],  # 可选，只统计这些账号下的门店（与 shop_ids 同时传时取交集）
+        "streaming": false,  # 可选，true 为流式写入模式
+        "format": "xlsx"  # 可选，xlsx（默认）/ csv / ndjson / parquet
     }
 
-    返回: Excel 文件下载
+    返回: 报表文件下载（Excel 或 format 指定的格式）
     """
     try:
         data = request.json
@@ -196,34 +477,105 @@ def api_generate_custom_report():
         if not all([period1_start, period1_end, period2_start, period2_end]):
             return jsonify({'error': '缺少必要参数'}), 400
 
-        # 生成报表
-        filename = generate_custom_report(
-            period1_start=period1_start,
-            period1_end=period1_end,
-            period2_start=period2_start,
-            period2_end=period2_end,
-            shop_ids=shop_ids,
-            output_filename=os.path.join(REPORT_DIR, f'自定义报表_{period2_start}_to_{period2_end}.xlsx')
-        )
+        try:
+            report_format = check_export_format(data.get('format'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 生成报表（相同参数、相同门店筛选且源数据未变化时直接返回缓存文件）
+        params = {
+            'period1_start': period1_start,
+            'period1_end': period1_end,
+            'period2_start': period2_start,
+            'period2_end': period2_end,
+            'shop_ids': shop_ids,
+            'accounts': data.get('accounts'),
+            'streaming': bool(data.get('streaming', False)),
+            'format': report_format
+        }
+        filename, cache_hit = get_or_generate_report('custom', params)
 
         if filename:
-            return send_file(
-                filename,
-                as_attachment=True,
-                download_name=os.path.basename(filename),
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+            response = send_report_file(filename, 'custom', params)
+            response.headers['X-Report-Cache'] = 'hit' if cache_hit else 'miss'
+            return response
         else:
             return jsonify({'error': '没有数据'}), 404
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+
+@app.route('/api/reports/team', methods=['POST'])
+def api_generate_team_report():
+    """
+    生成团队汇总报表（运营 → 主管 → 全部、销售 各级合计，两个时期对比，不含门店详细Sheet）
+
+    请求体 (JSON):
+    {
+        "period1_start": "2025-10-25",
+        "period1_end": "2025-11-09",
+        "period2_start": "2025-11-10",
+        "period2_end": "2025-11-25",
+        "shop_ids": [1001, 1002, 1003],  # 可选，不传则统计所有门店
+        "accounts": ["13718175572a"]  # 可选，只统计这些账号下的门店（与 shop_ids 同时传时取交集）
+    }
+
+    返回: Excel 文件下载
+    """
+    try:
+        data = request.json
+        period1_start = data.get('period1_start')
+        period1_end = data.get('period1_end')
+        period2_start = data.get('period2_start')
+        period2_end = data.get('period2_end')
+
+        if not all([period1_start, period1_end, period2_start, period2_end]):
+            return jsonify({'error': '缺少必要参数'}), 400
+
+        params = {
+            'period1_start': period1_start,
+            'period1_end': period1_end,
+            'period2_start': period2_start,
+            'period2_end': period2_end,
+            'shop_ids': data.get('shop_ids'),
+            'accounts': data.get('accounts')
+        }
+        filename, cache_hit = get_or_generate_report('team', params)
+
+        if filename:
+            response = send_report_file(filename, 'team', params)
+            response.headers['X-Report-Cache'] = 'hit' if cache_hit else 'miss'
+            return response
+        else:
+            return jsonify({'error': '没有数据'}), 404
+
+    except Exception as e:
+        return error_response(e)
+
+
+def get_batch_executor(mode):
+    """获取批量报表执行器（按模式懒加载，服务运行期间复用）"""
+    with BATCH_EXECUTORS_LOCK:
+        executor = BATCH_EXECUTORS.get(mode)
+        if executor is None:
+            if mode == 'process':
+                # 子进程启动时由 initializer 换上 BATCH_PROCESS_POOL_SIZE 大小的连接池（不修改本进程的环境变量）
+                workers = min(BATCH_WORKERS, os.cpu_count() or 1)
+                executor = ProcessPoolExecutor(max_workers=workers,
+                                               mp_context=multiprocessing.get_context('spawn'),
+                                               initializer=init_worker_connection_pool,
+                                               initargs=(BATCH_PROCESS_POOL_SIZE,))
+            else:
+                executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='report-batch')
+            BATCH_EXECUTORS[mode] = executor
+        return executor
 
 
 @app.route('/api/reports/batch', methods=['POST'])
 def api_generate_batch_reports():
     """
-    批量生成报表
+    批量生成报表（各报表并行生成，结果按请求顺序返回）
 
     请求体 (JSON):
     {
@@ -241,61 +593,214 @@ def api_generate_batch_reports():
                     "week2_end": "2025-11-23"
                 }
             }
-        ]
+        ],
+        "mode": "thread"  # 可选，thread（线程池）/ process（进程池），默认取 REPORT_BATCH_MODE
     }
 
-    返回: 生成结果列表
+    返回: 生成结果列表（每项带 elapsed 耗时秒数）及总耗时
     """
     try:
         data = request.json
         reports = data.get('reports', [])
+        mode = data.get('mode', BATCH_MODE)
 
-        results = []
-        for report_config in reports:
-            report_type = report_config.get('type')
-            params = report_config.get('params', {})
+        if mode not in ('thread', 'process'):
+            return jsonify({'error': f'未知的执行模式: {mode}'}), 400
 
-            try:
-                if report_type == 'daily':
-                    filename = generate_daily_report(**params)
-                elif report_type == 'weekly':
-                    filename = generate_weekly_report(**params)
-                elif report_type == 'monthly':
-                    filename = generate_monthly_report(**params)
-                elif report_type == 'custom':
-                    filename = generate_custom_report(**params)
-                else:
-                    results.append({
-                        'type': report_type,
-                        'status': 'error',
-                        'message': f'未知的报表类型: {report_type}'
-                    })
-                    continue
-
-                if filename:
-                    results.append({
-                        'type': report_type,
-                        'status': 'success',
-                        'filename': filename
-                    })
-                else:
-                    results.append({
-                        'type': report_type,
-                        'status': 'error',
-                        'message': '没有数据'
-                    })
+        start = time.perf_counter()
+        executor = get_batch_executor(mode)
+        futures = [
+            executor.submit(run_report, report_config.get('type'), report_config.get('params', {}))
+            for report_config in reports
+        ]
 
+        results = []
+        for report_config, future in zip(reports, futures):
+            try:
+                results.append(future.result())
             except Exception as e:
+                # 子进程异常退出或参数无法序列化等执行器层面的错误
                 results.append({
-                    'type': report_type,
+                    'type': report_config.get('type'),
                     'status': 'error',
                     'message': str(e)
                 })
 
-        return jsonify({'results': results})
+        return jsonify({'results': results, 'elapsed': round(time.perf_counter() - start, 3)})
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return error_response(e)
+
+
+# ==================== 异步报表任务 ====================
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='report-job')
+JOBS = {}  # job_id -> 任务信息
+ACTIVE_JOB_KEYS = {}  # 任务去重键 -> 排队/运行中的 job_id
+JOBS_LOCK = threading.Lock()
+
+
+def _job_view(job):
+    """任务状态（对外返回的字段）"""
+    view = {
+        'job_id': job['job_id'],
+        'type': job['type'],
+        'params': job['params'],
+        'status': job['status'],
+        'progress': dict(job['progress']),
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+    }
+    if job['status'] == 'success':
+        view['download_url'] = f"/api/jobs/{job['job_id']}/file"
+        view['cache_hit'] = job['cache_hit']
+    if job['error']:
+        view['error'] = job['error']
+    return view
+
+
+def _purge_expired_jobs():
+    """清理超过保留时间的已完成任务记录（报表文件在结果缓存中，由缓存淘汰策略管理；调用方持有 JOBS_LOCK）"""
+    now = time.time()
+    for job_id, job in list(JOBS.items()):
+        if job['finished_ts'] and now - job['finished_ts'] > JOB_RETENTION_SECONDS:
+            del JOBS[job_id]
+
+
+def _run_job(job_id):
+    """在工作线程中执行报表生成任务"""
+    with JOBS_LOCK:
+        job = JOBS[job_id]
+        job['status'] = 'running'
+        job['started_at'] = datetime.now().isoformat()
+
+    def on_progress(done, total):
+        job['progress'] = {'done': done, 'total': total}
+
+    try:
+        filename, cache_hit = get_or_generate_report(job['type'], job['params'], progress_callback=on_progress)
+        status, error = ('success', None) if filename else ('no_data', '没有数据')
+    except Exception as e:
+        filename, cache_hit, status, error = None, False, 'error', str(e)
+
+    with JOBS_LOCK:
+        job['filename'] = filename
+        job['cache_hit'] = cache_hit
+        job['status'] = status
+        job['error'] = error
+        job['finished_at'] = datetime.now().isoformat()
+        job['finished_ts'] = time.time()
+        ACTIVE_JOB_KEYS.pop(job['key'], None)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """
+    提交异步报表任务（立即返回 job_id，报表在后台线程池中生成）
+    相同类型、相同参数的任务在排队/运行期间只会生成一次，重复提交返回同一个 job_id
+
+    请求体 (JSON):
+    {
+        "type": "weekly",  # daily / weekly / monthly / custom / team
+        "params": {
+            "week1_start": "2025-11-10",
+            "week1_end": "2025-11-16",
+            "week2_start": "2025-11-17",
+            "week2_end": "2025-11-23"
+        }
+    }
+
+    返回: 任务状态，HTTP 202
+    """
+    data = request.json or {}
+    report_type = data.get('type')
+    params = data.get('params') or {}
+
+    if report_type not in REPORT_TYPES:
+        return jsonify({'error': f'未知的报表类型: {report_type}'}), 400
+
+    _, required, optional, _ = REPORT_TYPES[report_type]
+    if not all(params.get(name) for name in required):
+        return jsonify({'error': f"缺少必要参数: {', '.join(required)}"}), 400
+    unknown = set(params) - set(required) - set(optional)
+    if unknown:
+        return jsonify({'error': f"不支持的参数: {', '.join(sorted(unknown))}"}), 400
+    if 'format' in params:
+        try:
+            params['format'] = check_export_format(params['format'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    key = json.dumps([report_type, params], sort_keys=True, ensure_ascii=False)
+
+    with JOBS_LOCK:
+        _purge_expired_jobs()
+
+        job_id = ACTIVE_JOB_KEYS.get(key)
+        if job_id:
+            return jsonify(_job_view(JOBS[job_id])), 202
+
+        if len(ACTIVE_JOB_KEYS) >= JOB_MAX_PENDING:
+            return jsonify({'error': '报表任务队列已满，请稍后重试'}), 503
+
+        job_id = uuid.uuid4().hex
+        JOBS[job_id] = {
+            'job_id': job_id,
+            'key': key,
+            'type': report_type,
+            'params': params,
+            'status': 'queued',
+            'progress': {'done': 0, 'total': 0},
+            'filename': None,
+            'cache_hit': False,
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'finished_ts': None,
+        }
+        ACTIVE_JOB_KEYS[key] = job_id
+        view = _job_view(JOBS[job_id])
+
+    JOB_EXECUTOR.submit(_run_job, job_id)
+    return jsonify(view), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """
+    查询异步任务状态
+
+    返回: status 为 queued / running / success / no_data / error，
+          progress 为 {"done": 已处理门店数, "total": 门店总数}
+    """
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if not job:
+            return jsonify({'error': '任务不存在或已过期'}), 404
+        return jsonify(_job_view(job))
+
+
+@app.route('/api/jobs/<job_id>/file', methods=['GET'])
+def api_download_job_file(job_id):
+    """
+    下载异步任务生成的报表
+
+    返回: 报表文件下载（Excel 或任务 format 参数指定的格式）；任务未完成时返回 409
+    """
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if not job:
+            return jsonify({'error': '任务不存在或已过期'}), 404
+        if job['status'] != 'success':
+            return jsonify(_job_view(job)), 409
+        filename = job['filename']
+        report_type, params = job['type'], job['params']
+
+    if not os.path.exists(filename):
+        return jsonify({'error': '报表文件已从缓存中淘汰，请重新提交任务'}), 410
+
+    return send_report_file(filename, report_type, params)
 
 
 if __name__ == '__main__':
@@ -307,9 +812,18 @@ if __name__ == '__main__':
     print("  - POST /api/reports/weekly   - 生成周报")
     print("  - POST /api/reports/monthly  - 生成月报")
     print("  - POST /api/reports/custom   - 生成自定义报表")
+    print("  - POST /api/reports/team     - 生成团队汇总报表（运营/主管/销售合计）")
     print("  - POST /api/reports/batch    - 批量生成报表")
+    print("  - POST /api/jobs             - 提交异步报表任务")
+    print("  - GET  /api/jobs/<job_id>    - 查询异步任务状态/进度")
+    print("  - GET  /api/jobs/<job_id>/file - 下载异步任务生成的报表")
+    print("  - POST /api/cache/mappings/invalidate - 刷新门店映射缓存")
     print("  - GET  /api/health           - 健康检查")
+    print("  - GET  /api/metrics          - 性能埋点与连接池状态")
     print("\n服务地址: http://0.0.0.0:5000")
     print("=" * 60)
 
+    # 创建连接池（不建立连接；设置了 JX_DB_POOL_WARMUP 时在后台预热）
+    get_connection_pool()
+
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+江鑫数据报表性能基准
+- 按 jx_data_info.sql 的表结构建立基准库（默认 SQLite 替身，也可指定本地 MySQL/MariaDB），填充 N 家门店 × D 天的模拟数据
+- 日报/周报/月报/自定义报表各在独立子进程中生成，记录总耗时、各阶段耗时、峰值内存、查询次数
+- 结果保存为 JSON（文件名带 git 提交号），可用 --compare 对比两次结果
+
+用法:
+    python benchmark.py --shops 200 --days 61
+    python benchmark.py --rollup --streaming
+    python benchmark.py --shops 2000 --reports weekly,custom --workers 8
+    python benchmark.py --shops 2000 --format csv
+    python benchmark.py --mysql root:密码@127.0.0.1:3306/jx_bench
+    python benchmark.py --compare benchmark_results/旧.json benchmark_results/新.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit, unquote
+
+import mysql.connector
+from mysql.connector import errorcode
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILE = os.path.join(BASE_DIR, 'jx_data_info.sql')
+ROLLUP_SCHEMA_FILE = os.path.join(BASE_DIR, 'jx_rollup_tables.sql')
+REVIEW_SCHEMA_FILE = os.path.join(BASE_DIR, 'jx_review_tables.sql')
+RESULT_DIR = os.path.join(BASE_DIR, 'benchmark_results')
+
+REPORT_TYPES = ('daily', 'weekly', 'monthly', 'custom')
+PHASES = ('mapping', 'sql', 'processing', 'styling', 'save')
+SHOPS_PER_ACCOUNT = 20
+MANAGER_ID_BASE = 10000  # 模拟主管的 saas_users.id 从此开始，与运营ID不重叠
+PRODUCTION_DATABASE = 'jx_data_info'  # 基准会删表重建，禁止指向正式库
+
+# 表结构导出中缺少、但报表会读取的列
+EXTRA_COLUMNS = {
+    'store_stats': [('ad_balance', 'decimal')],
+}
+
+
+# ==================== 表结构 ====================
+def parse_schema(path):
+    """
+    解析建表语句
+    返回: [(表名, [(列名, 类型, 是否自增)], [(是否唯一, [列名...])])]
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    tables = []
+    for match in re.finditer(r"CREATE TABLE `(\w+)`\s*\((.*?)\n\)", text, re.S):
+        name, body = match.group(1), match.group(2)
+        columns = [(col, typ.lower(), 'AUTO_INCREMENT' in rest)
+                   for col, typ, rest in re.findall(r"^\s+`(\w+)`\s+(\w+)(.*)$", body, re.M)]
+        columns += [(col, typ, False) for col, typ in EXTRA_COLUMNS.get(name, [])]
+        indexes = []
+        for kind, cols in re.findall(r"^\s+(PRIMARY KEY|UNIQUE INDEX|INDEX)[^(]*\((.*?)\) USING", body, re.M):
+            indexes.append((kind != 'INDEX', re.findall(r"`(\w+)`", cols)))
+        tables.append((name, columns, indexes))
+    return tables
+
+
+def split_sql_statements(path, skip_inserts=False):
+    """按分号拆分 SQL 文件（去掉注释），可跳过导出中的样例数据"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    text = re.sub(r"/\*.*?\*/", '', text, flags=re.S)
+    text = re.sub(r"^--.*$", '', text, flags=re.M)
+
+    statements = []
+    for statement in text.split(';\n'):
+        statement = statement.strip().rstrip(';')
+        if not statement or (skip_inserts and statement.upper().startswith('INSERT')):
+            continue
+        statements.append(statement)
+    return statements
+
+
+def _sqlite_type(mysql_type):
+    if mysql_type in ('int', 'bigint', 'tinyint', 'smallint'):
+        return 'INTEGER'
+    if mysql_type in ('decimal', 'float', 'double'):
+        return 'REAL'
+    if mysql_type in ('date', 'datetime'):
+        return mysql_type.upper()
+    return 'TEXT'
+
+
+def create_sqlite_schema(conn, path):
+    """在 SQLite 中按 MySQL 建表语句建表（单列自增主键映射为 INTEGER PRIMARY KEY）"""
+    for name, columns, indexes in parse_schema(path):
+        primary = indexes[0][1] if indexes and indexes[0][0] else []
+        auto_pk = len(primary) == 1 and any(col == primary[0] and auto for col, _, auto in columns)
+
+        defs = []
+        for col, typ, _ in columns:
+            defs.append(f"{col} INTEGER PRIMARY KEY" if auto_pk and col == primary[0] else f"{col} {_sqlite_type(typ)}")
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.execute(f"CREATE TABLE {name} ({', '.join(defs)})")
+
+        for no, (unique, cols) in enumerate(indexes):
+            if auto_pk and no == 0:
+                continue
+            conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX idx_{name}_{no} ON {name} ({', '.join(cols)})")
+
+
+def create_mysql_schema(cursor, path, skip_inserts):
+    for statement in split_sql_statements(path, skip_inserts):
+        cursor.execute(statement)
+    if path == SCHEMA_FILE:
+        for table, columns in EXTRA_COLUMNS.items():
+            for col, typ in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col} {'decimal(12, 2)' if typ == 'decimal' else typ} NULL")
+
+
+# ==================== 模拟数据 ====================
+def generate_dataset(shops, days, end_date, seed=1):
+    """
+    生成模拟数据
+    返回: {表名: [行 dict, ...]}（同一张表的所有行列名一致）
+    """
+    rnd = random.Random(seed)
+    start_date = end_date - timedelta(days=days - 1)
+    updated_at = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    cities = ['北京', '上海', '广州', '深圳', '杭州', '成都']
+    shop_ids = [100000 + i for i in range(shops)]
+
+    data = {name: [] for name in ('saas_users', 'platform_accounts', 'kewen_daily_report',
+                                  'promotion_daily_report', 'store_stats', 'data_upload_log')}
+
+    # 账号：每个账号 SHOPS_PER_ACCOUNT 家门店，每个运营负责 3 个账号，每个主管带 4 个运营
+    for account_no, offset in enumerate(range(0, shops, SHOPS_PER_ACCOUNT)):
+        account_shops = shop_ids[offset:offset + SHOPS_PER_ACCOUNT]
+        operator_id = account_no // 3 + 1
+        manager_id = MANAGER_ID_BASE + (operator_id - 1) // 4
+        if account_no % 12 == 0:
+            data['saas_users'].append({
+                'id': manager_id, 'username': f'mgr{manager_id}', 'password': '-', 'name': f'主管{manager_id}',
+                'role': 'operation_manager', 'manager_id': None, 'updated_at': updated_at,
+            })
+        if account_no % 3 == 0:
+            data['saas_users'].append({
+                'id': operator_id, 'username': f'op{operator_id}', 'password': '-', 'name': f'运营{operator_id}',
+                'role': 'operation_specialist', 'manager_id': manager_id, 'updated_at': updated_at,
+            })
+        regions = {
+            str(shop_id): {'regions': {
+                'city': {'regionName': cities[shop_id % len(cities)]},
+                'district': {'regionName': f'区{shop_id % 7}'},
+                'business': {'regionName': f'商圈{shop_id % 13}'},
+            }}
+            for shop_id in account_shops
+        }
+        data['platform_accounts'].append({
+            'account': f'bench{account_no:04d}a', 'operator_id': operator_id,
+            'stores_json': json.dumps([{'shop_id': shop_id} for shop_id in account_shops]),
+            'compareRegions_json': json.dumps(regions, ensure_ascii=False),
+            'sales_name': f'销售{account_no % 5}', 'city_name': cities[account_no % len(cities)],
+            'updated_at': updated_at,
+        })
+        for table in ('kewen_daily_report', 'promotion_daily_report', 'store_stats'):
+            for shop_id in account_shops:
+                data['data_upload_log'].append({
+                    'account_id': f'bench{account_no:04d}a', 'shop_id': str(shop_id), 'table_name': table,
+                    'data_date_start': start_date, 'data_date_end': end_date, 'upload_status': 2,
+                    'record_count': days,
+                })
+
+    for day_no in range(days):
+        day = start_date + timedelta(days=day_no)
+        for shop_id in shop_ids:
+            scale = 1 + shop_id % 10
+            exposure = rnd.randint(100, 1000) * scale
+            visits = exposure // rnd.randint(5, 15)
+            orders = visits // rnd.randint(5, 20)
+            verify = max(0, orders - rnd.randint(0, 3))
+            data['kewen_daily_report'].append({
+                'report_date': day, 'city': cities[shop_id % len(cities)], 'shop_id': shop_id,
+                'shop_name': f'模拟门店{shop_id}', 'promotion_cost': round(rnd.uniform(0, 200) * scale, 2),
+                'exposure_users': exposure, 'visit_users': visits, 'order_users': orders,
+                'intent_rate': f'{rnd.uniform(0, 30):.2f}%', 'new_collect_users': rnd.randint(0, 10),
+                'promotion_exposure_count': rnd.randint(0, 5000), 'promotion_click_count': rnd.randint(0, 300),
+                'verify_sale_amount': round(verify * rnd.uniform(80, 300), 2),
+                'verify_after_discount': round(verify * rnd.uniform(60, 250), 2),
+                'verify_coupon_count': verify, 'verify_person_count': verify, 'order_coupon_count': orders,
+                'order_sale_amount': round(orders * rnd.uniform(80, 300), 2), 'consult_users': rnd.randint(0, 20),
+                'new_review_count': rnd.randint(0, 8), 'new_good_review_count': rnd.randint(0, 6),
+                'coupon_pay_order_count': rnd.randint(0, 5), 'updated_at': updated_at,
+            })
+            if shop_id % 5:
+                data['promotion_daily_report'].append({
+                    'report_date': day, 'shop_id': shop_id, 'click_avg_price': round(rnd.uniform(0.5, 3), 2),
+                    'order_count': rnd.randint(0, 20), 'view_address_count': rnd.randint(0, 30),
+                    'view_phone_count': rnd.randint(0, 30), 'view_groupbuy_count': rnd.randint(0, 50),
+                    'updated_at': updated_at,
+                })
+            if shop_id % 7:
+                data['store_stats'].append({
+                    'store_name': f'模拟门店{shop_id}', 'store_id': shop_id, 'checkin_count': rnd.randint(0, 10),
+                    'order_user_rank': rnd.randint(1, 200), 'verify_amount_rank': rnd.randint(1, 200),
+                    'ad_order_count': rnd.randint(0, 5), 'is_force_offline': int(rnd.random() < 0.05),
+                    'ad_balance': round(rnd.uniform(0, 5000), 2), 'date': day, 'updated_at': updated_at,
+                })
+
+    return data
+
+
+def insert_dataset(conn, data, placeholder):
+    cursor = conn.cursor()
+    for table, rows in data.items():
+        if not rows:
+            continue
+        columns = list(rows[0])
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+        for offset in range(0, len(rows), 1000):
+            cursor.executemany(sql, [tuple(row[col] for col in columns) for row in rows[offset:offset + 1000]])
+    conn.commit()
+    cursor.close()
+
+
+# ==================== SQLite 替身连接池 ====================
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(Decimal, float)
+
+# 报表 SQL 中用到的 MySQL 专有写法
+SQLITE_TRANSLATIONS = [
+    (re.compile(r"DATE_SUB\((\w+), INTERVAL WEEKDAY\(\1\) DAY\)"),
+     r"date(\1, '-' || ((CAST(strftime('%w', \1) AS INTEGER) + 6) % 7) || ' days')"),
+    (re.compile(r"DATE_SUB\((\w+), INTERVAL DAYOFMONTH\(\1\) - 1 DAY\)"), r"date(\1, 'start of month')"),
+    (re.compile(r"TIMESTAMPDIFF\(SECOND, (\w+), (\w+)\)"),
+     r"CAST(ROUND((julianday(\2) - julianday(\1)) * 86400) AS INTEGER)"),
+    (re.compile(r"\bFOR UPDATE\b"), ''),
+    (re.compile(r"\bNOW\(\)"), "datetime('now', 'localtime')"),
+    (re.compile(r"%s"), '?'),
+]
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+
+
+def _from_sqlite(value):
+    """与 mysql-connector 一致：日期列返回 date/datetime 对象"""
+    if isinstance(value, str):
+        if _DATE_RE.match(value):
+            return date.fromisoformat(value)
+        if _DATETIME_RE.match(value):
+            return datetime.fromisoformat(value)
+    return value
+
+
+class SQLiteCursor:
+    def __init__(self, conn, dictionary=False):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+        self.column_names = ()
+
+    def execute(self, sql, params=None):
+        for pattern, replacement in SQLITE_TRANSLATIONS:
+            sql = pattern.sub(replacement, sql)
+        try:
+            self._cursor.execute(sql, tuple(params or ()))
+        except sqlite3.OperationalError as e:
+            if 'no such table' in str(e):
+                raise mysql.connector.errors.ProgrammingError(msg=str(e), errno=errorcode.ER_NO_SUCH_TABLE)
+            raise
+        self.column_names = tuple(d[0] for d in self._cursor.description or ())
+
+    def _convert(self, row):
+        row = tuple(_from_sqlite(value) for value in row)
+        return dict(zip(self.column_names, row)) if self._dictionary else row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._convert(row)
+
+    def fetchmany(self, size=1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class _BitXor:
+    """MySQL BIT_XOR 聚合"""
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= int(value)
+
+    def finalize(self):
+        return self.value
+
+
+def _concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        # 映射版本查询（ShopMappingCache._load_version）用到的 MySQL 函数
+        self._conn.create_function('CRC32', 1, lambda value: None if value is None else
+                                   zlib.crc32(str(value).encode('utf-8')), deterministic=True)
+        self._conn.create_function('CONCAT_WS', -1, _concat_ws, deterministic=True)
+        self._conn.create_aggregate('BIT_XOR', 1, _BitXor)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn, dictionary)
+
+    def start_transaction(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLitePool:
+    """与 MySQLConnectionPool 接口一致的 SQLite 连接池替身（每次取连接都新建，基准只在单进程内串行使用）"""
+
+    def __init__(self, path, pool_size=20):
+        self.path = path
+        self.pool_name = 'jx_bench'
+        self.pool_size = pool_size
+
+    def get_connection(self):
+        return SQLiteConnection(self.path)
+
+
+# ==================== 计时与查询计数 ====================
+class PhaseTimer:
+    """
+    分阶段计时：只累计最外层阶段（映射加载内部的查询计入 mapping，不再计入 sql）
+    未被任何阶段覆盖的时间在汇总时计为 processing（数据行处理）
+    """
+
+    def __init__(self):
+        self.totals = {phase: 0.0 for phase in PHASES}
+        self._depth = 0
+        self.queries = 0
+        self.rows_fetched = 0
+
+    @contextmanager
+    def phase(self, name):
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.totals[name] += time.perf_counter() - start
+
+    def wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+
+class CountingCursor:
+    def __init__(self, cursor, timer):
+        self._cursor = cursor
+        self._timer = timer
+
+    def execute(self, sql, params=None):
+        self._timer.queries += 1
+        with self._timer.phase('sql'):
+            return self._cursor.execute(sql, params)
+
+    def fetchone(self):
+        with self._timer.phase('sql'):
+            row = self._cursor.fetchone()
+        self._timer.rows_fetched += row is not None
+        return row
+
+    def fetchmany(self, size=1):
+        with self._timer.phase('sql'):
+            rows = self._cursor.fetchmany(size)
+        self._timer.rows_fetched += len(rows)
+        return rows
+
+    def fetchall(self):
+        with self._timer.phase('sql'):
+            rows = self._cursor.fetchall()
+        self._timer.rows_fetched += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, conn, timer):
+        self._conn = conn
+        self._timer = timer
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._timer)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class CountingPool:
+    def __init__(self, pool, timer):
+        self._pool = pool
+        self._timer = timer
+
+    def get_connection(self):
+        return CountingConnection(self._pool.get_connection(), self._timer)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def _peak_rss_mb():
+    """本进程峰值常驻内存（Linux 下 ru_maxrss 单位为 KB，macOS 为字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# ==================== 子进程：生成单个报表 ====================
+def open_backend_pool(backend, report_generator):
+    if backend['type'] == 'sqlite':
+        return SQLitePool(backend['path'])
+    return report_generator.ReportConnectionPool(pool_name='jx_bench', pool_size=4, **backend['config'])
+
+
+def run_worker(spec_path):
+    with open(spec_path, encoding='utf-8') as f:
+        spec = json.load(f)
+
+    import report_generator
+    timer = PhaseTimer()
+    report_generator.set_connection_pool(CountingPool(open_backend_pool(spec['backend'], report_generator), timer))
+    from openpyxl.workbook.workbook import Workbook
+
+    report_generator.ShopMappingCache._ensure_fresh = timer.wrap('mapping', report_generator.ShopMappingCache._ensure_fresh)
+    for name in ('create_report_workbook', 'append_styled_rows', 'merge_report_cells', 'apply_border'):
+        setattr(report_generator, name, timer.wrap('styling', getattr(report_generator, name)))
+    Workbook.save = timer.wrap('save', Workbook.save)
+
+    baseline_rss_mb = _peak_rss_mb()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    if spec['task'] == 'sync_rollups':
+        report_generator.sync_rollup_tables()
+        result = {'status': 'success'}
+    else:
+        result = report_generator.run_report(spec['task'], spec['params'])
+    wall = time.perf_counter() - start
+
+    phases = dict(timer.totals)
+    phases['processing'] = max(0.0, wall - sum(phases.values()))
+    output = result.get('filename')
+    summary = {
+        'status': result['status'],
+        'message': result.get('message'),
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(time.process_time() - cpu_start, 4),
+        'phases': {phase: round(phases[phase], 4) for phase in PHASES},
+        'queries': timer.queries,
+        'rows_fetched': timer.rows_fetched,
+        'baseline_rss_mb': baseline_rss_mb,
+        'peak_rss_mb': _peak_rss_mb(),
+        'output_bytes': os.path.getsize(output) if output and os.path.exists(output) else None,
+    }
+    with open(spec['result_path'], 'w', encoding='utf-8') as f:
+        json.dump(summary, f)
+
+
+# ==================== 主进程 ====================
+def report_params(report_type, shops, days, end_date, output_dir, streaming, workers=None, export_format='xlsx'):
+    """按模拟数据的日期范围确定各报表参数"""
+    start_date = end_date - timedelta(days=days - 1)
+    fmt = lambda day: max(day, start_date).strftime('%Y-%m-%d')
+    output = os.path.join(output_dir, f'{report_type}.{export_format}')
+
+    if report_type == 'daily':
+        return {'report_date': fmt(end_date), 'output_filename': output, 'streaming': streaming,
+                'format': export_format}
+
+    # 周报/自定义：最近 7 天 vs 之前 7 天；月报：本月至今 vs 上个自然月
+    if report_type == 'monthly':
+        month2_start = end_date.replace(day=1)
+        month1_start = (month2_start - timedelta(days=1)).replace(day=1)
+        periods = [month1_start, month2_start - timedelta(days=1), month2_start, end_date]
+    else:
+        periods = [end_date - timedelta(days=13), end_date - timedelta(days=7), end_date - timedelta(days=6), end_date]
+
+    prefix = {'weekly': 'week', 'monthly': 'month', 'custom': 'period'}[report_type]
+    params = {f'{prefix}{n}_{edge}': fmt(periods[i]) for i, (n, edge) in
+              enumerate([(1, 'start'), (1, 'end'), (2, 'start'), (2, 'end')])}
+    params.update({'output_filename': output, 'streaming': streaming, 'format': export_format})
+    if workers is not None:
+        params['workers'] = workers
+    if report_type == 'custom':
+        params['shop_ids'] = [100000 + i for i in range(0, shops, 2)]
+    return params
+
+
+def run_in_subprocess(task, params, backend, work_dir, verbose):
+    spec_path = os.path.join(work_dir, f'{task}.spec.json')
+    result_path = os.path.join(work_dir, f'{task}.result.json')
+    if os.path.exists(result_path):
+        os.remove(result_path)
+    with open(spec_path, 'w', encoding='utf-8') as f:
+        json.dump({'task': task, 'params': params, 'backend': backend, 'result_path': result_path}, f)
+
+    output = None if verbose else subprocess.DEVNULL
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', spec_path],
+                          cwd=work_dir, stdout=output, stderr=None if verbose else subprocess.PIPE)
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        stderr = proc.stderr.decode('utf-8', 'replace')[-2000:] if proc.stderr else ''
+        return {'status': 'error', 'message': f'子进程退出码 {proc.returncode}\n{stderr}'}
+    with open(result_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def summarize_runs(runs):
+    """多次运行取中位数"""
+    ok = [run for run in runs if run['status'] == 'success']
+    if not ok:
+        return None
+    median = lambda key: round(statistics.median(run[key] for run in ok), 4)
+    return {
+        'wall_seconds': median('wall_seconds'),
+        'cpu_seconds': median('cpu_seconds'),
+        'peak_rss_mb': median('peak_rss_mb'),
+        'queries': ok[0]['queries'],
+        'rows_fetched': ok[0]['rows_fetched'],
+        'phases': {phase: round(statistics.median(run['phases'][phase] for run in ok), 4) for phase in PHASES},
+    }
+
+
+def git_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BASE_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def parse_mysql_url(url):
+    """user:password@host:port/database"""
+    parts = urlsplit('mysql://' + url)
+    database = parts.path.lstrip('/')
+    if not database:
+        raise ValueError('--mysql 需要指定数据库名，例如 root:密码@127.0.0.1:3306/jx_bench')
+    if database == PRODUCTION_DATABASE:
+        raise ValueError(f'基准会删表重建，不能使用正式库 {PRODUCTION_DATABASE}')
+    return {
+        'host': parts.hostname or '127.0.0.1', 'port': parts.port or 3306,
+        'user': unquote(parts.username or 'root'), 'password': unquote(parts.password or ''),
+        'database': database, 'charset': 'utf8mb4', 'use_unicode': True, 'autocommit': True,
+    }
+
+
+def prepare_backend(args, data, work_dir):
+    """建表并写入模拟数据，返回子进程使用的连接配置"""
+    if args.mysql:
+        config = parse_mysql_url(args.mysql)
+        server = {key: value for key, value in config.items() if key != 'database'}
+        conn = mysql.connector.connect(**server)
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{config['database']}` DEFAULT CHARACTER SET utf8mb4")
+        cursor.execute(f"USE `{config['database']}`")
+        create_mysql_schema(cursor, SCHEMA_FILE, skip_inserts=True)
+        if args.rollup:
+            create_mysql_schema(cursor, ROLLUP_SCHEMA_FILE, skip_inserts=False)
+        else:
+            for table in ('shop_daily_fact', 'shop_weekly_rollup', 'shop_monthly_rollup', 'rollup_sync_state'):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.close()
+        insert_dataset(conn, data, '%s')
+        conn.close()
+        return {'type': 'mysql', 'config': config}
+
+    path = os.path.join(work_dir, 'bench.sqlite3')
+    conn = sqlite3.connect(path)
+    create_sqlite_schema(conn, SCHEMA_FILE)
+    if args.rollup:
+        create_sqlite_schema(conn, ROLLUP_SCHEMA_FILE)
+        conn.execute("INSERT INTO rollup_sync_state (name, last_log_id, synced_at) VALUES ('shop_rollups', 0, NULL)")
+    insert_dataset(conn, data, '?')
+    conn.close()
+    return {'type': 'sqlite', 'path': path}
+
+
+def run_benchmark(args):
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date()
+    reports = args.reports.split(',') if args.reports else list(REPORT_TYPES)
+    for report_type in reports:
+        if report_type not in REPORT_TYPES:
+            raise ValueError(f'未知的报表类型: {report_type}')
+
+    work_dir = tempfile.mkdtemp(prefix='jx_bench_')
+    try:
+        print(f"📦 生成模拟数据: {args.shops} 家门店 × {args.days} 天")
+        start = time.perf_counter()
+        data = generate_dataset(args.shops, args.days, end_date, args.seed)
+        backend = prepare_backend(args, data, work_dir)
+        load_seconds = round(time.perf_counter() - start, 2)
+        print(f"✅ 基准库就绪（{backend['type']}，{sum(len(rows) for rows in data.values())} 行，{load_seconds}s）")
+
+        setup = {'load_seconds': load_seconds}
+        if args.rollup:
+            setup['rollup_build'] = run_in_subprocess('sync_rollups', {}, backend, work_dir, args.verbose)
+            print(f"✅ 预汇总表全量构建: {setup['rollup_build'].get('wall_seconds')}s")
+
+        results = {}
+        for report_type in reports:
+            params = report_params(report_type, args.shops, args.days, end_date, work_dir, args.streaming,
+                                   args.workers, args.format)
+            runs = []
+            for _ in range(args.repeat):
+                run = run_in_subprocess(report_type, params, backend, work_dir, args.verbose)
+                runs.append(run)
+                if run['status'] != 'success':
+                    print(f"❌ {report_type}: {run.get('message')}")
+                    break
+            summary = summarize_runs(runs)
+            results[report_type] = {'params': {k: v for k, v in params.items() if k != 'output_filename'},
+                                    'runs': runs, 'median': summary}
+            if summary:
+                print(f"📊 {report_type:8s} {summary['wall_seconds']:8.3f}s  峰值内存 {summary['peak_rss_mb']:7.1f}MB  "
+                      f"查询 {summary['queries']:5d} 次  " +
+                      '  '.join(f"{phase} {summary['phases'][phase]:.3f}s" for phase in PHASES))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    commit, dirty = git_info()
+    document = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': commit,
+            'git_dirty': dirty,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': backend['type'],
+            'shops': args.shops,
+            'days': args.days,
+            'end_date': args.end_date,
+            'seed': args.seed,
+            'rollup': args.rollup,
+            'streaming': args.streaming,
+            'workers': args.workers,
+            'format': args.format,
+            'repeat': args.repeat,
+        },
+        'setup': setup,
+        'reports': results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{commit or 'nogit'}{'-dirty' if dirty else ''}.json"
+        output = os.path.join(RESULT_DIR, name)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已保存: {output}")
+    return document
+
+
+def compare_results(old_path, new_path, threshold):
+    """对比两次基准结果，耗时/内存/查询次数增幅超过 threshold% 视为退化，返回退化项数"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+
+    for key in ('backend', 'shops', 'days', 'rollup', 'streaming', 'workers', 'format'):
+        if old['meta'].get(key) != new['meta'].get(key):
+            print(f"⚠️ 两次基准的 {key} 不同: {old['meta'].get(key)} vs {new['meta'].get(key)}")
+
+    print(f"{'报表':10s}{'指标':18s}{old['meta'].get('git_commit') or '旧':>12s}{new['meta'].get('git_commit') or '新':>12s}{'变化':>10s}")
+    regressions = 0
+    for report_type in REPORT_TYPES:
+        old_summary = (old['reports'].get(report_type) or {}).get('median')
+        new_summary = (new['reports'].get(report_type) or {}).get('median')
+        if not old_summary or not new_summary:
+            continue
+        for metric in ('wall_seconds', 'peak_rss_mb', 'queries', *(f'phases.{phase}' for phase in PHASES)):
+            before, after = old_summary, new_summary
+            for part in metric.split('.'):
+                before, after = before[part], after[part]
+            change = (after - before) / before * 100 if before else 0.0
+            flag = ''
+            if change > threshold and not metric.startswith('phases.'):
+                flag = ' ❌'
+                regressions += 1
+            print(f"{report_type:10s}{metric:20s}{before:12.3f}{after:12.3f}{change:+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='江鑫数据报表性能基准')
+    parser.add_argument('--shops', type=int, default=200, help='门店数')
+    parser.add_argument('--days', type=int, default=61, help='天数（截止到 --end-date）')
+    parser.add_argument('--end-date', default='2025-11-30', help='模拟数据最后一天 YYYY-MM-DD')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--reports', help='逗号分隔的报表类型，默认全部: daily,weekly,monthly,custom')
+    parser.add_argument('--repeat', type=int, default=1, help='每个报表运行次数（取中位数）')
+    parser.add_argument('--streaming', action='store_true', help='使用流式（只写）工作簿模式')
+    parser.add_argument('--workers', type=int, help='周报/月报/自定义报表门店详细Sheet 分片进程数（默认按环境变量配置）')
+    parser.add_argument('--format', default='xlsx', choices=('xlsx', 'csv', 'ndjson', 'parquet'),
+                        help='报表输出格式（非 xlsx 时每门店一行导出，不构建工作簿）')
+    parser.add_argument('--rollup', action='store_true', help='建立预汇总表（jx_rollup_tables.sql）')
+    parser.add_argument('--mysql', help='使用本地 MySQL/MariaDB: user:password@host:port/database')
+    parser.add_argument('--output', help='结果 JSON 路径，默认 benchmark_results/<时间>_<提交号>.json')
+    parser.add_argument('--verbose', action='store_true', help='显示报表生成过程的输出')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两次基准结果')
+    parser.add_argument('--threshold', type=float, default=10.0, help='--compare 时判定退化的增幅百分比')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+    elif args.compare:
+        sys.exit(1 if compare_results(args.compare[0], args.compare[1], args.threshold) else 0)
+    else:
+        run_benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+/*
+ 江鑫数据报表 - 评价分析汇总表（周报/自定义报表的“评价分析”Sheet 使用）
+
+ shop_review_daily  : 门店日评价汇总，review_detail_dianping / review_detail_meituan 按 平台+门店+评价日期 聚合
+ review_sync_state  : 各平台详情表的增量同步高水位（id + updated_at）
+
+ 数据由 report_generator.sync_review_stats() 维护：
+ 首次同步全量构建；之后只读取 id 或 updated_at 超过高水位的评价，重算涉及的门店和日期范围。
+ 聚合只读取 report_generator._review_aggregate_columns() 中的投影列，不读取 raw_data / content 等 JSON 与长文本列；
+ 差评明细Sheet 同样只投影标量列，展示的行再按主键读取评价内容、图片与回复（report_generator.load_review_lazy_fields）。
+ 美团评价按 review_detail_meituan.shop_id 原值归属门店。
+ 详情表以占位值表示“无”（未回复 shop_reply_time = 1997-12-08 00:00:00，无订单 order_id = 0、消费时间 1997-12-08），
+ 回复数与消费后评价数不计占位值；已有汇总数据按旧口径构建时，将 review_sync_state.synced_at 置空触发全量重建。
+
+ Target Server Type    : MySQL
+ Target Server Version : 80044
+ File Encoding         : 65001
+*/
+
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for shop_review_daily
+-- ----------------------------
+DROP TABLE IF EXISTS `shop_review_daily`;
+CREATE TABLE `shop_review_daily`  (
+  `platform` varchar(16) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '平台 dianping/meituan',
+  `shop_id` bigint NOT NULL COMMENT '门店ID',
+  `review_date` date NOT NULL COMMENT '评价日期（add_time 当天）',
+  `shop_name` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '门店名称',
+  `review_count` int NOT NULL DEFAULT 0 COMMENT '评价数',
+  `star5_count` int NOT NULL DEFAULT 0 COMMENT '5星评价数（star >= 45）',
+  `star4_count` int NOT NULL DEFAULT 0 COMMENT '4星评价数（35 <= star < 45）',
+  `star3_count` int NOT NULL DEFAULT 0 COMMENT '3星评价数（25 <= star < 35）',
+  `star2_count` int NOT NULL DEFAULT 0 COMMENT '2星评价数（15 <= star < 25）',
+  `star1_count` int NOT NULL DEFAULT 0 COMMENT '1星评价数（0 < star < 15）',
+  `reply_count` int NOT NULL DEFAULT 0 COMMENT '商家已回复评价数（shop_reply_time >= add_time，排除 1997-12-08 未回复占位值）',
+  `reply_seconds` bigint NOT NULL DEFAULT 0 COMMENT '回复时长合计（秒，shop_reply_time - add_time）',
+  `pic_review_count` int NOT NULL DEFAULT 0 COMMENT '带图评价数',
+  `pic_count` int NOT NULL DEFAULT 0 COMMENT '图片数',
+  `video_review_count` int NOT NULL DEFAULT 0 COMMENT '带视频评价数',
+  `video_count` int NOT NULL DEFAULT 0 COMMENT '视频数',
+  `after_consume_count` int NOT NULL DEFAULT 0 COMMENT '消费后评价数（order_id > 0 或消费时间不是 1997-12-08 占位值）',
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`platform`, `shop_id`, `review_date`) USING BTREE,
+  INDEX `idx_review_date`(`review_date` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci COMMENT = '门店日评价汇总表' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for review_sync_state
+-- ----------------------------
+DROP TABLE IF EXISTS `review_sync_state`;
+CREATE TABLE `review_sync_state`  (
+  `platform` varchar(16) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '平台 dianping/meituan',
+  `last_id` bigint UNSIGNED NOT NULL DEFAULT 0 COMMENT '已处理的详情表 id 高水位',
+  `last_updated_at` datetime NULL DEFAULT NULL COMMENT '已处理的详情表 updated_at 高水位',
+  `synced_at` datetime NULL DEFAULT NULL COMMENT '最近同步时间，为空表示尚未构建（下次同步时全量构建）',
+  PRIMARY KEY (`platform`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci COMMENT = '评价汇总表同步状态' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of review_sync_state
+-- ----------------------------
+INSERT INTO `review_sync_state` VALUES ('dianping', 0, NULL, NULL);
+INSERT INTO `review_sync_state` VALUES ('meituan', 0, NULL, NULL);
+
+-- ----------------------------
+-- 详情表 updated_at 索引：增量同步按 id / updated_at 高水位读取新增和修改的评价
+-- MySQL 的 ADD INDEX 不支持 IF NOT EXISTS，先查 information_schema，索引已存在时跳过（脚本可重复执行）
+-- ----------------------------
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = 'review_detail_dianping' AND INDEX_NAME = 'idx_updated_at') > 0, 'DO 0',
+              'ALTER TABLE `review_detail_dianping` ADD INDEX `idx_updated_at`(`updated_at` ASC) USING BTREE');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = 'review_detail_meituan' AND INDEX_NAME = 'idx_updated_at') > 0, 'DO 0',
+              'ALTER TABLE `review_detail_meituan` ADD INDEX `idx_updated_at`(`updated_at` ASC) USING BTREE');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- ----------------------------
+-- 差评明细查询索引：按 (shop_id, add_time) 范围扫描，star 条件在索引内过滤，只对命中的差评回表读取投影列
+-- 只包含查询筛选和排序用到的列（ORDER BY shop_id, add_time, id；InnoDB 二级索引自带主键 id），
+-- 避免宽索引拖慢详情表写入；同时删除旧版脚本建立的 9 列覆盖索引 idx_shop_add_time_cover。可重复执行
+-- ----------------------------
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = 'review_detail_dianping' AND INDEX_NAME = 'idx_shop_add_time_cover') > 0,
+              'ALTER TABLE `review_detail_dianping` DROP INDEX `idx_shop_add_time_cover`', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = 'review_detail_meituan' AND INDEX_NAME = 'idx_shop_add_time_cover') > 0,
+              'ALTER TABLE `review_detail_meituan` DROP INDEX `idx_shop_add_time_cover`', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = 'review_detail_dianping' AND INDEX_NAME = 'idx_shop_add_time_star') > 0, 'DO 0',
+              'ALTER TABLE `review_detail_dianping` ADD INDEX `idx_shop_add_time_star`(`shop_id` ASC, `add_time` ASC, `star` ASC) USING BTREE');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+                 AND TABLE_NAME = 'review_detail_meituan' AND INDEX_NAME = 'idx_shop_add_time_star') > 0, 'DO 0',
+              'ALTER TABLE `review_detail_meituan` ADD INDEX `idx_shop_add_time_star`(`shop_id` ASC, `add_time` ASC, `star` ASC) USING BTREE');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET FOREIGN_KEY_CHECKS = 1;
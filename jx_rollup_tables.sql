@@ -0,0 +1,150 @@
+/*
+ 江鑫数据报表 - 预汇总表（周报/月报/自定义报表使用）
+
+ shop_daily_fact     : 门店日事实表，kewen_daily_report + promotion_daily_report + store_stats 按门店/日期预先关联
+ shop_weekly_rollup  : 按 ISO 周（周一开始）汇总的门店数据
+ shop_monthly_rollup : 按自然月汇总的门店数据
+ rollup_sync_state   : 增量同步高水位（data_upload_log.id）
+
+ 数据由 report_generator.sync_rollup_tables() 维护：
+ 首次同步全量构建；之后根据 data_upload_log 中新增的上传记录，只重算涉及的门店和日期范围。
+ 汇总字段与 report_generator.PERIOD_SUM_FIELDS 一一对应。
+
+ Target Server Type    : MySQL
+ Target Server Version : 80044
+ File Encoding         : 65001
+*/
+
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for shop_daily_fact
+-- ----------------------------
+DROP TABLE IF EXISTS `shop_daily_fact`;
+CREATE TABLE `shop_daily_fact`  (
+  `shop_id` bigint NOT NULL COMMENT '点评门店ID',
+  `report_date` date NOT NULL COMMENT '报表日期',
+  `shop_name` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '门店名称',
+  `city` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '城市',
+  `verify_after_discount` decimal(12, 2) NULL DEFAULT NULL COMMENT '商家优惠后核销额(元)',
+  `exposure_users` int NULL DEFAULT NULL COMMENT '曝光人数',
+  `visit_users` int NULL DEFAULT NULL COMMENT '访问人数',
+  `order_users` int NULL DEFAULT NULL COMMENT '下单人数',
+  `order_coupon_count` int NULL DEFAULT NULL COMMENT '下单券数(张)',
+  `verify_users` int NULL DEFAULT NULL COMMENT '核销人次',
+  `verify_coupon_count` int NULL DEFAULT NULL COMMENT '核销券数(张)',
+  `order_sale_amount` decimal(12, 2) NULL DEFAULT NULL COMMENT '下单售价金额(元)',
+  `verify_sale_amount` decimal(12, 2) NULL DEFAULT NULL COMMENT '核销售价金额(元)',
+  `coupon_orders` int NULL DEFAULT NULL COMMENT '优惠码支付订单数(个)',
+  `phone_clicks` int NULL DEFAULT NULL COMMENT '电话点击（推广通查看电话）',
+  `promotion_cost` decimal(12, 2) NULL DEFAULT NULL COMMENT '推广通消耗(元)',
+  `promotion_exposure` int NULL DEFAULT NULL COMMENT '推广通曝光次数',
+  `promotion_clicks` int NULL DEFAULT NULL COMMENT '推广通点击次数',
+  `promotion_orders` int NULL DEFAULT NULL COMMENT '推广通订单量(个)',
+  `view_groupbuy` int NULL DEFAULT NULL COMMENT '查看团购(次)',
+  `view_phone` int NULL DEFAULT NULL COMMENT '查看电话(次)',
+  `consult_users` int NULL DEFAULT NULL COMMENT '在线咨询人数',
+  `address_clicks` int NULL DEFAULT NULL COMMENT '查看地址(次)',
+  `new_collect` int NULL DEFAULT NULL COMMENT '新增收藏人数',
+  `new_good_reviews` int NULL DEFAULT NULL COMMENT '新增好评数(条)',
+  `new_reviews` int NULL DEFAULT NULL COMMENT '新增评价数(条)',
+  `checkin_count` int NULL DEFAULT NULL COMMENT '打卡数',
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+  PRIMARY KEY (`shop_id`, `report_date`) USING BTREE,
+  INDEX `idx_report_date`(`report_date` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci COMMENT = '门店日事实表（预关联）' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for shop_weekly_rollup
+-- ----------------------------
+DROP TABLE IF EXISTS `shop_weekly_rollup`;
+CREATE TABLE `shop_weekly_rollup`  (
+  `shop_id` bigint NOT NULL COMMENT '点评门店ID',
+  `week_start` date NOT NULL COMMENT 'ISO 周开始日期（周一）',
+  `last_date` date NOT NULL COMMENT '本周内最后一天有数据的日期',
+  `day_count` int NOT NULL DEFAULT 0 COMMENT '有数据的天数',
+  `shop_name` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '门店名称（取 last_date 当天）',
+  `city` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '城市（取 last_date 当天）',
+  `verify_after_discount` decimal(16, 2) NULL DEFAULT NULL,
+  `exposure_users` bigint NULL DEFAULT NULL,
+  `visit_users` bigint NULL DEFAULT NULL,
+  `order_users` bigint NULL DEFAULT NULL,
+  `order_coupon_count` bigint NULL DEFAULT NULL,
+  `verify_users` bigint NULL DEFAULT NULL,
+  `verify_coupon_count` bigint NULL DEFAULT NULL,
+  `order_sale_amount` decimal(16, 2) NULL DEFAULT NULL,
+  `verify_sale_amount` decimal(16, 2) NULL DEFAULT NULL,
+  `coupon_orders` bigint NULL DEFAULT NULL,
+  `phone_clicks` bigint NULL DEFAULT NULL,
+  `promotion_cost` decimal(16, 2) NULL DEFAULT NULL,
+  `promotion_exposure` bigint NULL DEFAULT NULL,
+  `promotion_clicks` bigint NULL DEFAULT NULL,
+  `promotion_orders` bigint NULL DEFAULT NULL,
+  `view_groupbuy` bigint NULL DEFAULT NULL,
+  `view_phone` bigint NULL DEFAULT NULL,
+  `consult_users` bigint NULL DEFAULT NULL,
+  `address_clicks` bigint NULL DEFAULT NULL,
+  `new_collect` bigint NULL DEFAULT NULL,
+  `new_good_reviews` bigint NULL DEFAULT NULL,
+  `new_reviews` bigint NULL DEFAULT NULL,
+  `checkin_count` bigint NULL DEFAULT NULL,
+  PRIMARY KEY (`shop_id`, `week_start`) USING BTREE,
+  INDEX `idx_week_start`(`week_start` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci COMMENT = '门店周汇总表（ISO周）' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for shop_monthly_rollup
+-- ----------------------------
+DROP TABLE IF EXISTS `shop_monthly_rollup`;
+CREATE TABLE `shop_monthly_rollup`  (
+  `shop_id` bigint NOT NULL COMMENT '点评门店ID',
+  `month_start` date NOT NULL COMMENT '月份第一天',
+  `last_date` date NOT NULL COMMENT '本月内最后一天有数据的日期',
+  `day_count` int NOT NULL DEFAULT 0 COMMENT '有数据的天数',
+  `shop_name` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '门店名称（取 last_date 当天）',
+  `city` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NULL DEFAULT NULL COMMENT '城市（取 last_date 当天）',
+  `verify_after_discount` decimal(16, 2) NULL DEFAULT NULL,
+  `exposure_users` bigint NULL DEFAULT NULL,
+  `visit_users` bigint NULL DEFAULT NULL,
+  `order_users` bigint NULL DEFAULT NULL,
+  `order_coupon_count` bigint NULL DEFAULT NULL,
+  `verify_users` bigint NULL DEFAULT NULL,
+  `verify_coupon_count` bigint NULL DEFAULT NULL,
+  `order_sale_amount` decimal(16, 2) NULL DEFAULT NULL,
+  `verify_sale_amount` decimal(16, 2) NULL DEFAULT NULL,
+  `coupon_orders` bigint NULL DEFAULT NULL,
+  `phone_clicks` bigint NULL DEFAULT NULL,
+  `promotion_cost` decimal(16, 2) NULL DEFAULT NULL,
+  `promotion_exposure` bigint NULL DEFAULT NULL,
+  `promotion_clicks` bigint NULL DEFAULT NULL,
+  `promotion_orders` bigint NULL DEFAULT NULL,
+  `view_groupbuy` bigint NULL DEFAULT NULL,
+  `view_phone` bigint NULL DEFAULT NULL,
+  `consult_users` bigint NULL DEFAULT NULL,
+  `address_clicks` bigint NULL DEFAULT NULL,
+  `new_collect` bigint NULL DEFAULT NULL,
+  `new_good_reviews` bigint NULL DEFAULT NULL,
+  `new_reviews` bigint NULL DEFAULT NULL,
+  `checkin_count` bigint NULL DEFAULT NULL,
+  PRIMARY KEY (`shop_id`, `month_start`) USING BTREE,
+  INDEX `idx_month_start`(`month_start` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci COMMENT = '门店月汇总表' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Table structure for rollup_sync_state
+-- ----------------------------
+DROP TABLE IF EXISTS `rollup_sync_state`;
+CREATE TABLE `rollup_sync_state`  (
+  `name` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '同步任务名称',
+  `last_log_id` bigint UNSIGNED NOT NULL DEFAULT 0 COMMENT '已处理的 data_upload_log.id 高水位',
+  `synced_at` datetime NULL DEFAULT NULL COMMENT '最近同步时间，为空表示尚未构建（下次同步时全量构建）',
+  PRIMARY KEY (`name`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci COMMENT = '预汇总表同步状态' ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of rollup_sync_state
+-- ----------------------------
+INSERT INTO `rollup_sync_state` VALUES ('shop_rollups', 0, NULL);
+
+SET FOREIGN_KEY_CHECKS = 1;
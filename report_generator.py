@@ -7,18 +7,47 @@
 """
 
 import mysql.connector
-from mysql.connector import pooling
+from mysql.connector import errorcode
 import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from datetime import datetime, timedelta
+from decimal import Decimal
+from array import array
+import bisect
+import collections
+import csv
+import functools
+import itertools
 import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import traceback
+import uuid
 import warnings
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from urllib.parse import urlsplit, unquote
+from xml.etree import ElementTree
+
+try:
+    import numpy
+except ImportError:  # 可选依赖：未安装时对比指标按列逐元素计算
+    numpy = None
 
 warnings.filterwarnings('ignore')
 
 # ==================== 数据库连接池配置 ====================
+# 默认连接配置，可用环境变量覆盖（见 get_db_config）：
+#   JX_DB_URL=mysql://用户:密码@主机:端口/库名，或分别设置 JX_DB_HOST / JX_DB_PORT / JX_DB_USER / JX_DB_PASSWORD / JX_DB_NAME
 DB_CONFIG = {
     'host': '8.146.210.145',
     'port': 3306,
@@ -30,13 +59,600 @@ DB_CONFIG = {
     'autocommit': True
 }
 
-# 创建全局连接池（单例模式）
-CONNECTION_POOL = mysql.connector.pooling.MySQLConnectionPool(
-    pool_name="jx_pool",
-    pool_size=20,  # 连接池大小
-    pool_reset_session=True,
-    **DB_CONFIG
-)
+# 连接池大小，可通过环境变量 JX_DB_POOL_SIZE 调整
+DB_POOL_SIZE = int(os.environ.get('JX_DB_POOL_SIZE', 20))
+DB_POOL_TIMEOUT = float(os.environ.get('JX_DB_POOL_TIMEOUT', 30))  # 连接全部占用时最长排队等待秒数
+DB_POOL_PING_SECONDS = float(os.environ.get('JX_DB_POOL_PING_SECONDS', 60))  # 空闲超过此时间的连接取出前先 ping
+DB_POOL_WARMUP = int(os.environ.get('JX_DB_POOL_WARMUP', 0))  # 连接池创建后在后台预先建立的连接数
+
+
+def get_db_config():
+    """数据库连接配置：DB_CONFIG 默认值 + 环境变量覆盖"""
+    config = dict(DB_CONFIG)
+
+    url = os.environ.get('JX_DB_URL')
+    if url:
+        parts = urlsplit(url)
+        if parts.hostname:
+            config['host'] = parts.hostname
+        if parts.port:
+            config['port'] = parts.port
+        if parts.username:
+            config['user'] = unquote(parts.username)
+        if parts.password is not None:
+            config['password'] = unquote(parts.password)
+        if parts.path.strip('/'):
+            config['database'] = parts.path.strip('/')
+
+    for key, env_name in (('host', 'JX_DB_HOST'), ('port', 'JX_DB_PORT'), ('user', 'JX_DB_USER'),
+                          ('password', 'JX_DB_PASSWORD'), ('database', 'JX_DB_NAME')):
+        value = os.environ.get(env_name)
+        if value is not None:
+            config[key] = int(value) if key == 'port' else value
+
+    return config
+
+
+class PoolExhausted(mysql.connector.errors.PoolError):
+    """排队等待超时仍取不到数据库连接（api_server 返回 503）"""
+
+
+class PooledConnection:
+    """从 ReportConnectionPool 取出的连接：close() 归还连接池，其余方法转发给底层连接"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError(msg='连接已归还连接池')
+        return getattr(self._conn, name)
+
+
+class ReportConnectionPool:
+    """
+    报表数据库连接池（接口与 MySQLConnectionPool 相同：get_connection() 取连接，连接 close() 归还）
+    - 连接按需创建，最多 pool_size 个
+    - 连接全部占用时按先来先得排队等待，超过 timeout 秒抛出 PoolExhausted（而不是立即报错）
+    - 空闲超过 ping_seconds 的连接取出前先 ping，已断开的连接丢弃并重新建立
+    - 归还时回滚未提交的事务并重置会话，重置失败的连接直接丢弃
+    - stats() 返回连接占用情况与排队等待统计
+    """
+
+    def __init__(self, pool_name, pool_size, timeout=DB_POOL_TIMEOUT, ping_seconds=DB_POOL_PING_SECONDS,
+                 pool_reset_session=True, **db_config):
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ping_seconds = ping_seconds
+        self.pool_reset_session = pool_reset_session
+        self._db_config = db_config
+        self._lock = threading.Lock()
+        self._idle = collections.deque()  # (连接, 归还时间)，后进先出
+        self._waiters = collections.deque()  # 排队中的取连接请求，先进先出
+        self._open = 0  # 已建立（或正在建立）的连接数
+        self._in_use = 0
+        self._counters = {'checkouts': 0, 'waits': 0, 'timeouts': 0, 'reconnects': 0, 'discarded': 0,
+                          'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+
+    def get_connection(self):
+        """取连接；连接全部占用时排队等待，超时抛出 PoolExhausted"""
+        waiter = None
+        with self._lock:
+            self._counters['checkouts'] += 1
+            if self._idle and not self._waiters:
+                conn, idle_since = self._idle.pop()
+                self._in_use += 1
+            elif self._open < self.pool_size:
+                conn, idle_since = None, None  # 占一个名额，锁外建立新连接
+                self._open += 1
+                self._in_use += 1
+            else:
+                waiter = {'event': threading.Event(), 'granted': False, 'conn': None, 'idle_since': None}
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            start = time.perf_counter()
+            waiter['event'].wait(self.timeout)
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._counters['waits'] += 1
+                self._counters['wait_seconds_total'] += waited
+                self._counters['wait_seconds_max'] = max(self._counters['wait_seconds_max'], waited)
+                if not waiter['granted']:
+                    self._waiters.remove(waiter)
+                    self._counters['timeouts'] += 1
+                    raise PoolExhausted(msg=f'数据库连接池已满（{self.pool_size} 个连接），'
+                                            f'等待 {self.timeout:g} 秒仍未取到连接')
+            # 归还连接的线程已把连接（或新建连接的名额）直接交给本请求
+            conn, idle_since = waiter['conn'], waiter['idle_since']
+
+        try:
+            conn = self._ensure_alive(conn, idle_since)
+        except Exception:
+            self._hand_off(None)
+            raise
+        return PooledConnection(self, conn)
+
+    def _ensure_alive(self, conn, idle_since):
+        if conn is None:
+            return mysql.connector.connect(**self._db_config)
+        if time.monotonic() - idle_since >= self.ping_seconds:
+            try:
+                conn.ping(reconnect=False)
+            except mysql.connector.Error:
+                self._close_quietly(conn)
+                with self._lock:
+                    self._counters['reconnects'] += 1
+                return mysql.connector.connect(**self._db_config)
+        return conn
+
+    def _release(self, conn):
+        """归还连接：回滚未提交事务、重置会话；失败则丢弃该连接"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self.pool_reset_session:
+                conn.reset_session()
+        except mysql.connector.Error:
+            self._close_quietly(conn)
+            with self._lock:
+                self._counters['discarded'] += 1
+            conn = None
+        self._hand_off(conn)
+
+    def _hand_off(self, conn):
+        """把连接（conn 为 None 时是新建连接的名额）交给排在最前面的等待者，没有等待者则放回空闲队列"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter['granted'] = True
+                waiter['conn'] = conn
+                waiter['idle_since'] = time.monotonic()
+                waiter['event'].set()
+                return
+            self._in_use -= 1
+            if conn is None:
+                self._open -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """连接池占用情况与排队等待统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            stats = {
+                'pool_name': self.pool_name,
+                'pool_size': self.pool_size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': len(self._waiters),
+            }
+        stats.update(counters)
+        stats['wait_seconds_total'] = round(counters['wait_seconds_total'], 6)
+        stats['wait_seconds_max'] = round(counters['wait_seconds_max'], 6)
+        stats['wait_seconds_avg'] = round(counters['wait_seconds_total'] / counters['waits'], 6) if counters['waits'] else 0.0
+        return stats
+
+
+# 全局连接池（单例模式）：导入模块时不创建，首次取连接时才按当前配置创建，导入和服务启动不依赖网络
+_CONNECTION_POOL = None
+_CONNECTION_POOL_LOCK = threading.Lock()
+
+
+def create_connection_pool(pool_size=DB_POOL_SIZE):
+    """按当前配置创建报表连接池（不建立连接）"""
+    return ReportConnectionPool(
+        pool_name="jx_pool",
+        pool_size=pool_size,  # 连接池大小
+        pool_reset_session=True,
+        **get_db_config()
+    )
+
+
+def get_connection_pool():
+    """返回全局连接池，首次调用时创建（创建本身不建立连接，配置了 JX_DB_POOL_WARMUP 时后台预热）"""
+    global _CONNECTION_POOL
+    if _CONNECTION_POOL is None:
+        with _CONNECTION_POOL_LOCK:
+            if _CONNECTION_POOL is None:
+                _CONNECTION_POOL = create_connection_pool()
+                if DB_POOL_WARMUP > 0:
+                    warm_up_connection_pool(DB_POOL_WARMUP, _CONNECTION_POOL)
+    return _CONNECTION_POOL
+
+
+def set_connection_pool(pool):
+    """
+    替换全局连接池（测试、基准或嵌入其他程序时注入自己的连接池）
+    pool 只需提供 get_connection()，返回的连接 close() 时归还；传 None 则下次使用时按配置重新创建
+    返回: 原连接池（可能为 None）
+    """
+    global _CONNECTION_POOL
+    with _CONNECTION_POOL_LOCK:
+        previous, _CONNECTION_POOL = _CONNECTION_POOL, pool
+    return previous
+
+
+def init_worker_connection_pool(pool_size):
+    """进程池子进程的初始化函数（ProcessPoolExecutor initializer）：本进程使用 pool_size 大小的连接池"""
+    set_connection_pool(create_connection_pool(pool_size))
+
+
+def warm_up_connection_pool(count, pool=None):
+    """
+    在后台线程中预先建立 count 个连接并放回连接池，不阻塞调用方
+    预热失败（如数据库不可达）只打印警告，首次使用时仍会按需建立连接
+    返回: 预热线程
+    """
+    pool = pool or get_connection_pool()
+    count = min(count, getattr(pool, 'pool_size', count))
+
+    def run():
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(pool.get_connection())
+            print(f"✅ 数据库连接池预热完成（{len(conns)} 个连接）")
+        except Exception as e:
+            print(f"⚠️ 数据库连接池预热失败: {e}")
+        finally:
+            for conn in conns:
+                conn.close()
+
+    thread = threading.Thread(target=run, name='jx-pool-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def __getattr__(name):
+    """兼容旧代码中的 report_generator.CONNECTION_POOL（首次访问时创建连接池）"""
+    if name == 'CONNECTION_POOL':
+        return get_connection_pool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ==================== 性能埋点 ====================
+# 报表生成过程中的命名计时（span）：连接池取连接、每次 SQL 执行/读取、映射加载、门店循环、样式、合并、保存
+# 每个 span 结束时生成一条事件交给已注册的 sink；嵌套的 span 各自计时（父 span 的耗时包含子 span）
+METRICS_ENABLED = os.environ.get('JX_METRICS_ENABLED', '1') != '0'
+METRICS_LOG_PATH = os.environ.get('JX_METRICS_LOG')  # 设置后每条事件按 JSON 行追加到该文件（'-' 表示标准错误）
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)  # 直方图分桶上限（秒）
+_METRICS_BASE_FIELDS = ('ts', 'span', 'seconds', 'report', 'report_id')
+
+METRICS_SINKS = []
+_METRICS_CONTEXT = threading.local()  # 当前线程正在生成的报表 {'report': 类型, 'report_id': 编号}
+
+
+class JsonLogSink:
+    """每条事件写一行 JSON"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._stream = sys.stderr if path == '-' else open(path, 'a', encoding='utf-8', buffering=1)
+
+    def emit(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._stream.write(line + '\n')
+
+
+class HistogramSink:
+    """
+    进程内直方图：按 报表类型 + span 名称 汇总次数、总耗时、最大耗时、分桶计数，
+    以及事件中数值字段（如 rows 读取行数）的合计
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self.since = time.time()
+
+    def emit(self, event):
+        key = (event.get('report') or '-', event['span'])
+        seconds = event['seconds']
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                            'buckets': [0] * (len(self.buckets) + 1), 'fields': {}}
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+            for name, value in event.items():
+                if name not in _METRICS_BASE_FIELDS and isinstance(value, (int, float)):
+                    stats['fields'][name] = stats['fields'].get(name, 0) + value
+
+    def _quantile(self, buckets, count, q):
+        """分桶估算分位数（取所在分桶的上限，超过最大分桶时为 None）"""
+        rank = q * count
+        seen = 0
+        for bound, n in zip(self.buckets, buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        """
+        返回 {报表类型: {span: {count, total_seconds, avg_seconds, max_seconds, p50/p95/p99_seconds, buckets, ...}}}
+        不属于任何报表的事件（如结果缓存的版本查询）归入 '-'；buckets 为按上限排列的 [分桶, 次数] 列表
+        """
+        with self._lock:
+            items = [(key, dict(stats, buckets=list(stats['buckets']), fields=dict(stats['fields'])))
+                     for key, stats in self._stats.items()]
+
+        result = {}
+        for (report, span), stats in sorted(items):
+            count = stats['count']
+            labels = [f'<={bound}' for bound in self.buckets] + ['+Inf']
+            result.setdefault(report, {})[span] = {
+                'count': count,
+                'total_seconds': round(stats['total'], 6),
+                'avg_seconds': round(stats['total'] / count, 6),
+                'max_seconds': round(stats['max'], 6),
+                'p50_seconds': self._quantile(stats['buckets'], count, 0.5),
+                'p95_seconds': self._quantile(stats['buckets'], count, 0.95),
+                'p99_seconds': self._quantile(stats['buckets'], count, 0.99),
+                'buckets': [[label, n] for label, n in zip(labels, stats['buckets'])],
+                **{name: round(value, 6) for name, value in stats['fields'].items()},
+            }
+        return result
+
+
+def add_metrics_sink(sink):
+    """注册埋点输出（任何带 emit(event) 方法的对象）"""
+    METRICS_SINKS.append(sink)
+    return sink
+
+
+def remove_metrics_sink(sink):
+    if sink in METRICS_SINKS:
+        METRICS_SINKS.remove(sink)
+
+
+def record_span(name, seconds, **fields):
+    """记录一个已结束的 span（事件自动带上当前线程正在生成的报表类型与编号）"""
+    if not METRICS_SINKS:
+        return
+    event = {'ts': round(time.time(), 3), 'span': name, 'seconds': seconds}
+    context = getattr(_METRICS_CONTEXT, 'report', None)
+    if context:
+        event.update(context)
+    event.update(fields)
+    for sink in list(METRICS_SINKS):
+        try:
+            sink.emit(event)
+        except Exception as e:
+            print(f"⚠️ 埋点输出失败 ({type(sink).__name__}): {e}")
+
+
+@contextmanager
+def metrics_span(name, **fields):
+    """
+    计时上下文：with metrics_span('save'): ...
+    yield 出的 dict 可在块内补充字段，如 with metrics_span('sql.fetch') as span: span['rows'] = n
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record_span(name, time.perf_counter() - start, **fields)
+
+
+def instrumented_report(report_type):
+    """报表生成函数装饰器：整个生成过程记为 report span，期间的事件都带上报表类型与编号"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_METRICS_CONTEXT, 'report', None):
+                return func(*args, **kwargs)  # 月报内部调用周报，沿用外层报表
+            _METRICS_CONTEXT.report = {'report': report_type, 'report_id': uuid.uuid4().hex[:12]}
+            try:
+                with metrics_span('report'):
+                    return func(*args, **kwargs)
+            finally:
+                _METRICS_CONTEXT.report = None
+        return wrapper
+    return decorator
+
+
+def _statement_label(operation):
+    """SQL 语句摘要（压缩空白，截取前 120 个字符）"""
+    return ' '.join(operation.split())[:120]
+
+
+class InstrumentedCursor:
+    """记录每次 execute 的耗时，以及每次 fetch 的耗时和读取行数"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None):
+        with metrics_span('sql.execute', statement=_statement_label(operation)):
+            return self._cursor.execute(operation, params)
+
+    def fetchone(self):
+        with metrics_span('sql.fetch') as span:
+            row = self._cursor.fetchone()
+            span['rows'] = 0 if row is None else 1
+        return row
+
+    def fetchmany(self, size=1):
+        with metrics_span('sql.fetch') as span:
+            rows = self._cursor.fetchmany(size)
+            span['rows'] = len(rows)
+        return rows
+
+    def fetchall(self):
+        with metrics_span('sql.fetch') as span:
+            rows = self._cursor.fetchall()
+            span['rows'] = len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """连接池连接的包装，cursor() 返回带埋点的游标，其余方法原样转发"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def get_db_connection():
+    """从连接池取连接（记录取连接耗时 pool.checkout），返回的连接/游标带 SQL 埋点"""
+    with metrics_span('pool.checkout'):
+        conn = get_connection_pool().get_connection()
+    return InstrumentedConnection(conn)
+
+
+# 默认注册进程内直方图（api_server 的 /api/metrics 读取），可选 JSON 行日志
+METRICS_HISTOGRAM = HistogramSink()
+if METRICS_ENABLED:
+    add_metrics_sink(METRICS_HISTOGRAM)
+    if METRICS_LOG_PATH:
+        add_metrics_sink(JsonLogSink(METRICS_LOG_PATH))
+
+
+# ==================== 分块流式查询 ====================
+# 报表主查询不再 fetchall() 成字典列表：无缓冲游标按块从服务器读取元组行，行按预先算好的列下标取值，
+# 每读到一块就处理/写入，内存占用只与块大小有关，与门店数无关
+REPORT_FETCH_CHUNK_ROWS = int(os.environ.get('JX_REPORT_FETCH_CHUNK_ROWS', 1000))  # 每次 fetchmany 的行数
+
+
+class RowView:
+    """按列名读取元组行（列下标由查询预先计算，不为每行建 dict），接口与只读 dict 相同"""
+
+    __slots__ = ('columns', 'values')
+
+    def __init__(self, columns, values):
+        self.columns = columns
+        self.values = values
+
+    def __getitem__(self, name):
+        return self.values[self.columns[name]]
+
+    def get(self, name, default=None):
+        index = self.columns.get(name)
+        return default if index is None else self.values[index]
+
+    def keys(self):
+        return self.columns.keys()
+
+    def items(self):
+        return ((name, self.values[index]) for name, index in self.columns.items())
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+
+class QueryStream:
+    """
+    分块流式查询：无缓冲游标执行 SQL，按 fetchmany(chunk_size) 分块读取，逐行产出元组
+    - columns: {列名: 下标}，execute 后按结果列计算一次
+    - 读取期间同一连接不能执行其他查询
+    - 用作上下文管理器；提前退出时读完剩余结果再关闭游标，连接可以正常归还连接池
+    """
+
+    def __init__(self, conn, sql, params=None, chunk_size=None):
+        self.chunk_size = chunk_size or REPORT_FETCH_CHUNK_ROWS
+        self._exhausted = False
+        self._cursor = conn.cursor(buffered=False)
+        try:
+            self._cursor.execute(sql, params)
+        except Exception:
+            self._cursor.close()
+            raise
+        self.columns = {name: index for index, name in enumerate(self._cursor.column_names)}
+
+    def __iter__(self):
+        while not self._exhausted:
+            rows = self._cursor.fetchmany(self.chunk_size)
+            if not rows:
+                self._exhausted = True
+                break
+            yield from rows
+
+    def views(self, columns=None):
+        """逐行产出 RowView（columns 为空时按结果列名取值）"""
+        columns = columns or self.columns
+        for values in self:
+            yield RowView(columns, values)
+
+    def close(self):
+        try:
+            if not self._exhausted:
+                while self._cursor.fetchmany(self.chunk_size):
+                    pass
+                self._exhausted = True
+        except mysql.connector.Error:
+            pass  # 连接已断开：归还时重置会话失败，连接池会丢弃该连接
+        finally:
+            self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def peek_nonempty(iterator):
+    """
+    读取迭代器的第一项判断是否为空：为空返回 None，否则返回从第一项开始的完整迭代器
+    （调用方不另外持有第一项，第一块数据处理完即可释放）
+    """
+    for first in iterator:
+        return _prepend(first, iterator)
+    return None
+
+
+def _prepend(first, iterator):
+    yield first
+    del first  # itertools.chain 会一直持有参数，这里产出后即释放第一项
+    yield from iterator
+
+
+def count_rows(conn, sql, params=None):
+    """执行 SELECT COUNT(*) 类查询，返回第一列的整数值（用于进度回调的总数）"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        return int(row[0] or 0) if row else 0
+    finally:
+        cursor.close()
 
 
 # ==================== 调试辅助函数 ====================
@@ -60,103 +676,216 @@ def debug_print_row(shop_id, shop_name, data_dict, prefix=""):
     print(f"{'=' * 60}\n")
 
 
-def safe_get_val(data, key, default=0, shop_id=None, shop_name=None, debug=False):
-    """
-    安全获取值，处理None的情况
-    如果debug=True，会打印警告信息
-    """
-    if not data:
-        if debug:
-            print(f"⚠️ 警告: 门店 {shop_name}({shop_id}) 整行数据为空，字段 {key} 使用默认值 {default}")
-        return default
+# ==================== 门店/商圈映射缓存 ====================
+# 映射缓存有效期（秒）：有效期内不访问数据库；过期后先查版本号，只有映射读取的列变化时才重新加载
+MAPPING_CACHE_TTL = 300
 
-    value = data.get(key)
-    if value is None:
-        if debug:
-            print(f"⚠️ 警告: 门店 {shop_name}({shop_id}) 字段 {key} 为NULL，使用默认值 {default}")
-        return default
 
+def _parse_json_field(value):
+    """解析 JSON 字段（可能是字符串或已经是对象），解析失败返回 None"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return None
     return value
 
 
-# ==================== 辅助函数 ====================
-def get_shop_info_mapping(accounts=None):
+class ShopMappingCache:
     """
-    获取门店信息映射
-    参数:
-        accounts: list, 可选，账号列表（platform_accounts.account的值），如果提供则只查询这些账号
-    返回: dict {shop_id: {'operator': '', 'sales': '', 'city': ''}}
+    进程级门店/商圈映射缓存
+    - 一次性读取全部 platform_accounts 并解析 stores_json / compareRegions_json，按账号保存为主映射
+      （账号→门店ID、门店→运营/销售/城市、门店→商圈）
+    - 按 accounts 子集的映射视图只从这些账号的主映射派生（与账号总数无关），并按子集缓存
+    - TTL 过期后只查询映射所读列的校验和与行数（_load_version），有变化才重新加载
     """
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
 
-    try:
-        # 1. 查询 platform_accounts 和 saas_users
-        sql = """
+    def __init__(self, ttl=MAPPING_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._accounts = None  # {account: {'shops': {shop_id: {...}}, 'regions': {shop_id: {...}}}}
+        self._account_order = {}  # {account: 加载顺序}，多个账号含同一门店时后加载的覆盖先加载的
+        self._version = None
+        self._checked_at = 0.0
+        self._views = {}
+
+    def invalidate(self):
+        """清空缓存，下次访问时重新加载"""
+        with self._lock:
+            self._accounts = None
+            self._account_order = {}
+            self._version = None
+            self._checked_at = 0.0
+            self._views = {}
+
+    def get_shop_mapping(self, accounts=None):
+        """返回 dict {shop_id: {'operator', 'operator_id', 'manager', 'manager_id', 'sales', 'city'}}（共享只读对象）"""
+        return self._get_view('shops', accounts)
+
+    def get_region_mapping(self, accounts=None):
+        """返回 dict {shop_id: {'city': '', 'district': '', 'business': ''}}（共享只读对象）"""
+        return self._get_view('regions', accounts)
+
+    def get_shop_ids(self, accounts):
+        """返回账号下的门店ID元组（str，去重，按账号加载顺序；共享只读对象）"""
+        return self._get_view('shop_ids', accounts)
+
+    def _get_view(self, kind, accounts):
+        with self._lock:
+            self._ensure_fresh()
+
+            key = (kind, tuple(sorted(set(accounts))) if accounts else None)
+            view = self._views.get(key)
+            if view is None:
+                if accounts:
+                    # 只访问指定的账号，按加载顺序合并（与全量视图的覆盖规则一致）
+                    selected = sorted((account for account in set(accounts) if account in self._accounts),
+                                      key=self._account_order.__getitem__)
+                else:
+                    selected = self._accounts
+                if kind == 'shop_ids':
+                    view = tuple(dict.fromkeys(
+                        shop_id for account in selected for shop_id in self._accounts[account]['shops']))
+                else:
+                    view = {}
+                    for account in selected:
+                        view.update(self._accounts[account][kind])
+                self._views[key] = view
+            return view
+
+    def _ensure_fresh(self):
+        """在持有锁的情况下调用：必要时检查版本并重新加载主映射"""
+        now = time.monotonic()
+        if self._accounts is not None and now - self._checked_at < self.ttl:
+            return
+
+        with metrics_span('mapping.load') as span:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+
+            try:
+                version = self._load_version(cursor)
+                span['reloaded'] = int(self._accounts is None or version != self._version)
+                if span['reloaded']:
+                    self._accounts = self._load_accounts(cursor)
+                    self._account_order = {account: index for index, account in enumerate(self._accounts)}
+                    self._version = version
+                    self._views = {}
+                self._checked_at = now
+
+            finally:
+                cursor.close()
+                conn.close()
+
+    @staticmethod
+    def _load_version(cursor):
+        """
+        映射读取的列的校验和 + 行数（增删改都能感知）
+        不用 updated_at：登录（saas_users.last_login_at）、Cookie/签名刷新也会更新它，会导致映射和报表缓存频繁失效
+        """
+        cursor.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM platform_accounts) as account_count,
+            (SELECT BIT_XOR(CRC32(CONCAT_WS('|', account, IFNULL(operator_id, ''), IFNULL(sales_name, ''),
+                                            IFNULL(city_name, ''), IFNULL(stores_json, ''),
+                                            IFNULL(compareRegions_json, ''))))
+             FROM platform_accounts) as accounts_checksum,
+            (SELECT COUNT(*) FROM saas_users) as user_count,
+            (SELECT BIT_XOR(CRC32(CONCAT_WS('|', id, name, IFNULL(manager_id, ''))))
+             FROM saas_users) as users_checksum
+        """)
+        row = cursor.fetchone()
+        return (row['account_count'], row['accounts_checksum'], row['user_count'], row['users_checksum'])
+
+    @staticmethod
+    def _load_accounts(cursor):
+        """读取并解析全部账号的门店与商圈数据"""
+        # 运营：platform_accounts.operator_id 即运营的 saas_users.id；主管：运营的 saas_users.manager_id（上级领导）
+        cursor.execute("SELECT id, name, manager_id FROM saas_users")
+        users = {row['id']: row for row in cursor.fetchall()}
+
+        # 只查询需要的列，不读取同一行中的 cookie / mtgsig 等大字段
+        cursor.execute("""
         SELECT
             pa.account,
             pa.stores_json,
+            pa.compareRegions_json,
             pa.sales_name,
             pa.city_name,
-            pa.operator_id,
-            su.name as operator_name
+            pa.operator_id
         FROM platform_accounts pa
-        LEFT JOIN saas_users su ON pa.operator_id = su.manager_id
-        WHERE pa.stores_json IS NOT NULL
-        """
-
-        # 如果指定了accounts列表，添加过滤条件
-        params = []
-        if accounts:
-            placeholders = ','.join(['%s'] * len(accounts))
-            sql += f" AND pa.account IN ({placeholders})"
-            params = accounts
-
-        cursor.execute(sql, params)
-        account_results = cursor.fetchall()
-
-        # 2. 解析 stores_json 构建映射
-        shop_mapping = {}
+        WHERE pa.stores_json IS NOT NULL OR pa.compareRegions_json IS NOT NULL
+        """)
+
+        accounts = {}
+        for account in cursor.fetchall():
+            data = accounts.setdefault(account['account'], {'shops': {}, 'regions': {}})
+
+            # 解析 stores_json 构建门店映射
+            stores = _parse_json_field(account.get('stores_json'))
+            if isinstance(stores, list):
+                operator = users.get(account.get('operator_id'))
+                manager = users.get(operator['manager_id']) if operator else None
+                for store in stores:
+                    if isinstance(store, dict):
+                        shop_id = str(store.get('shop_id', ''))
+                        if shop_id:
+                            data['shops'][shop_id] = {
+                                'operator': operator['name'] if operator else '',
+                                'operator_id': operator['id'] if operator else None,
+                                'manager': manager['name'] if manager else '',
+                                'manager_id': manager['id'] if manager else None,
+                                'sales': account.get('sales_name') or '',
+                                'city': account.get('city_name') or ''
+                            }
+
+            # compareRegions_json 格式: {shop_id: {regions: {city: {}, district: {}, business: {}}}}
+            regions = _parse_json_field(account.get('compareRegions_json'))
+            if isinstance(regions, dict):
+                for shop_id, shop_data in regions.items():
+                    if isinstance(shop_data, dict):
+                        regions_data = shop_data.get('regions', {})
+                        if isinstance(regions_data, dict):
+                            city_info = regions_data.get('city', {})
+                            district_info = regions_data.get('district', {})
+                            business_info = regions_data.get('business', {})
+
+                            data['regions'][str(shop_id)] = {
+                                'city': city_info.get('regionName', '') if isinstance(city_info, dict) else '',
+                                'district': district_info.get('regionName', '') if isinstance(district_info,
+                                                                                              dict) else '',
+                                'business': business_info.get('regionName', '') if isinstance(business_info,
+                                                                                              dict) else ''
+                            }
+
+        return accounts
+
+
+# 全局映射缓存（单例）
+MAPPING_CACHE = ShopMappingCache()
+
+
+def invalidate_mapping_cache():
+    """使门店/商圈映射缓存失效（账号或门店配置变更后调用）"""
+    MAPPING_CACHE.invalidate()
 
-        for account in account_results:
-            stores_json = account.get('stores_json')
-            sales_name = account.get('sales_name', '')
-            city_name = account.get('city_name', '')
-            operator_name = account.get('operator_name', '')
 
-            if stores_json:
-                try:
-                    # 解析 JSON（可能是字符串或已经是对象）
-                    if isinstance(stores_json, str):
-                        stores = json.loads(stores_json)
-                    else:
-                        stores = stores_json
-
-                    # 遍历门店列表
-                    if isinstance(stores, list):
-                        for store in stores:
-                            if isinstance(store, dict):
-                                shop_id = str(store.get('shop_id', ''))
-                                if shop_id:
-                                    shop_mapping[shop_id] = {
-                                        'operator': operator_name or '',
-                                        'sales': sales_name or '',
-                                        'city': city_name or ''
-                                    }
-                except (json.JSONDecodeError, TypeError):
-                    # 忽略解析错误
-                    pass
-
-        return shop_mapping
-
-    finally:
-        cursor.close()
-        conn.close()
+# ==================== 辅助函数 ====================
+def get_shop_info_mapping(accounts=None):
+    """
+    获取门店信息映射（由进程级映射缓存提供）
+    参数:
+        accounts: list, 可选，账号列表（platform_accounts.account的值），如果提供则只查询这些账号
+    返回: dict {shop_id: {'operator': '', 'operator_id': None, 'manager': '', 'manager_id': None,
+                          'sales': '', 'city': ''}}
+          operator_id / manager_id 为运营与其上级主管的 saas_users.id，未配置时为 None
+    """
+    return MAPPING_CACHE.get_shop_mapping(accounts)
 
 
 def get_region_info_mapping(accounts=None):
     """
-    获取商圈信息映射
+    获取商圈信息映射（由进程级映射缓存提供）
     参数:
         accounts: list, 可选，账号列表（platform_accounts.account的值），如果提供则只查询这些账号
     返回: dict {shop_id: {'city': '', 'district': '', 'business': ''}}
@@ -176,201 +905,2526 @@ def get_region_info_mapping(accounts=None):
         }
     }
     """
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
+    return MAPPING_CACHE.get_region_mapping(accounts)
+
+
+def get_account_shop_ids(accounts):
+    """
+    获取账号下的门店ID（由进程级映射缓存的账号索引提供，不再查询 platform_accounts）
+    参数:
+        accounts: list, 账号列表（platform_accounts.account的值）
+    返回: tuple (shop_id str, ...)
+    """
+    return MAPPING_CACHE.get_shop_ids(accounts)
+
+
+def resolve_shop_filter(shop_ids=None, accounts=None):
+    """
+    报表的门店筛选条件：accounts 按账号索引解析为门店ID，与 shop_ids 同时提供时取交集
+    返回: None（不筛选）或门店ID序列（为空表示没有匹配的门店）
+    """
+    if not accounts:
+        return shop_ids or None
+    account_shop_ids = get_account_shop_ids(accounts)
+    if not shop_ids:
+        return account_shop_ids
+    wanted = {str(shop_id) for shop_id in shop_ids}
+    return tuple(shop_id for shop_id in account_shop_ids if shop_id in wanted)
+
+
+def _date_text(value):
+    """数据库返回的日期（date / datetime / 字符串）转为 'YYYY-MM-DD'"""
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else str(value)[:10]
+
+
+# ==================== 滚动窗口指标（近N天）====================
+# 日报的“近N天”类指标由一次范围查询喂入 RollingMetrics 计算，不再按门店/按天单独查询。
+# 新增近N天指标只需在 DAILY_TRAILING_KPIS 中登记（字段不够时在 DAILY_ROLLING_FIELDS 中增加）
+DAILY_ROLLING_FIELDS = {
+    # 字段名 -> (来源表, 列名)，按门店+日期求和（计数字段，NULL 按0）
+    'coupon_orders': ('kewen_daily_report', 'coupon_pay_order_count'),
+    'new_reviews': ('kewen_daily_report', 'new_review_count'),
+    'new_collect': ('kewen_daily_report', 'new_collect_users'),
+    'verify_users': ('kewen_daily_report', 'verify_person_count'),
+    'order_users': ('kewen_daily_report', 'order_users'),
+    'ad_orders': ('store_stats', 'ad_order_count'),
+}
+# 来源表 -> (日期列, 门店列)
+DAILY_ROLLING_TABLES = {
+    'kewen_daily_report': ('report_date', 'shop_id'),
+    'store_stats': ('date', 'store_id'),
+}
+DAILY_TRAILING_KPIS = {
+    # 指标名 -> (类型, 字段, 天数)
+    # sum: 字段近N天合计；mean: 近N天日均；rate: 字段1合计 / 字段2合计 × 100（分母为0时为 None）
+    'coupon_orders_7days': ('sum', ('coupon_orders',), 7),
+}
+
+
+class RollingMetrics:
+    """
+    按门店的滚动窗口指标
+    - 每个门店一个长度为 window + 1 的环形缓冲区，按日序号取模保存截至该日的各字段累计值
+    - 近N天（N <= window）合计 = 当天累计 - N天前累计，查询 O(1)；没有数据的日期沿用前一天的累计值（写入时惰性补齐）
+    - 同一门店须按日期顺序喂入；查询日期不早于该门店最后喂入的日期减 window
+    """
+
+    def __init__(self, fields, window):
+        self.fields = tuple(fields)
+        self.window = window
+        self._index = {field: index for index, field in enumerate(self.fields)}
+        self._shops = {}  # shop_id -> [首日, 末日, 环形缓冲区]，缓冲区元素为累计值元组
+
+    def add(self, shop_id, day, values):
+        """
+        累加门店某天的值
+        参数:
+            day: int, 日序号（date.toordinal()）
+            values: 与 fields 对齐的数值
+        """
+        size = self.window + 1
+        state = self._shops.get(shop_id)
+        if state is None:
+            state = self._shops[shop_id] = [day, day, [None] * size]
+            state[2][day % size] = (0,) * len(self.fields)
+        _, last, ring = state
+        if day < last:
+            raise ValueError(f"门店 {shop_id} 的数据须按日期顺序喂入")
+        if day > last:
+            totals = ring[last % size]
+            for fill_day in range(max(last + 1, day - size + 1), day):
+                ring[fill_day % size] = totals
+            state[1] = day
+        else:
+            totals = ring[day % size]
+        ring[day % size] = tuple(total + value for total, value in zip(totals, values))
+
+    def shops(self):
+        return self._shops.keys()
+
+    def _totals(self, state, day):
+        """门店截至 day 的累计值元组；首日之前为 None"""
+        first, last, ring = state
+        if day < first:
+            return None
+        if day >= last:
+            return ring[last % (self.window + 1)]
+        if day < last - self.window:
+            raise ValueError(f"日期超出滚动窗口（{self.window} 天）")
+        return ring[day % (self.window + 1)]
+
+    def sum(self, shop_id, field, days, day):
+        """近 days 天（截至 day，含当天）的合计"""
+        if days > self.window:
+            raise ValueError(f"天数 {days} 超出滚动窗口（{self.window} 天）")
+        state = self._shops.get(shop_id)
+        if state is None:
+            return 0
+        index = self._index[field]
+        end, start = self._totals(state, day), self._totals(state, day - days)
+        return (end[index] if end else 0) - (start[index] if start else 0)
+
+    def mean(self, shop_id, field, days, day):
+        """近 days 天的日均值"""
+        return self.sum(shop_id, field, days, day) / days
 
+    def rate(self, shop_id, numerator, denominator, days, day):
+        """近 days 天 numerator 合计 / denominator 合计 × 100，分母为0时为 None"""
+        total = self.sum(shop_id, denominator, days, day)
+        return self.sum(shop_id, numerator, days, day) / total * 100 if total > 0 else None
+
+    def evaluate(self, shop_id, kpi, day):
+        """按 DAILY_TRAILING_KPIS 中的定义 (类型, 字段, 天数) 计算指标"""
+        kind, fields, days = kpi
+        if kind == 'rate':
+            return self.rate(shop_id, fields[0], fields[1], days, day)
+        return getattr(self, kind)(shop_id, fields[0], days, day)
+
+
+def _rolling_fields_query(fields, start_date, end_date, shop_ids=None):
+    """
+    按门店+日期汇总 fields 的范围查询：每个来源表一段 GROUP BY，UNION ALL 后按日期排序
+    返回: (sql, params)，结果列为 report_date, shop_id, *fields
+    """
+    parts, params = [], []
+    for table, (date_col, shop_col) in DAILY_ROLLING_TABLES.items():
+        if not any(DAILY_ROLLING_FIELDS[field][0] == table for field in fields):
+            continue
+        value_cols = ', '.join(
+            f"COALESCE(SUM({DAILY_ROLLING_FIELDS[field][1]}), 0) as {field}"
+            if DAILY_ROLLING_FIELDS[field][0] == table else f"0 as {field}"
+            for field in fields
+        )
+        shop_sql, shop_params = _shop_filter_sql(shop_ids, shop_col)
+        parts.append(f"""
+    SELECT {date_col} as report_date, {shop_col} as shop_id, {value_cols}
+    FROM {table}
+    WHERE {date_col} BETWEEN %s AND %s{shop_sql}
+    GROUP BY {date_col}, {shop_col}""")
+        params.extend([start_date, end_date, *shop_params])
+    return '\n    UNION ALL'.join(parts) + '\n    ORDER BY report_date', params
+
+
+def daily_trailing_lookback_days(kpis=None):
+    """近N天指标需要向前多读的天数（最大天数 - 1），报表数据版本据此确定日报的读取范围"""
+    return max(DAILY_TRAILING_KPIS[name][2] for name in (kpis or DAILY_TRAILING_KPIS)) - 1
+
+
+def get_daily_trailing_kpis(start_date, end_date, shop_ids=None, kpis=None):
+    """
+    日期范围内每天的近N天指标（DAILY_TRAILING_KPIS）
+    一次范围查询 [start_date - (最大天数 - 1), end_date]，按日期顺序喂入 RollingMetrics，
+    每喂完一天（且在范围内）就计算当天各门店的指标
+    参数:
+        start_date, end_date: 日期范围 (str 'YYYY-MM-DD')
+        shop_ids: list, 可选，门店ID列表，如果提供则只查询这些门店
+        kpis: list, 可选，指标名（默认 DAILY_TRAILING_KPIS 全部）
+    返回: dict {report_date(str): {指标名: {shop_id(str): 值}}}，只包含有数据的日期
+    """
+    kpis = {name: DAILY_TRAILING_KPIS[name] for name in (kpis or DAILY_TRAILING_KPIS)}
+    fields = sorted({field for _, kpi_fields, _ in kpis.values() for field in kpi_fields})
+    lookback = daily_trailing_lookback_days(kpis)
+    window = lookback + 1
+
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    scan_start = (start - timedelta(days=lookback)).strftime('%Y-%m-%d')
+    sql, params = _rolling_fields_query(fields, scan_start, end_date, shop_ids)
+
+    rolling = RollingMetrics(fields, window)
+    results = {}
+    conn = get_db_connection()
     try:
-        sql = """
+        with QueryStream(conn, sql, params) as stream:
+            for report_date, rows in itertools.groupby(stream, key=lambda row: _date_text(row[0])):
+                day = datetime.strptime(report_date, '%Y-%m-%d').toordinal()
+                for _, shop_id, *values in rows:
+                    rolling.add(str(shop_id), day, [int(value or 0) for value in values])
+                if report_date >= start_date:
+                    results[report_date] = {
+                        name: {shop_id: rolling.evaluate(shop_id, kpi, day) for shop_id in rolling.shops()}
+                        for name, kpi in kpis.items()
+                    }
+    finally:
+        conn.close()
+    return results
+
+
+# 周报/月报/自定义报表按时期汇总的字段：(结果字段名, SQL 表达式)
+PERIOD_SUM_FIELDS = [
+    ('verify_after_discount', 'k.verify_after_discount'),
+    ('exposure_users', 'k.exposure_users'),
+    ('visit_users', 'k.visit_users'),
+    ('order_users', 'k.order_users'),
+    ('order_coupon_count', 'k.order_coupon_count'),
+    ('verify_users', 'k.verify_person_count'),
+    ('verify_coupon_count', 'k.verify_coupon_count'),
+    ('order_sale_amount', 'k.order_sale_amount'),
+    ('verify_sale_amount', 'k.verify_sale_amount'),
+    ('coupon_orders', 'k.coupon_pay_order_count'),
+    ('phone_clicks', 'p.view_phone_count'),
+    ('promotion_cost', 'k.promotion_cost'),
+    ('promotion_exposure', 'k.promotion_exposure_count'),
+    ('promotion_clicks', 'k.promotion_click_count'),
+    ('promotion_orders', 'p.order_count'),
+    ('view_groupbuy', 'p.view_groupbuy_count'),
+    ('view_phone', 'p.view_phone_count'),
+    ('consult_users', 'k.consult_users'),
+    ('address_clicks', 'p.view_address_count'),
+    ('new_collect', 'k.new_collect_users'),
+    ('new_good_reviews', 'k.new_good_review_count'),
+    ('new_reviews', 'k.new_review_count'),
+    ('checkin_count', 's.checkin_count'),
+]
+
+
+def _raw_period_query(period1_start, period1_end, period2_start, period2_end,
+                      group_fields=('shop_id', 'shop_name'), shop_ids=None):
+    """
+    原始日表条件聚合查询：扫描两个时期的并集范围，每行同时带出两个时期的合计（p1_/p2_ 前缀）
+    及时期内最后一天（p1_last_date/p2_last_date），按门店ID排序
+    时期重叠或不相邻时同样适用
+    返回: (sql, params)
+    """
+    group_cols = ', '.join(f"t.{field}" for field in group_fields)
+    inner_cols = ',\n            '.join(
+        ['k.report_date'] +
+        [f"k.{field}" for field in group_fields] +
+        [f"{expr} as {name}" for name, expr in PERIOD_SUM_FIELDS]
+    )
+    sum_cols = ',\n        '.join(
+        [f"MAX(CASE WHEN t.in_p{n} = 1 THEN t.report_date END) as p{n}_last_date" for n in (1, 2)] +
+        [f"SUM(CASE WHEN t.in_p{n} = 1 THEN t.{name} END) as p{n}_{name}"
+         for n in (1, 2) for name, _ in PERIOD_SUM_FIELDS]
+    )
+
+    sql = f"""
+    SELECT
+        {group_cols},
+        SUM(t.in_p1) as p1_days,
+        SUM(t.in_p2) as p2_days,
+        {sum_cols}
+    FROM (
         SELECT
-            pa.compareRegions_json
-        FROM platform_accounts pa
-        WHERE pa.compareRegions_json IS NOT NULL
-        """
+            CASE WHEN k.report_date BETWEEN %s AND %s THEN 1 ELSE 0 END as in_p1,
+            CASE WHEN k.report_date BETWEEN %s AND %s THEN 1 ELSE 0 END as in_p2,
+            {inner_cols}
+        FROM kewen_daily_report k
+        LEFT JOIN promotion_daily_report p
+            ON k.shop_id = p.shop_id AND k.report_date = p.report_date
+        LEFT JOIN store_stats s
+            ON k.shop_id = s.store_id AND k.report_date = s.date
+        WHERE (k.report_date BETWEEN %s AND %s OR k.report_date BETWEEN %s AND %s)
+    """
 
-        # 如果指定了accounts列表，添加过滤条件
-        params = []
-        if accounts:
-            placeholders = ','.join(['%s'] * len(accounts))
-            sql += f" AND pa.account IN ({placeholders})"
-            params = accounts
+    params = [period1_start, period1_end, period2_start, period2_end,
+              period1_start, period1_end, period2_start, period2_end]
+    if shop_ids:
+        placeholders = ','.join(['%s'] * len(shop_ids))
+        sql += f" AND k.shop_id IN ({placeholders})"
+        params.extend(shop_ids)
+
+    sql += f"""
+    ) t
+    GROUP BY {group_cols}
+    ORDER BY t.shop_id
+    """
+    return sql, params
 
-        cursor.execute(sql, params)
-        account_results = cursor.fetchall()
 
-        region_mapping = {}
+def _split_raw_period_rows(stream, group_fields):
+    """
+    原始日表查询行 -> 逐门店 (shop_id, 时期1行, 时期2行)
+    时期行是同一元组行上按 p1_/p2_ 列下标取值的 RowView，不复制数据；某时期没有数据时为 {}。
+    同一门店因时期内改名出现多行时，与预汇总路径（_merge_rollup_period_rows）一致：
+    汇总值相加，门店名称/城市取时期内最后一天的值
+    """
+    columns = stream.columns
+    sum_names = [name for name, _ in PERIOD_SUM_FIELDS]
+    period_columns = [
+        {**{field: columns[field] for field in group_fields},
+         **{name: columns[f'p{n}_{name}'] for name in sum_names}}
+        for n in (1, 2)
+    ]
+    days_index = (columns['p1_days'], columns['p2_days'])
+    last_date_index = (columns['p1_last_date'], columns['p2_last_date'])
+    shop_index = columns['shop_id']
+
+    def merge(shop_row, row, later):
+        """改名前后的两行合并为 dict（只在改名时复制）"""
+        shop_row = dict(shop_row.items())
+        for name in sum_names:
+            if row[name] is not None:
+                shop_row[name] = row[name] if shop_row[name] is None else shop_row[name] + row[name]
+        if later:
+            for field in group_fields:
+                if field != 'shop_id':
+                    shop_row[field] = row[field]
+        return shop_row
+
+    current_shop, current, last_dates = None, [{}, {}], [None, None]
+    for values in stream:
+        shop_id = values[shop_index]
+        if shop_id != current_shop:
+            if current_shop is not None:
+                yield current_shop, current[0], current[1]
+            current_shop, current, last_dates = shop_id, [{}, {}], [None, None]
+        for n in (0, 1):
+            if not values[days_index[n]]:
+                continue
+            row, last_date = RowView(period_columns[n], values), values[last_date_index[n]]
+            if current[n]:
+                later = last_date > last_dates[n]
+                current[n] = merge(current[n], row, later)
+                if later:
+                    last_dates[n] = last_date
+            else:
+                current[n], last_dates[n] = row, last_date
+    if current_shop is not None:
+        yield current_shop, current[0], current[1]
+
+
+# ==================== 预汇总表（周报/月报/自定义报表）====================
+# 表结构见 jx_rollup_tables.sql：门店日事实表 + ISO周汇总 + 月汇总，按 data_upload_log 增量维护。
+# 读取时把时期拆成 整月 + 整周 + 零散日期，扫描的行数不再随时期天数线性增长。
+# 未建表时自动退回原始日表汇总；可通过环境变量 JX_ROLLUP_ENABLED=0 关闭
+ROLLUP_ENABLED = os.environ.get('JX_ROLLUP_ENABLED', '1') != '0'
+ROLLUP_STATE_NAME = 'shop_rollups'
+ROLLUP_SOURCE_TABLES = ('kewen_daily_report', 'promotion_daily_report', 'store_stats')
+_ROLLUP_TABLES_MISSING = False  # 首次发现未建表后不再尝试
+
+# 各汇总粒度：(表名, 分桶日期列, 分桶表达式)
+ROLLUP_GRAINS = {
+    'week': ('shop_weekly_rollup', 'week_start', 'DATE_SUB(report_date, INTERVAL WEEKDAY(report_date) DAY)'),
+    'month': ('shop_monthly_rollup', 'month_start', 'DATE_SUB(report_date, INTERVAL DAYOFMONTH(report_date) - 1 DAY)'),
+}
 
-        for account in account_results:
-            regions_json = account.get('compareRegions_json')
 
-            if regions_json:
-                try:
-                    # 解析商圈数据
-                    if isinstance(regions_json, str):
-                        regions = json.loads(regions_json)
-                    else:
-                        regions = regions_json
-
-                    # compareRegions_json 格式: {shop_id: {regions: {city: {}, district: {}, business: {}}}}
-                    if isinstance(regions, dict):
-                        for shop_id, shop_data in regions.items():
-                            if isinstance(shop_data, dict):
-                                regions_data = shop_data.get('regions', {})
-                                if isinstance(regions_data, dict):
-                                    city_info = regions_data.get('city', {})
-                                    district_info = regions_data.get('district', {})
-                                    business_info = regions_data.get('business', {})
-
-                                    region_mapping[str(shop_id)] = {
-                                        'city': city_info.get('regionName', '') if isinstance(city_info, dict) else '',
-                                        'district': district_info.get('regionName', '') if isinstance(district_info,
-                                                                                                      dict) else '',
-                                        'business': business_info.get('regionName', '') if isinstance(business_info,
-                                                                                                      dict) else ''
-                                    }
-                except (json.JSONDecodeError, TypeError):
-                    pass
+def _week_start(day):
+    """ISO 周的周一"""
+    return day - timedelta(days=day.weekday())
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month_start(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _shop_filter_sql(shop_ids, column='shop_id'):
+    """门店筛选条件（shop_ids 为空时不筛选）"""
+    if not shop_ids:
+        return '', []
+    return f" AND {column} IN ({','.join(['%s'] * len(shop_ids))})", list(shop_ids)
+
+
+def _rebuild_rollups(cursor, start_date=None, end_date=None, shop_ids=None):
+    """
+    重算指定门店、日期范围内的日事实表及其所在周/月的汇总行（先删后插，源数据删除时也能同步）
+    start_date/end_date 为 None 时全量重建
+    """
+    sum_names = [name for name, _ in PERIOD_SUM_FIELDS]
+
+    # 1. 日事实表：三张源表按门店+日期预关联
+    date_sql, k_date_sql, date_params = '', '', []
+    if start_date:
+        date_sql = " AND report_date BETWEEN %s AND %s"
+        k_date_sql = " AND k.report_date BETWEEN %s AND %s"
+        date_params = [start_date, end_date]
+    shop_sql, shop_params = _shop_filter_sql(shop_ids)
+    k_shop_sql, _ = _shop_filter_sql(shop_ids, 'k.shop_id')
+
+    cursor.execute(f"DELETE FROM shop_daily_fact WHERE 1 = 1{date_sql}{shop_sql}", date_params + shop_params)
+    cursor.execute(f"""
+    INSERT INTO shop_daily_fact (shop_id, report_date, shop_name, city, {', '.join(sum_names)})
+    SELECT
+        k.shop_id, k.report_date, k.shop_name, k.city,
+        {', '.join(expr for _, expr in PERIOD_SUM_FIELDS)}
+    FROM kewen_daily_report k
+    LEFT JOIN promotion_daily_report p
+        ON k.shop_id = p.shop_id AND k.report_date = p.report_date
+    LEFT JOIN store_stats s
+        ON k.shop_id = s.store_id AND k.report_date = s.date
+    WHERE 1 = 1{k_date_sql}{k_shop_sql}
+    """, date_params + shop_params)
+
+    # 2. 周/月汇总：重算覆盖该日期范围的完整周/月
+    for grain, (table, bucket_col, bucket_expr) in ROLLUP_GRAINS.items():
+        bucket_sql, bucket_params = '', []
+        fact_date_sql, fact_date_params = '', []
+        if start_date:
+            if grain == 'week':
+                first, last = _week_start(start_date), _week_start(end_date)
+                last_day = last + timedelta(days=6)
+            else:
+                first, last = _month_start(start_date), _month_start(end_date)
+                last_day = _next_month_start(last) - timedelta(days=1)
+            bucket_sql, bucket_params = f" AND {bucket_col} BETWEEN %s AND %s", [first, last]
+            fact_date_sql, fact_date_params = " AND report_date BETWEEN %s AND %s", [first, last_day]
+
+        cursor.execute(f"DELETE FROM {table} WHERE 1 = 1{bucket_sql}{shop_sql}", bucket_params + shop_params)
+
+        # 门店名称/城市取桶内最后一天的值
+        cursor.execute(f"""
+        INSERT INTO {table} (shop_id, {bucket_col}, last_date, day_count, shop_name, city, {', '.join(sum_names)})
+        SELECT g.shop_id, g.bucket, g.last_date, g.day_count, f.shop_name, f.city, {', '.join(f'g.{n}' for n in sum_names)}
+        FROM (
+            SELECT
+                shop_id,
+                {bucket_expr} as bucket,
+                MAX(report_date) as last_date,
+                COUNT(*) as day_count,
+                {', '.join(f'SUM({n}) as {n}' for n in sum_names)}
+            FROM shop_daily_fact
+            WHERE 1 = 1{fact_date_sql}{shop_sql}
+            GROUP BY shop_id, bucket
+        ) g
+        JOIN shop_daily_fact f ON f.shop_id = g.shop_id AND f.report_date = g.last_date
+        """, fact_date_params + shop_params)
+
+
+def sync_rollup_tables():
+    """
+    增量同步预汇总表
+    - 以 data_upload_log.id 为高水位，只重算新上传记录涉及的门店，每个门店只重算自己上传的日期范围
+    - 尚未构建过（synced_at 为空）时全量构建
+    - 通过 SELECT ... FOR UPDATE 锁住同步状态行，多个进程同时生成报表时只有一个执行同步
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
 
-        return region_mapping
+    try:
+        cursor.execute("SELECT last_log_id, synced_at FROM rollup_sync_state WHERE name = %s", (ROLLUP_STATE_NAME,))
+        state = cursor.fetchone()
+        cursor.execute("SELECT MAX(id) as max_log_id FROM data_upload_log")
+        max_log_id = cursor.fetchone()['max_log_id'] or 0
+        if state and state['synced_at'] and state['last_log_id'] >= max_log_id:
+            return  # 没有新上传
+
+        conn.start_transaction()
+        try:
+            # 加锁后重新读取状态（等锁期间可能已被其他进程同步）
+            cursor.execute("SELECT last_log_id, synced_at FROM rollup_sync_state WHERE name = %s FOR UPDATE",
+                           (ROLLUP_STATE_NAME,))
+            state = cursor.fetchone()
+            last_log_id = state['last_log_id'] if state else 0
+
+            if not state or not state['synced_at']:
+                print("📦 首次构建预汇总表（全量）...")
+                _rebuild_rollups(cursor)
+            elif last_log_id < max_log_id:
+                placeholders = ','.join(['%s'] * len(ROLLUP_SOURCE_TABLES))
+                cursor.execute(f"""
+                SELECT shop_id, MIN(data_date_start) as date_start, MAX(data_date_end) as date_end
+                FROM data_upload_log
+                WHERE id > %s AND id <= %s
+                  AND upload_status = 2
+                  AND table_name IN ({placeholders})
+                GROUP BY shop_id
+                """, [last_log_id, max_log_id, *ROLLUP_SOURCE_TABLES])
+                # 各门店只重算自己的日期范围：范围扩展到整周后相同的门店合并为一批重算
+                # （不合并为所有门店的总范围，个别门店补录历史数据时其他门店不必跟着重算整段历史）
+                batches = {}
+                for upload in cursor.fetchall():
+                    batch_range = (_week_start(upload['date_start']),
+                                   _week_start(upload['date_end']) + timedelta(days=6))
+                    batches.setdefault(batch_range, []).append(upload['shop_id'])
+                for (start_date, end_date), batch_shop_ids in sorted(batches.items()):
+                    _rebuild_rollups(cursor, start_date, end_date, batch_shop_ids)
+
+            if state:
+                cursor.execute("UPDATE rollup_sync_state SET last_log_id = %s, synced_at = NOW() WHERE name = %s",
+                               (max(max_log_id, last_log_id), ROLLUP_STATE_NAME))
+            else:
+                cursor.execute("INSERT INTO rollup_sync_state (name, last_log_id, synced_at) VALUES (%s, %s, NOW())",
+                               (ROLLUP_STATE_NAME, max_log_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
     finally:
         cursor.close()
         conn.close()
 
 
-def get_coupon_orders_last_7days(shop_id, report_date):
+def split_period_buckets(start_date, end_date):
+    """
+    把时期拆分为 整月 + 整ISO周 + 零散日期段
+    返回: (month_starts, week_starts, day_ranges)，day_ranges 为 [(开始, 结束), ...]
+    """
+    months, weeks, day_ranges = [], [], []
+    day = start_date
+    while day <= end_date:
+        if day.day == 1 and _next_month_start(day) - timedelta(days=1) <= end_date:
+            months.append(day)
+            day = _next_month_start(day)
+        elif day.weekday() == 0 and day + timedelta(days=6) <= end_date:
+            weeks.append(day)
+            day += timedelta(days=7)
+        else:
+            if day_ranges and day_ranges[-1][1] == day - timedelta(days=1):
+                day_ranges[-1] = (day_ranges[-1][0], day)
+            else:
+                day_ranges.append((day, day))
+            day += timedelta(days=1)
+    return months, weeks, day_ranges
+
+
+def _rollup_period_query(period1_start, period1_end, period2_start, period2_end, shop_ids=None):
+    """
+    预汇总表查询：两个时期分别拆成 整月 + 整周 + 零散日期 桶，UNION ALL 后按门店ID排序
+    返回: (sql, params)
     """
-    获取近7天优惠码订单总数
+    sum_names = [name for name, _ in PERIOD_SUM_FIELDS]
+    shop_sql, shop_params = _shop_filter_sql(shop_ids)
+
+    parts = []
+    params = []
+    for period_no, (start, end) in enumerate(((period1_start, period1_end), (period2_start, period2_end)), start=1):
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+        months, weeks, day_ranges = split_period_buckets(start_date, end_date)
+
+        for buckets, grain in ((months, 'month'), (weeks, 'week')):
+            if buckets:
+                table, bucket_col, _ = ROLLUP_GRAINS[grain]
+                parts.append(f"""
+                SELECT %s as period_no, shop_id, shop_name, city, last_date, {', '.join(sum_names)}
+                FROM {table}
+                WHERE {bucket_col} IN ({','.join(['%s'] * len(buckets))}){shop_sql}
+                """)
+                params += [period_no, *buckets, *shop_params]
+
+        for range_start, range_end in day_ranges:
+            parts.append(f"""
+            SELECT %s as period_no, shop_id, shop_name, city, report_date as last_date, {', '.join(sum_names)}
+            FROM shop_daily_fact
+            WHERE report_date BETWEEN %s AND %s{shop_sql}
+            """)
+            params += [period_no, range_start, range_end, *shop_params]
+
+    return ' UNION ALL '.join(parts) + ' ORDER BY shop_id', params
+
+
+def _merge_rollup_period_rows(stream, group_fields):
+    """
+    预汇总表查询行（按门店ID排序）-> 逐门店 (shop_id, 时期1行, 时期2行)，某时期没有数据时为 {}
+    同一门店各桶合并：汇总值相加（全为 NULL 时保持 NULL，与 SQL SUM 一致），门店名称/城市取时期内最后一天的值
+    （时期内改名时同样合并为一行）；只保留当前门店的合并结果
+    """
+    sum_names = [name for name, _ in PERIOD_SUM_FIELDS]
+    output_fields = (*group_fields, *sum_names)
+
+    def finish(merged):
+        return tuple({field: shop_row[field] for field in output_fields} if shop_row else {}
+                     for shop_row in merged)
+
+    current_shop, merged = None, [None, None]
+    for row in stream.views():
+        shop_id = row['shop_id']
+        if shop_id != current_shop:
+            if current_shop is not None:
+                yield (current_shop, *finish(merged))
+            current_shop, merged = shop_id, [None, None]
+
+        n = row['period_no'] - 1
+        shop_row = merged[n]
+        if shop_row is None:
+            merged[n] = dict(row.items())
+            continue
+        for name in sum_names:
+            if row[name] is not None:
+                shop_row[name] = row[name] if shop_row[name] is None else shop_row[name] + row[name]
+        if row['last_date'] > shop_row['last_date']:
+            shop_row['last_date'] = row['last_date']
+            shop_row['shop_name'] = row['shop_name']
+            shop_row['city'] = row['city']
+    if current_shop is not None:
+        yield (current_shop, *finish(merged))
+
+
+def iter_two_period_data(conn, period1_start, period1_end, period2_start, period2_end,
+                         group_fields=('shop_id', 'shop_name'), shop_ids=None, chunk_size=None):
+    """
+    按门店ID顺序逐个产出两个时期的分门店汇总数据（生成器）：
+    优先读预汇总表（先增量同步），未建表时退回原始日表条件聚合；查询结果由无缓冲游标分块读取，
+    生成器开始迭代时才执行查询，读取期间 conn 不能执行其他查询
+
     参数:
-        shop_id: 门店ID
-        report_date: 报表日期 (str 'YYYY-MM-DD')
-    返回: int 近7天优惠码订单总数
-    数据来源: kewen_daily_report.coupon_pay_order_count
+        conn: 数据库连接（由调用方提供）
+        period1_start / period1_end: str, 第一个时期 'YYYY-MM-DD'
+        period2_start / period2_end: str, 第二个时期 'YYYY-MM-DD'
+        group_fields: tuple, kewen_daily_report 中的分组字段，如 ('shop_id', 'shop_name', 'city')
+        shop_ids: list, 可选，门店ID列表，如果提供则只查询这些门店
+        chunk_size: int, 每次 fetchmany 的行数，默认 REPORT_FETCH_CHUNK_ROWS
+    产出: (shop_id, 时期1行, 时期2行)
+          时期行可按 PERIOD_SUM_FIELDS 的结果字段名及 group_fields 取值（row[name] / row.get(name)），
+          某时期没有数据时为空 dict
+    """
+    global _ROLLUP_TABLES_MISSING
+
+    if ROLLUP_ENABLED and not _ROLLUP_TABLES_MISSING:
+        stream = None
+        try:
+            sync_rollup_tables()
+            sql, params = _rollup_period_query(period1_start, period1_end, period2_start, period2_end, shop_ids)
+            stream = QueryStream(conn, sql, params, chunk_size)
+        except mysql.connector.errors.ProgrammingError as e:
+            if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                raise
+            _ROLLUP_TABLES_MISSING = True
+            print("⚠️ 未找到预汇总表（见 jx_rollup_tables.sql），按原始日表汇总")
+        if stream is not None:
+            with stream:
+                yield from _merge_rollup_period_rows(stream, group_fields)
+            return
+
+    sql, params = _raw_period_query(period1_start, period1_end, period2_start, period2_end, group_fields, shop_ids)
+    with QueryStream(conn, sql, params, chunk_size) as stream:
+        yield from _split_raw_period_rows(stream, group_fields)
+
+
+def count_period_shops(conn, period1_start, period1_end, period2_start, period2_end, shop_ids=None):
+    """两个时期内有数据的门店数（进度回调的总数、是否分片的判断）"""
+    sql = """
+    SELECT COUNT(DISTINCT shop_id)
+    FROM kewen_daily_report
+    WHERE (report_date BETWEEN %s AND %s OR report_date BETWEEN %s AND %s)
+    """
+    params = [period1_start, period1_end, period2_start, period2_end]
+    if shop_ids:
+        sql += f" AND shop_id IN ({','.join(['%s'] * len(shop_ids))})"
+        params.extend(shop_ids)
+    return count_rows(conn, sql, params)
+
+
+# ==================== 评价分析（周报/自定义报表的“评价分析”Sheet）====================
+# 表结构见 jx_review_tables.sql：评价详情表按 平台+门店+评价日期 预聚合到 shop_review_daily，
+# 以详情表的 id / updated_at 为高水位增量维护。聚合只读取下面的投影列（不读取 raw_data 等 JSON 列），
+# 报表读取时只扫描汇总表。未建表时不生成评价分析Sheet
+REVIEW_SOURCES = {
+    # 平台 -> (详情表, 消费时间列)
+    'dianping': ('review_detail_dianping', 'consume_date'),
+    'meituan': ('review_detail_meituan', 'consume_time'),
+}
+REVIEW_PLATFORM_NAMES = {'dianping': '点评', 'meituan': '美团'}
+_REVIEW_TABLES_MISSING = False  # 首次发现未建表后不再尝试
+
+# 星级分桶：(汇总列, star 下限, star 上限)，star 为原始值（50=5星）
+REVIEW_STAR_BUCKETS = (
+    ('star5_count', 45, None),
+    ('star4_count', 35, 45),
+    ('star3_count', 25, 35),
+    ('star2_count', 15, 25),
+    ('star1_count', 1, 15),
+)
+
+
+# 详情表用占位值表示“无”：未回复时 shop_reply_time 为 1997-12-08 00:00:00（shop_reply 为“暂无回复”），
+# 无订单时 order_id 为 0、消费时间为 1997-12-08。回复只认回复时间不早于评价时间的行，消费后只认真实订单/消费日期
+REVIEW_PLACEHOLDER_DATE = '1997-12-08'
+
+
+def _review_aggregate_columns(consume_col):
+    """shop_review_daily 汇总列 -> 聚合表达式（只引用详情表的投影列）"""
+    columns = [('review_count', 'COUNT(*)')]
+    for name, low, high in REVIEW_STAR_BUCKETS:
+        condition = f"star >= {low}" + (f" AND star < {high}" if high else '')
+        columns.append((name, f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)"))
+    columns += [
+        ('reply_count', "SUM(CASE WHEN shop_reply_time >= add_time THEN 1 ELSE 0 END)"),
+        ('reply_seconds', "SUM(CASE WHEN shop_reply_time >= add_time "
+                          "THEN TIMESTAMPDIFF(SECOND, add_time, shop_reply_time) ELSE 0 END)"),
+        ('pic_review_count', "SUM(CASE WHEN pic_count > 0 THEN 1 ELSE 0 END)"),
+        ('pic_count', "SUM(COALESCE(pic_count, 0))"),
+        ('video_review_count', "SUM(CASE WHEN video_count > 0 THEN 1 ELSE 0 END)"),
+        ('video_count', "SUM(COALESCE(video_count, 0))"),
+        ('after_consume_count', f"SUM(CASE WHEN order_id > 0 OR DATE({consume_col}) > '{REVIEW_PLACEHOLDER_DATE}' "
+                                f"THEN 1 ELSE 0 END)"),
+    ]
+    return columns
+
+
+# 汇总列名（各平台相同）
+REVIEW_SUM_FIELDS = tuple(name for name, _ in _review_aggregate_columns(REVIEW_SOURCES['dianping'][1]))
+
+
+def _as_date(value):
+    """datetime / date / 'YYYY-MM-DD ...' -> date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return value
+
+
+def _rebuild_review_stats(cursor, platform, start_date=None, end_date=None, shop_ids=None):
+    """
+    重算某平台指定门店、日期范围内的门店日评价汇总（先删后插）
+    start_date/end_date 为 None 时全量重建
+    """
+    source_table, consume_col = REVIEW_SOURCES[platform]
+    columns = _review_aggregate_columns(consume_col)
+
+    date_sql, source_date_sql, date_params, source_date_params = '', '', [], []
+    if start_date:
+        date_sql = " AND review_date BETWEEN %s AND %s"
+        date_params = [start_date, end_date]
+        # 按 add_time 范围筛选（走 idx_add_time），不在列上套函数
+        source_date_sql = " AND add_time >= %s AND add_time < %s"
+        source_date_params = [start_date, end_date + timedelta(days=1)]
+    shop_sql, shop_params = _shop_filter_sql(shop_ids)
+
+    cursor.execute(f"DELETE FROM shop_review_daily WHERE platform = %s{date_sql}{shop_sql}",
+                   [platform, *date_params, *shop_params])
+    cursor.execute(f"""
+    INSERT INTO shop_review_daily (platform, shop_id, review_date, shop_name, {', '.join(REVIEW_SUM_FIELDS)})
+    SELECT %s, shop_id, DATE(add_time) as review_date, MAX(shop_name),
+        {', '.join(expr for _, expr in columns)}
+    FROM {source_table}
+    WHERE add_time IS NOT NULL{source_date_sql}{shop_sql}
+    GROUP BY shop_id, review_date
+    """, [platform, *source_date_params, *shop_params])
+
+
+def sync_review_stats():
+    """
+    增量同步门店日评价汇总表（各平台独立）
+    - 以详情表的 id 与 updated_at 为高水位，只读取新增或修改过的评价的 门店ID/评价时间，
+      重算涉及的门店与日期范围
+    - 尚未构建过（synced_at 为空）时全量构建
+    - 通过 SELECT ... FOR UPDATE 锁住同步状态行，多个进程同时生成报表时只有一个执行同步
+    注意：详情表中删除的评价、评价时间被修改前所在的日期不会被增量同步发现，
+    需要时可将 review_sync_state.synced_at 置空触发全量重建
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        for platform, (source_table, _) in REVIEW_SOURCES.items():
+            cursor.execute("SELECT last_id, last_updated_at, synced_at FROM review_sync_state WHERE platform = %s",
+                           (platform,))
+            state = cursor.fetchone()
+            cursor.execute(f"SELECT MAX(id) as max_id, MAX(updated_at) as max_updated_at FROM {source_table}")
+            marks = cursor.fetchone()
+            max_id, max_updated_at = marks['max_id'] or 0, marks['max_updated_at']
+            if (state and state['synced_at'] and state['last_id'] >= max_id
+                    and (max_updated_at is None or (state['last_updated_at'] is not None
+                                                    and state['last_updated_at'] >= max_updated_at))):
+                continue  # 没有新增或修改的评价
+
+            conn.start_transaction()
+            try:
+                # 加锁后重新读取状态（等锁期间可能已被其他进程同步）
+                cursor.execute("SELECT last_id, last_updated_at, synced_at FROM review_sync_state "
+                               "WHERE platform = %s FOR UPDATE", (platform,))
+                state = cursor.fetchone()
+
+                if not state or not state['synced_at']:
+                    print(f"📦 首次构建{REVIEW_PLATFORM_NAMES[platform]}评价汇总表（全量）...")
+                    _rebuild_review_stats(cursor, platform)
+                else:
+                    # updated_at 取 >=：与高水位同一秒内后写入的评价也会被重算（重算结果幂等）
+                    params = [state['last_id']]
+                    updated_sql = ''
+                    if state['last_updated_at'] is not None:
+                        updated_sql = " OR updated_at >= %s"
+                        params.append(state['last_updated_at'])
+                    cursor.execute(f"""
+                    SELECT shop_id, MIN(add_time) as date_start, MAX(add_time) as date_end
+                    FROM {source_table}
+                    WHERE (id > %s{updated_sql}) AND add_time IS NOT NULL
+                    GROUP BY shop_id
+                    """, params)
+                    # 各门店只重算自己的日期范围：范围相同的门店（通常是当天新增的评价）合并为一批重算
+                    # （不合并为所有门店的总范围，个别门店的旧评价被修改时其他门店不必跟着重算整段历史）
+                    batches = {}
+                    for change in cursor.fetchall():
+                        batch_range = (_as_date(change['date_start']), _as_date(change['date_end']))
+                        batches.setdefault(batch_range, []).append(change['shop_id'])
+                    for (start_date, end_date), batch_shop_ids in sorted(batches.items()):
+                        _rebuild_review_stats(cursor, platform, start_date, end_date, batch_shop_ids)
+
+                if state:
+                    cursor.execute("UPDATE review_sync_state SET last_id = %s, last_updated_at = %s, synced_at = NOW() "
+                                   "WHERE platform = %s",
+                                   (max(max_id, state['last_id']), max_updated_at, platform))
+                else:
+                    cursor.execute("INSERT INTO review_sync_state (platform, last_id, last_updated_at, synced_at) "
+                                   "VALUES (%s, %s, %s, NOW())", (platform, max_id, max_updated_at))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def iter_review_period_stats(conn, period1_start, period1_end, period2_start, period2_end, shop_ids=None,
+                             chunk_size=None):
+    """
+    按门店ID顺序逐个产出两个时期的评价汇总（生成器，先增量同步评价汇总表）
+    两个时期分别 UNION ALL 后按门店、时期分组，只扫描 shop_review_daily（走 idx_review_date）
+    未建评价汇总表时打印提示并直接结束（不产出任何门店）
+
+    产出: (shop_id, shop_name, 时期1汇总, 时期2汇总)，时期汇总为 {REVIEW_SUM_FIELDS 字段: 值,
+          'dianping_count': 点评评价数, 'meituan_count': 美团评价数}，某时期没有评价时各值为0
+    """
+    global _REVIEW_TABLES_MISSING
+
+    if _REVIEW_TABLES_MISSING:
+        return
+
+    shop_sql, shop_params = _shop_filter_sql(shop_ids)
+    parts, params = [], []
+    for period_no, (start, end) in enumerate(((period1_start, period1_end), (period2_start, period2_end)), start=1):
+        parts.append(f"""
+        SELECT %s as period_no, platform, shop_id, shop_name, {', '.join(REVIEW_SUM_FIELDS)}
+        FROM shop_review_daily
+        WHERE review_date BETWEEN %s AND %s{shop_sql}
+        """)
+        params += [period_no, start, end, *shop_params]
+    platform_counts = ', '.join(
+        f"SUM(CASE WHEN platform = '{platform}' THEN review_count ELSE 0 END) as {platform}_count"
+        for platform in REVIEW_SOURCES)
+    sql = f"""
+    SELECT shop_id, period_no, MAX(shop_name) as shop_name,
+        {', '.join(f'SUM({name}) as {name}' for name in REVIEW_SUM_FIELDS)}, {platform_counts}
+    FROM ({' UNION ALL '.join(parts)}) r
+    GROUP BY shop_id, period_no
+    ORDER BY shop_id, period_no
+    """
+
+    try:
+        sync_review_stats()
+        stream = QueryStream(conn, sql, params, chunk_size)
+    except mysql.connector.errors.ProgrammingError as e:
+        if e.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        _REVIEW_TABLES_MISSING = True
+        print("⚠️ 未找到评价汇总表（见 jx_review_tables.sql），跳过评价分析Sheet")
+        return
+
+    value_fields = (*REVIEW_SUM_FIELDS, *(f'{platform}_count' for platform in REVIEW_SOURCES))
+    empty = dict.fromkeys(value_fields, 0)
+    with stream:
+        current_shop, shop_name, periods = None, None, None
+        for row in stream.views():
+            if row['shop_id'] != current_shop:
+                if current_shop is not None:
+                    yield current_shop, shop_name, periods[0], periods[1]
+                current_shop, shop_name, periods = row['shop_id'], row['shop_name'], [empty, empty]
+            periods[row['period_no'] - 1] = {field: int(row[field] or 0) for field in value_fields}
+            shop_name = row['shop_name'] or shop_name
+        if current_shop is not None:
+            yield current_shop, shop_name, periods[0], periods[1]
+
+
+# ==================== 评价明细读取（投影列 + 按需加载大字段）====================
+# 评价详情表每行带有数 KB 的 JSON/长文本列（raw_data、pic_info、reply_list 等），远程 MySQL 上这些列决定了传输量。
+# 明细查询只投影标量列（按 jx_review_tables.sql 中的 (shop_id, add_time, star) 索引筛选，只对命中的行回表），
+# 报表确定要展示的行之后，再按主键批量读取这些行的大字段
+REVIEW_JSON_COLUMNS = frozenset({'raw_data', 'pic_info', 'video_info', 'reply_list', 'score_map'})
+REVIEW_LAZY_COLUMNS = REVIEW_JSON_COLUMNS | {'content', 'shop_reply'}
+REVIEW_LAZY_BATCH_ROWS = 500  # 按主键读取大字段时每批的行数
+REVIEW_DETAIL_MAX_ROWS = int(os.environ.get('JX_REVIEW_DETAIL_MAX_ROWS', 1000))  # 差评明细Sheet 最多展示的评价数
+REVIEW_BAD_STAR_BELOW = 25  # star 低于此值（1-2星）为差评，与 REVIEW_STAR_BUCKETS 一致
+
+
+def review_detail_query(platform, columns, where='1 = 1', params=()):
+    """
+    评价详情表的投影查询：只选取指定的标量列（附带平台名），大字段须用 load_review_lazy_fields 按需读取
+    返回: (sql, params)，sql 不含 ORDER BY / LIMIT，可由调用方追加或 UNION ALL
+    """
+    lazy = REVIEW_LAZY_COLUMNS.intersection(columns)
+    if lazy:
+        raise ValueError(f"评价明细查询不能直接读取大字段: {', '.join(sorted(lazy))}（请使用 load_review_lazy_fields）")
+    source_table, _ = REVIEW_SOURCES[platform]
+    return (f"SELECT %s as platform, {', '.join(columns)} FROM {source_table} WHERE {where}",
+            [platform, *params])
+
+
+def load_review_lazy_fields(conn, rows, fields):
+    """
+    为已确定展示的评价行按主键批量读取大字段（JSON 列解析为对象），结果写回各行 dict
+    rows 中每行需有 'platform' 与 'id'
     """
-    conn = CONNECTION_POOL.get_connection()
     cursor = conn.cursor(dictionary=True)
+    try:
+        for platform, (source_table, _) in REVIEW_SOURCES.items():
+            by_id = {row['id']: row for row in rows if row['platform'] == platform}
+            ids = list(by_id)
+            for start in range(0, len(ids), REVIEW_LAZY_BATCH_ROWS):
+                batch = ids[start:start + REVIEW_LAZY_BATCH_ROWS]
+                cursor.execute(f"""
+                SELECT id, {', '.join(fields)}
+                FROM {source_table}
+                WHERE id IN ({','.join(['%s'] * len(batch))})
+                """, batch)
+                for values in cursor.fetchall():
+                    row = by_id[values['id']]
+                    for field in fields:
+                        value = values[field]
+                        row[field] = _parse_json_field(value) if field in REVIEW_JSON_COLUMNS else value
+    finally:
+        cursor.close()
+    return rows
+
+
+def get_bad_reviews(conn, start_date, end_date, shop_ids=None, limit=None):
+    """
+    时期内的差评（1-2星）明细，按门店ID、评价时间排序，最多 limit 条（默认 REVIEW_DETAIL_MAX_ROWS）
+    只读取投影列，大字段（评价内容、图片、回复）由调用方对展示的行调用 load_review_lazy_fields
+    返回: (rows, truncated)，truncated 表示超过 limit 被截断
+    """
+    limit = REVIEW_DETAIL_MAX_ROWS if limit is None else limit
+    end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    shop_sql, shop_params = _shop_filter_sql(shop_ids)
+
+    parts, params = [], []
+    for platform in REVIEW_SOURCES:
+        sql, platform_params = review_detail_query(
+            platform,
+            ('id', 'shop_id', 'shop_name', 'add_time', 'star', 'pic_count', 'video_count', 'shop_reply_time'),
+            f"add_time >= %s AND add_time < %s AND star > 0 AND star < %s{shop_sql}",
+            [start_date, end_next, REVIEW_BAD_STAR_BELOW, *shop_params])
+        parts.append(sql)
+        params += platform_params
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"{' UNION ALL '.join(parts)} ORDER BY shop_id, add_time, id LIMIT %s", params + [limit + 1])
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return rows[:limit], len(rows) > limit
+
+
+def clean_sheet_name(name, max_length=31):
+    """
+    清理 Sheet 名称，符合 Excel 规范
+    - 最大 31 字符
+    - 不能包含: \ / * ? : [ ]
+    """
+    if not name:
+        return "Sheet"
+
+    # 替换非法字符
+    illegal_chars = ['\\', '/', '*', '?', ':', '[', ']']
+    for char in illegal_chars:
+        name = name.replace(char, '')
+
+    # 截断到最大长度
+    if len(name) > max_length:
+        name = name[:max_length]
+
+    return name or "Sheet"
+
+
+def apply_border(ws, min_row, max_row, min_col, max_col):
+    """应用边框样式"""
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
+        for cell in row:
+            cell.border = thin_border
+
+
+# ==================== 报表单元格样式（命名样式注册表）====================
+# 所有报表单元格都是细边框 + 居中，只有字体和填充不同；
+# 全部样式组合预先定义为 NamedStyle，每个单元格只做一次样式赋值，
+# 生成的样式表中每种组合也只保存一份。普通模式和流式模式共用同一套写入逻辑
+_THIN_SIDE = Side(style='thin')
+_THIN_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+_CENTER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+_DETAIL_HEADER_FILL = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")  # RGB(189,215,238)
+_DETAIL_A_COL_FILL = PatternFill(start_color="DEEBF7", end_color="DEEBF7", fill_type="solid")  # RGB(222,235,247)
+
+
+def _report_style(name, font=None, fill=None):
+    """构建报表命名样式（细边框 + 居中）"""
+    return NamedStyle(
+        name=name,
+        font=font or DEFAULT_FONT,
+        fill=fill or PatternFill(),
+        border=_THIN_BORDER,
+        alignment=_CENTER_ALIGNMENT
+    )
+
+
+REPORT_NAMED_STYLES = {style.name: style for style in [
+    _report_style('plain'),
+    # 日报
+    _report_style('daily_summary_header', Font(bold=True, size=10),
+                  PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")),
+    _report_style('daily_title', Font(bold=True, size=12)),
+    _report_style('daily_status_ok', Font(bold=True, size=10, color="008000")),
+    _report_style('daily_status_warning', Font(bold=True, size=10, color="FF0000")),
+    _report_style('daily_section', Font(bold=True, size=10, color="0066CC")),
+    _report_style('qualified', Font(bold=True, color="008000")),
+    _report_style('unqualified', Font(bold=True, color="FF0000")),
+    # 周报/月报/自定义报表 汇总Sheet
+    _report_style('period_summary_header', Font(bold=True, size=10),
+                  PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")),
+    _report_style('period_summary_diff', Font(color="FF0000")),
+    # 周报/月报/自定义报表 门店详细Sheet（宋体）
+    _report_style('detail_title', Font(name='宋体', bold=True, size=16, color="000000")),
+    _report_style('detail_header', Font(name='宋体', bold=True, size=16, color="000000"), _DETAIL_HEADER_FILL),
+    _report_style('detail_label', Font(name='宋体', size=14, color="000000"), _DETAIL_A_COL_FILL),
+    _report_style('detail_value', Font(name='宋体', size=14, color="000000")),
+    _report_style('detail_diff_up', Font(name='宋体', size=14, color="FF0000")),
+    # 团队汇总报表 小计/合计行
+    _report_style('team_subtotal', Font(bold=True, size=10),
+                  PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")),
+]}
+
+
+def create_report_workbook(streaming=False):
+    """
+    创建报表工作簿并注册全部报表命名样式
+    NamedStyle 注册时会绑定到具体工作簿（记录样式索引），因此每个工作簿注册一份副本；
+    同时按注册顺序在临时工作表上为每个样式建一个单元格并读取 style_id，预先登记单元格样式，
+    使样式编号与使用顺序无关、每个工作簿的样式表完全相同（分片生成时子进程写出的工作表可以直接合并）
+    """
+    wb = openpyxl.Workbook(write_only=streaming)
+    scratch = wb.create_sheet('styles')
+    for style in REPORT_NAMED_STYLES.values():
+        named_style = NamedStyle(
+            name=style.name,
+            font=style.font,
+            fill=style.fill,
+            border=style.border,
+            alignment=style.alignment
+        )
+        wb.add_named_style(named_style)
+        cell = WriteOnlyCell(scratch)
+        cell.style = named_style.name
+        cell.style_id  # 首次读取 style_id 时把单元格样式登记到工作簿样式表
+    wb.remove(scratch)
+    return wb
+
+
+# 日报详细Sheet中的分类标题行、达标判断行（行号从1开始）
+DAILY_DETAIL_SECTION_ROWS = (3, 14, 19)
+DAILY_DETAIL_QUALIFIED_ROWS = (25, 26, 27, 28)
+
+
+def _is_positive(value):
+    """判断差值是否为正数（数值或百分比字符串）"""
+    if isinstance(value, (int, float, Decimal)):
+        return value > 0
+    if isinstance(value, str) and '%' in value:
+        try:
+            return float(value.replace('%', '')) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _daily_detail_row_styles(row_num, row_values, is_force_offline):
+    """日报门店详细Sheet 一行的样式名"""
+    styles = ['plain'] * len(row_values)
+    if row_num == 1:
+        styles[0] = 'daily_title'
+        styles[1] = 'daily_status_warning' if is_force_offline > 0 else 'daily_status_ok'
+    elif row_num in DAILY_DETAIL_SECTION_ROWS:
+        styles[0] = 'daily_section'
+    elif row_num in DAILY_DETAIL_QUALIFIED_ROWS:
+        if row_values[2] == "未达标":
+            styles[2] = 'unqualified'
+        elif row_values[2] == "达标":
+            styles[2] = 'qualified'
+    return styles
+
+
+# 日报达标线：留评率/收藏率为百分比，近7天优惠码订单、当天广告单为单数
+DAILY_REVIEW_RATE_TARGET = 30
+DAILY_COLLECT_RATE_TARGET = 40
+DAILY_COUPON_7DAYS_TARGET = 10
+DAILY_AD_TODAY_TARGET = 1
+
+# 日报查询行的数量字段（NULL 按0）和金额字段（NULL 按0，保留2位小数）
+DAILY_COUNT_FIELDS = (
+    'exposure_users', 'visit_users', 'order_users', 'verify_users', 'order_coupon_count', 'verify_coupon_count',
+    'phone_clicks', 'address_clicks', 'consult_users', 'new_good_review_count', 'new_review_count',
+    'new_collect_users', 'checkin_count', 'promotion_order_count', 'is_force_offline',
+)
+DAILY_AMOUNT_FIELDS = (
+    'order_sale_amount', 'verify_sale_amount', 'verify_after_discount', 'promotion_cost', 'click_avg_price',
+    'ad_balance',
+)
+
+
+class DailyShopRecord:
+    """
+    日报单门店记录：由查询行构造一次，构造时完成 NULL→0、Decimal→float（保留2位）的转换，
+    汇总行/详细Sheet/导出直接读属性
+    - 排名（order_user_rank / verify_amount_rank）、意向转化率 intent_rate 保留 NULL（显示为 -- / 0%）
+    """
+
+    __slots__ = ('shop_id', 'shop_name', 'intent_rate', 'order_user_rank', 'verify_amount_rank',
+                 'ad_order_count') + DAILY_COUNT_FIELDS + DAILY_AMOUNT_FIELDS
+
+    def __init__(self, row):
+        self.shop_id = row['shop_id']
+        self.shop_name = row['shop_name'] or f'门店{self.shop_id}'
+        self.intent_rate = row['intent_rate']
+        self.order_user_rank = row['order_user_rank']
+        self.verify_amount_rank = row['verify_amount_rank']
+        self.ad_order_count = int(row['ad_order_count'] or 0)
+        for field in DAILY_COUNT_FIELDS:
+            setattr(self, field, int(row[field] or 0))
+        for field in DAILY_AMOUNT_FIELDS:
+            value = row[field]
+            setattr(self, field, round(float(value), 2) if value else 0)
+
+
+def daily_quality_checks(record, coupon_7days):
+    """
+    日报门店的4个达标项
+    参数:
+        record: DailyShopRecord
+        coupon_7days: 近7天优惠码订单数
+    返回:
+        {'review_rate'|'collect_rate'|'coupon_7days'|'ad_today': (数值, 是否达标)}
+        留评率 = 新增评价 / 核销人数，收藏率 = 新增收藏 / 下单人数（百分比，分母为0时为 None，不达标）
+    """
+    verify_users = record.verify_users
+    order_users = record.order_users
+    review_rate = record.new_review_count / verify_users * 100 if verify_users > 0 else None
+    collect_rate = record.new_collect_users / order_users * 100 if order_users > 0 else None
+    ad_today = record.ad_order_count
+    return {
+        'review_rate': (review_rate, review_rate is not None and review_rate >= DAILY_REVIEW_RATE_TARGET),
+        'collect_rate': (collect_rate, collect_rate is not None and collect_rate >= DAILY_COLLECT_RATE_TARGET),
+        'coupon_7days': (coupon_7days, coupon_7days >= DAILY_COUPON_7DAYS_TARGET),
+        'ad_today': (ad_today, ad_today >= DAILY_AD_TODAY_TARGET),
+    }
+
+
+def append_styled_rows(ws, rows, row_styles):
+    """
+    向工作表追加带样式的行（普通工作表和 write-only 工作表通用）
+    参数:
+        ws: Worksheet 或 WriteOnlyWorksheet
+        rows: 行数据列表
+        row_styles: 与 rows 对应的样式名列表（每行一个 list，取值为 REPORT_NAMED_STYLES 的键）
+    """
+    with metrics_span('styling', rows=len(rows)):
+        for row_values, styles in zip(rows, row_styles):
+            cells = []
+            for value, style_name in zip(row_values, styles):
+                cell = WriteOnlyCell(ws, value=None if value == '' else value)
+                cell.style = style_name
+                cells.append(cell)
+            ws.append(cells)
+
+
+def merge_report_cells(ws, range_string):
+    """合并单元格：普通工作表直接合并，write-only 工作表只能在写入前声明合并区域"""
+    with metrics_span('merge'):
+        if hasattr(ws, 'merge_cells'):
+            ws.merge_cells(range_string)
+        else:
+            ws.merged_cells.add(range_string)
+
+
+# ==================== 对比报表布局引擎（周报/月报/自定义报表）====================
+# 周报、月报、自定义报表都是“两个时期对比”：汇总Sheet 每门店8行（核销块 + 推广通块，各含表头/时期1/时期2/差值），
+# 门店详细Sheet 竖向31行。报表之间只有汇总Sheet 前几列（门店信息列）、Sheet 名、文件名不同，
+# 因此报表由下面的声明式布局描述，指标计算和写入由同一套引擎完成
+
+# 对比指标定义：指标名 -> (类型, 字段...)
+#   count : 时期汇总字段，差值直接相减
+#   amount: 金额汇总字段（元，保留2位小数）
+#   avg   : 均价 = 金额字段 / 数量字段，保留2位小数，数量为0时为0
+#   rate  : 百分比 = 字段1 / 字段2 * 100，保留1位小数，显示为 "x%"，分母为0时显示 "0%"
+# 舍入与 MySQL DECIMAL 汇总结果一致（四舍六入五成双）
+COMPARISON_METRICS = {
+    'verify_after_discount': ('amount', 'verify_after_discount'),
+    'exposure_users': ('count', 'exposure_users'),
+    'visit_users': ('count', 'visit_users'),
+    'order_users': ('count', 'order_users'),
+    'order_coupon_count': ('count', 'order_coupon_count'),
+    'verify_users': ('count', 'verify_users'),
+    'verify_coupon_count': ('count', 'verify_coupon_count'),
+    'order_sale_amount': ('amount', 'order_sale_amount'),
+    'verify_sale_amount': ('amount', 'verify_sale_amount'),
+    'coupon_orders': ('count', 'coupon_orders'),
+    'phone_clicks': ('count', 'phone_clicks'),
+    'promotion_cost': ('amount', 'promotion_cost'),
+    'promotion_exposure': ('count', 'promotion_exposure'),
+    'promotion_clicks': ('count', 'promotion_clicks'),
+    'promotion_orders': ('count', 'promotion_orders'),
+    'view_groupbuy': ('count', 'view_groupbuy'),
+    'view_phone': ('count', 'view_phone'),
+    'consult_users': ('count', 'consult_users'),
+    'address_clicks': ('count', 'address_clicks'),
+    'new_collect': ('count', 'new_collect'),
+    'new_good_reviews': ('count', 'new_good_reviews'),
+    'checkin_count': ('count', 'checkin_count'),
+    'exposure_rate': ('rate', 'visit_users', 'exposure_users'),
+    'order_rate': ('rate', 'order_users', 'visit_users'),
+    'avg_price': ('avg', 'verify_after_discount', 'verify_users'),
+    'click_price': ('avg', 'promotion_cost', 'promotion_clicks'),
+    'promotion_rate': ('rate', 'promotion_orders', 'promotion_clicks'),
+    'collect_rate': ('rate', 'new_collect', 'visit_users'),
+    'collect_order_rate': ('rate', 'new_collect', 'order_users'),
+    'review_rate': ('rate', 'new_good_reviews', 'verify_users'),
+}
+
+# 汇总Sheet 的两个数据块：[(列标题, 指标名), ...]，百分比差值显示1位小数
+PERIOD_SUMMARY_BLOCKS = (
+    (
+        ('优惠后核销额', 'verify_after_discount'), ('曝光人数', 'exposure_users'), ('访问人数', 'visit_users'),
+        ('曝光访问转化率', 'exposure_rate'), ('下单人数', 'order_users'), ('下单券数', 'order_coupon_count'),
+        ('下单转化率', 'order_rate'), ('核销人数', 'verify_users'), ('核销券数', 'verify_coupon_count'),
+        ('下单售价金额', 'order_sale_amount'), ('核销售价金额', 'verify_sale_amount'),
+        ('优惠码订单', 'coupon_orders'), ('电话点击', 'phone_clicks'), ('客单价', 'avg_price'),
+    ),
+    (
+        ('推广通花费', 'promotion_cost'), ('推广通曝光', 'promotion_exposure'), ('推广通点击', 'promotion_clicks'),
+        ('推广通点击均价', 'click_price'), ('推广通订单量', 'promotion_orders'), ('推广通下单转化率', 'promotion_rate'),
+        ('推广通查看团购', 'view_groupbuy'), ('推广通查看电话', 'view_phone'), ('在线咨询', 'consult_users'),
+        ('地址点击', 'address_clicks'), ('门店收藏', 'new_collect'), ('收藏率', 'collect_rate'),
+        ('新增好评数', 'new_good_reviews'), ('留评率', 'review_rate'),
+    ),
+)
+PERIOD_SUMMARY_RATE_DIGITS = 1
+
+# 门店详细Sheet 第3行起的行：(指标标签, 指标名)；指标名为 None 的是分类标题行（A:D 合并），
+# 百分比差值显示2位小数
+PERIOD_DETAIL_ROWS = (
+    ('曝光人数：', 'exposure_users'),
+    ('访问人数：', 'visit_users'),
+    ('曝光访问转化率：', 'exposure_rate'),
+    ('下单人数：', 'order_users'),
+    ('核销人数：', 'verify_users'),
+    ('意向转化率：', 'order_rate'),
+    ('下单券数：', 'order_coupon_count'),
+    ('核销券数：', 'verify_coupon_count'),
+    ('下单售价金额：', 'order_sale_amount'),
+    ('核销售价金额：', 'verify_sale_amount'),
+    ('优惠后核销金额：', 'verify_after_discount'),
+    ('客单价：', 'avg_price'),
+    ('电话点击：', 'phone_clicks'),
+    ('地址点击：', 'address_clicks'),
+    ('在线咨询：', 'consult_users'),
+    ('门店干预数据', None),
+    ('新增好评：', 'new_good_reviews'),
+    ('留评率：', 'review_rate'),
+    ('门店收藏：', 'new_collect'),
+    ('收藏率：', 'collect_order_rate'),
+    ('打卡人数：', 'checkin_count'),
+    ('推广通数据', None),
+    ('推广通订单量', 'promotion_orders'),
+    ('推广通花费', 'promotion_cost'),
+    ('推广通曝光（次）', 'promotion_exposure'),
+    ('推广通点击（次）', 'promotion_clicks'),
+    ('推广通点击均价（元）', 'click_price'),
+    ('查看团购（次）', 'view_groupbuy'),
+    ('查看电话（次）', 'view_phone'),
+)
+PERIOD_DETAIL_RATE_DIGITS = 1
+PERIOD_DETAIL_WIDTHS = (25, 36, 36, 20)
+
+# 对比报表布局：
+#   name         : 报表名称（用于提示信息）
+#   summary_sheet: 汇总Sheet 名称
+#   key_columns  : 汇总Sheet 数据周期列之前的门店信息列 (列标题, 列宽, 取值)，这些列在每门店第2-8行合并
+#   group_fields : 时期汇总查询的分组字段
+#   period_labels: 出错时调试输出中两个时期的名称
+#   filename     : 默认文件名模板（start/end 为第二个时期，shop_count 为门店数，now 为生成时间）
+#   review_sheet : 可选，评价分析Sheet 名称（见 iter_review_period_stats），没有此项时不生成
+#   review_detail_sheet: 可选，第二个时期的差评明细Sheet 名称（见 get_bad_reviews），没有此项时不生成
+# 新增对比类型（例如同比）只需增加一份布局并传入对应的两个时期
+COMPARISON_REPORT_LAYOUTS = {
+    'weekly': {
+        'name': '周报',
+        'summary_sheet': '汇总',
+        'key_columns': (('门店', 78, 'shop_name'),),
+        'group_fields': ('shop_id', 'shop_name'),
+        'period_labels': ('第一周数据 (week1_data)', '第二周数据 (week2_data)'),
+        'filename': '周报 非餐 {start}~{end} {now}.xlsx',
+        'review_sheet': '评价分析',
+        'review_detail_sheet': '差评明细',
+    },
+    'monthly': {
+        'name': '月报',
+        'summary_sheet': '汇总',
+        'key_columns': (('门店', 78, 'shop_name'),),
+        'group_fields': ('shop_id', 'shop_name'),
+        'period_labels': ('第一个月数据 (month1_data)', '第二个月数据 (month2_data)'),
+        'filename': '月报 非餐 {start}~{end} {now}.xlsx',
+    },
+    'custom': {
+        'name': '自定义报表',
+        'summary_sheet': '自定义报表',
+        'key_columns': (('序号', 8, 'seq'), ('运营', 18, 'operator'), ('城市', 10, 'city'),
+                        ('销售', 10, 'sales'), ('门店', 78, 'shop_name')),
+        'group_fields': ('shop_id', 'shop_name', 'city'),
+        'period_labels': ('时期1数据 (period1_data)', '时期2数据 (period2_data)'),
+        'filename': '自定义 {shop_count}家门店非餐 {start}~{end} {now}.xlsx',
+        'review_sheet': '评价分析',
+        'review_detail_sheet': '差评明细',
+    },
+}
+
+
+# 以“分”为单位取整的金额字段，其余字段按整数计数
+COMPARISON_AMOUNT_FIELDS = frozenset(
+    fields[0] for kind, *fields in COMPARISON_METRICS.values() if kind in ('amount', 'avg'))
+
+
+def _load_period_columns(rows, fields, errors):
+    """
+    把一个时期各门店的汇总行转成按字段的整数列（金额为分），NULL/缺失门店按0
+    值无法转换的门店记入 errors（门店下标 -> 异常），该门店整行按0处理
+    """
+    values = {field: [0] * len(rows) for field in fields}
+    for index, row in enumerate(rows):
+        if not row:
+            continue
+        try:
+            for field in fields:
+                value = row.get(field)
+                if value is None:
+                    continue
+                values[field][index] = round(value * 100) if field in COMPARISON_AMOUNT_FIELDS else int(value)
+        except Exception as e:
+            errors.setdefault(index, e)
+            for field in fields:
+                values[field][index] = 0
+    if numpy is not None:
+        return {field: numpy.array(column, dtype=numpy.int64) for field, column in values.items()}
+    return {field: array('q', column) for field, column in values.items()}
+
+
+def _column_op(func, *columns):
+    """整列运算：numpy 数组直接按数组计算，标准库 array 逐元素计算"""
+    if numpy is not None:
+        return func(*columns)
+    return [func(*values) for values in zip(*columns)]
+
+
+def _half_even_div(numerator, denominator):
+    """整列整数除法，商按四舍六入五成双取整；分母为0的位置结果为0"""
+    if numpy is not None:
+        valid = denominator > 0
+        safe = numpy.where(valid, denominator, 1)
+        quotient, remainder = numpy.divmod(numerator, safe)
+        quotient += (2 * remainder > safe) | ((2 * remainder == safe) & (quotient % 2 == 1))
+        return numpy.where(valid, quotient, 0)
+
+    result = []
+    for n, d in zip(numerator, denominator):
+        if d > 0:
+            quotient, remainder = divmod(n, d)
+            if 2 * remainder > d or (2 * remainder == d and quotient % 2 == 1):
+                quotient += 1
+            result.append(quotient)
+        else:
+            result.append(0)
+    return result
+
+
+def _to_list(column):
+    """计算结果转为 Python 列表（numpy 标量转为 int/float，便于写入 Excel）"""
+    return column.tolist() if numpy is not None else list(column)
+
+
+def compute_comparison_metrics(rows1, rows2, metrics=COMPARISON_METRICS):
+    """
+    按列一次性计算所有门店的对比指标
+    两个时期的汇总值先装入整数数组（金额为分，有 numpy 时用 numpy，否则用标准库 array），
+    比率、均价、差值全部整列计算，不经过字符串；格式化只在写入时进行
+
+    参数:
+        rows1, rows2: 两个时期的门店汇总行列表（下标对齐，缺失门店为空 dict）
+        metrics: 需要计算的指标名
+    返回:
+        (columns, errors)
+        columns: {指标名: (时期1列, 时期2列, 差值列)}，金额/均价为元，百分比为数值（分母为0时为 None，
+                 差值在两个时期分母都为0时为 None）
+        errors: {门店下标: 异常}
+    """
+    errors = {}
+    fields = sorted({field for metric in metrics for field in COMPARISON_METRICS[metric][1:]})
+    period_columns = (_load_period_columns(rows1, fields, errors), _load_period_columns(rows2, fields, errors))
+
+    columns = {}
+    for metric in metrics:
+        kind, *metric_fields = COMPARISON_METRICS[metric]
+        if kind == 'count':
+            v1, v2 = (period[metric_fields[0]] for period in period_columns)
+            columns[metric] = (_to_list(v1), _to_list(v2), _to_list(_column_op(lambda a, b: b - a, v1, v2)))
+        elif kind in ('amount', 'avg'):
+            if kind == 'amount':
+                cents = [period[metric_fields[0]] for period in period_columns]
+            else:
+                cents = [_half_even_div(period[metric_fields[0]], period[metric_fields[1]])
+                         for period in period_columns]
+            columns[metric] = (
+                _to_list(_column_op(lambda c: c / 100, cents[0])),
+                _to_list(_column_op(lambda c: c / 100, cents[1])),
+                _to_list(_column_op(lambda a, b: (b - a) / 100, *cents)),
+            )
+        else:
+            # 百分比以 0.1% 为单位的整数计算：分子 × 1000 / 分母
+            tenths, valid = [], []
+            for period in period_columns:
+                numerator, denominator = period[metric_fields[0]], period[metric_fields[1]]
+                tenths.append(_half_even_div(_column_op(lambda n: n * 1000, numerator), denominator))
+                valid.append(_to_list(_column_op(lambda d: d > 0, denominator)))
+            rates = [_to_list(_column_op(lambda t: t / 10, t)) for t in tenths]
+            diffs = _to_list(_column_op(lambda a, b: (b - a) / 10, *tenths))
+            columns[metric] = (
+                [rate if ok else None for rate, ok in zip(rates[0], valid[0])],
+                [rate if ok else None for rate, ok in zip(rates[1], valid[1])],
+                [diff if ok1 or ok2 else None for diff, ok1, ok2 in zip(diffs, valid[0], valid[1])],
+            )
+    return columns, errors
+
+
+def iter_comparison_chunks(shops, chunk_size=None):
+    """
+    把 iter_two_period_data 的门店流按块计算对比指标（每块 chunk_size 个门店，默认 REPORT_FETCH_CHUNK_ROWS）
+    产出: (块内第一个门店的序号(从0开始), [(shop_id, 时期1行, 时期2行), ...], columns, errors)
+          columns / errors 同 compute_comparison_metrics，下标为块内下标
+    """
+    chunk_size = chunk_size or REPORT_FETCH_CHUNK_ROWS
+    shops = iter(shops)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(shops, chunk_size))
+        if not chunk:
+            return
+        columns, errors = compute_comparison_metrics([p1 for _, p1, _ in chunk], [p2 for _, _, p2 in chunk])
+        yield start, chunk, columns, errors
+        start += len(chunk)
+
+
+def _format_metric(metric, value, rate_digits=1):
+    """时期值/差值的显示格式：百分比按 rate_digits 位小数加 %（分母为0显示 0%），其余原样"""
+    if COMPARISON_METRICS[metric][0] == 'rate':
+        return '0%' if value is None else f"{value:.{rate_digits}f}%"
+    return value
+
+
+def format_period(start, end):
+    """'YYYY-MM-DD' 起止日期 -> 'YYYY.MM.DD-YYYY.MM.DD'"""
+    return (f"{datetime.strptime(start, '%Y-%m-%d').strftime('%Y.%m.%d')}-"
+            f"{datetime.strptime(end, '%Y-%m-%d').strftime('%Y.%m.%d')}")
+
+
+def unique_sheet_name(name, sheet_names_used):
+    """清理 Sheet 名称并处理重名（重名时追加序号）"""
+    sheet_name = clean_sheet_name(name)
+    if sheet_name in sheet_names_used:
+        sheet_names_used[sheet_name] += 1
+        return f"{sheet_name[:28]}_{sheet_names_used[sheet_name]}"
+    sheet_names_used[sheet_name] = 1
+    return sheet_name
+
+
+def _setup_comparison_summary_sheet(ws, layout):
+    """设置汇总Sheet 列宽：门店信息列按布局，数据周期列=26，指标列=15（流式模式下必须在写入前设置）"""
+    key_columns = layout['key_columns']
+    for col, (_, width, _) in enumerate(key_columns, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    label_col = len(key_columns) + 1
+    ws.column_dimensions[get_column_letter(label_col)].width = 26
+    metric_count = max(len(block) for block in PERIOD_SUMMARY_BLOCKS)
+    for col in range(label_col + 1, label_col + metric_count + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 15
+
+
+def _comparison_summary_rows(layout, key_values, periods, columns, index):
+    """一个门店在汇总Sheet 中的8行：每个数据块依次为 表头、时期1、时期2、差值"""
+    key_count = len(layout['key_columns'])
+    blank = [''] * key_count
+    rows = []
+    for block_index, block in enumerate(PERIOD_SUMMARY_BLOCKS):
+        titles = [title for title, _ in block]
+        metrics = [metric for _, metric in block]
+        if block_index == 0:
+            rows.append([title for title, _, _ in layout['key_columns']] + ['数据周期'] + titles)
+            rows.append(list(key_values) + [periods[0]] + [
+                _format_metric(m, columns[m][0][index]) for m in metrics])
+        else:
+            rows.append(blank + ['数据周期'] + titles)
+            rows.append(blank + [periods[0]] + [_format_metric(m, columns[m][0][index]) for m in metrics])
+        rows.append(blank + [periods[1]] + [_format_metric(m, columns[m][1][index]) for m in metrics])
+        rows.append(blank + ['差值'] + [
+            _format_metric(m, columns[m][2][index], PERIOD_SUMMARY_RATE_DIGITS) for m in metrics])
+    return rows
+
+
+def _comparison_summary_styles(rows, label_col):
+    """汇总Sheet 行样式：表头行浅绿底加粗，差值行从数据周期列起红字"""
+    styles = []
+    for row_values in rows:
+        label = row_values[label_col - 1]
+        if label == '数据周期':
+            styles.append(['period_summary_header'] * len(row_values))
+        elif label == '差值':
+            styles.append(['plain'] * (label_col - 1) + ['period_summary_diff'] * (len(row_values) - label_col + 1))
+        else:
+            styles.append(['plain'] * len(row_values))
+    return styles
+
+
+def _write_comparison_detail_sheet(ws, shop_name, periods, columns, index):
+    """门店详细Sheet（竖向31行）：门店名、表头、指标行（分类标题行 A:D 合并）"""
+    rows = [
+        [shop_name, '', '', ''],
+        ['指标项/时间周期', periods[0], periods[1], '差值\n（红色为上升/黑色为下降）'],
+    ]
+    styles = [
+        ['detail_title', 'plain', 'plain', 'plain'],
+        ['detail_header'] * 4,
+    ]
+    section_rows = []
+    for label, metric in PERIOD_DETAIL_ROWS:
+        if metric is None:
+            rows.append([label, '', '', ''])
+            styles.append(['detail_header', 'plain', 'plain', 'plain'])
+            section_rows.append(len(rows))
+            continue
+        column1, column2, diffs = columns[metric]
+        diff = _format_metric(metric, diffs[index], PERIOD_DETAIL_RATE_DIGITS)
+        rows.append([label, _format_metric(metric, column1[index]), _format_metric(metric, column2[index]), diff])
+        styles.append(['detail_label', 'detail_value', 'detail_value',
+                       'detail_diff_up' if _is_positive(diff) else 'detail_value'])
+
+    # 列宽: A=25, B=36, C=36, D=20；行高：第1行=31，第2行到最后=20
+    for col, width in enumerate(PERIOD_DETAIL_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    ws.row_dimensions[1].height = 31
+    for row_num in range(2, len(rows) + 1):
+        ws.row_dimensions[row_num].height = 20
+
+    append_styled_rows(ws, rows, styles)
+
+    merge_report_cells(ws, 'A1:D1')
+    for row_num in section_rows:
+        merge_report_cells(ws, f'A{row_num}:D{row_num}')
+
+
+def _review_rate(numerator, denominator):
+    """评价分析Sheet 的百分比：保留1位小数加 %，分母为0显示 0%"""
+    return f"{numerator * 100 / denominator:.1f}%" if denominator else '0%'
+
+
+# 评价分析Sheet 门店、数据周期之后的列：(列标题, 列宽, 取值函数(时期汇总))
+REVIEW_SHEET_COLUMNS = (
+    ('新增评价数', 12, lambda r: r['review_count']),
+    ('点评评价数', 12, lambda r: r['dianping_count']),
+    ('美团评价数', 12, lambda r: r['meituan_count']),
+    ('5星', 8, lambda r: r['star5_count']),
+    ('4星', 8, lambda r: r['star4_count']),
+    ('3星', 8, lambda r: r['star3_count']),
+    ('2星', 8, lambda r: r['star2_count']),
+    ('1星', 8, lambda r: r['star1_count']),
+    ('好评率(4-5星)', 14, lambda r: _review_rate(r['star5_count'] + r['star4_count'], r['review_count'])),
+    ('差评数(1-2星)', 14, lambda r: r['star2_count'] + r['star1_count']),
+    ('已回复', 10, lambda r: r['reply_count']),
+    ('回复率', 10, lambda r: _review_rate(r['reply_count'], r['review_count'])),
+    ('平均回复时长(小时)', 18,
+     lambda r: round(r['reply_seconds'] / r['reply_count'] / 3600, 1) if r['reply_count'] else 0),
+    ('带图评价', 10, lambda r: r['pic_review_count']),
+    ('图片数', 10, lambda r: r['pic_count']),
+    ('带视频评价', 12, lambda r: r['video_review_count']),
+    ('视频数', 10, lambda r: r['video_count']),
+    ('消费后评价', 12, lambda r: r['after_consume_count']),
+    ('消费后评价占比', 14, lambda r: _review_rate(r['after_consume_count'], r['review_count'])),
+)
+
+
+def _write_review_sheet(ws, periods, review_stats):
+    """
+    评价分析Sheet：表头 + 每门店2行（时期1、时期2），门店列两行合并
+    review_stats 为 iter_review_period_stats 的产出，逐门店写入
+    返回: 写入的门店数
+    """
+    header = ['门店', '数据周期'] + [title for title, _, _ in REVIEW_SHEET_COLUMNS]
+    widths = [78, 26] + [width for _, width, _ in REVIEW_SHEET_COLUMNS]
+    for col, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    append_styled_rows(ws, [header], [['period_summary_header'] * len(header)])
+
+    shop_count = 0
+    for _, shop_name, stats1, stats2 in review_stats:
+        rows = [
+            [shop_name or '未知门店', periods[0]] + [value(stats1) for _, _, value in REVIEW_SHEET_COLUMNS],
+            ['', periods[1]] + [value(stats2) for _, _, value in REVIEW_SHEET_COLUMNS],
+        ]
+        append_styled_rows(ws, rows, [['plain'] * len(header)] * 2)
+        first_row = shop_count * 2 + 2
+        merge_report_cells(ws, f"A{first_row}:A{first_row + 1}")
+        shop_count += 1
+    return shop_count
+
+
+def _first_pic_url(pic_info):
+    """pic_info [{pic_id, pic_url, origin_pic_url}, ...] 中第一张图片的链接"""
+    if isinstance(pic_info, list) and pic_info and isinstance(pic_info[0], dict):
+        return pic_info[0].get('pic_url') or ''
+    return ''
+
+
+# 差评明细Sheet 的列：(列标题, 列宽, 取值函数(评价行))
+REVIEW_DETAIL_SHEET_COLUMNS = (
+    ('门店', 40, lambda r: r['shop_name'] or '未知门店'),
+    ('平台', 8, lambda r: REVIEW_PLATFORM_NAMES[r['platform']]),
+    ('评价时间', 20, lambda r: r['add_time']),
+    ('星级', 8, lambda r: r['star'] / 10),
+    ('评价内容', 60, lambda r: r.get('content') or ''),
+    ('图片数', 8, lambda r: r['pic_count'] or 0),
+    ('首图链接', 40, lambda r: _first_pic_url(r.get('pic_info'))),
+    ('商家回复', 40, lambda r: r.get('shop_reply') or ''),
+    ('回复时间', 20, lambda r: r['shop_reply_time'] or ''),
+    ('回复条数', 10, lambda r: len(r['reply_list']) if isinstance(r.get('reply_list'), list) else 0),
+)
+# 差评明细Sheet 按需读取的大字段（只针对展示的行）
+REVIEW_DETAIL_SHEET_LAZY_FIELDS = ('content', 'pic_info', 'shop_reply', 'reply_list')
+
+
+def _write_review_detail_sheet(ws, rows):
+    """差评明细Sheet：表头 + 每条评价一行（rows 已按需加载大字段）"""
+    header = [title for title, _, _ in REVIEW_DETAIL_SHEET_COLUMNS]
+    for col, (_, width, _) in enumerate(REVIEW_DETAIL_SHEET_COLUMNS, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    append_styled_rows(ws, [header], [['period_summary_header'] * len(header)])
+    append_styled_rows(ws, [[value(row) for _, _, value in REVIEW_DETAIL_SHEET_COLUMNS] for row in rows],
+                       [['plain'] * len(header)] * len(rows))
+
+
+# ==================== 多进程分片生成（门店详细Sheet）====================
+# 门店很多时，详细Sheet 的渲染（openpyxl 单线程）是主要耗时。分片模式下主进程只写汇总Sheet，
+# 并按门店顺序建立空白占位Sheet；门店按顺序切成 N 片，由 N 个子进程各自流式写入一个工作簿，
+# 最后把子工作簿中的工作表 XML 按顺序替换进主工作簿的占位工作表。
+# 所有报表工作簿按相同顺序预先登记样式（见 create_report_workbook），openpyxl 的字符串为内联字符串，
+# 因此工作表 XML 可以原样搬移
+REPORT_SHARD_WORKERS = int(os.environ.get('JX_REPORT_SHARD_WORKERS', 0))  # 分片进程数，0/1 表示不分片
+REPORT_SHARD_MIN_SHOPS = int(os.environ.get('JX_REPORT_SHARD_MIN_SHOPS', 200))  # 门店数达到此值才按上面的配置分片
+
+
+def _render_detail_shard(path, periods, shops, columns):
+    """
+    分片子进程：把一组门店的详细Sheet 流式写入独立工作簿
+    参数:
+        path: 输出路径
+        periods: 两个时期的显示文本
+        shops: [(门店名称, Sheet 名称), ...]
+        columns: 与 shops 下标对齐的指标列（结构同 compute_comparison_metrics）
+    返回:
+        [(shops 中的下标, 错误类型, 错误信息, 堆栈), ...]
+    """
+    wb = create_report_workbook(streaming=True)
+    errors = []
+    for index, (shop_name, sheet_name) in enumerate(shops):
+        ws = wb.create_sheet(title=sheet_name)
+        try:
+            _write_comparison_detail_sheet(ws, shop_name, periods, columns, index)
+        except Exception as e:
+            errors.append((index, type(e).__name__, str(e), traceback.format_exc()))
+    wb.save(path)
+    return errors
+
+
+def _is_style_prefix(main_styles, shard_styles):
+    """
+    分片样式表的每个列表（字体、填充、边框、单元格格式等）都是主样式表对应列表的前缀时，
+    分片工作表中的样式编号在主工作簿中含义相同
+    （主工作簿普通模式下合并单元格会追加边框样式，因此不要求完全相同）
+    """
+    main_root = ElementTree.fromstring(main_styles)
+    for shard_list in ElementTree.fromstring(shard_styles):
+        main_list = main_root.find(shard_list.tag)
+        if main_list is None:
+            return False
+        shard_items = [ElementTree.tostring(item) for item in shard_list]
+        main_items = [ElementTree.tostring(item) for item in main_list]
+        if main_items[:len(shard_items)] != shard_items:
+            return False
+    return True
+
+
+def _merge_shard_sheets(main_path, shard_paths, first_sheet, output_filename):
+    """
+    把分片工作簿中的工作表 XML 依次替换主工作簿的占位工作表，写出最终文件
+    first_sheet: 第一个占位工作表的序号（xl/worksheets/sheet<N>.xml）
+    """
+    with zipfile.ZipFile(main_path) as main:
+        styles = main.read('xl/styles.xml')
+        placeholder_count = sum(1 for name in main.namelist() if name.startswith('xl/worksheets/sheet')) - first_sheet + 1
+        shards = [zipfile.ZipFile(path) for path in shard_paths]
+        try:
+            sources = {}
+            for shard in shards:
+                if not _is_style_prefix(styles, shard.read('xl/styles.xml')):
+                    raise RuntimeError("分片工作簿的样式表与主工作簿不一致，无法合并")
+                sheet_count = sum(1 for name in shard.namelist() if name.startswith('xl/worksheets/sheet'))
+                for n in range(1, sheet_count + 1):
+                    sources[f'xl/worksheets/sheet{first_sheet + len(sources)}.xml'] = (shard, f'xl/worksheets/sheet{n}.xml')
+            if len(sources) != placeholder_count:
+                raise RuntimeError(f"分片工作表数量({len(sources)})与占位工作表数量({placeholder_count})不一致")
+
+            with zipfile.ZipFile(output_filename, 'w', zipfile.ZIP_DEFLATED) as out:
+                for item in main.infolist():
+                    source, name = sources.get(item.filename, (main, item.filename))
+                    with source.open(name) as src, out.open(item.filename, 'w') as dst:
+                        shutil.copyfileobj(src, dst)
+        finally:
+            for shard in shards:
+                shard.close()
+
+
+def save_sharded_workbook(wb, output_filename, periods, shops, columns, workers, progress_callback=None):
+    """
+    多进程渲染门店详细Sheet，与主工作簿合并后保存
+
+    参数:
+        wb: 主工作簿，最后 len(shops) 个工作表为按门店顺序创建的空白占位Sheet
+        output_filename: 输出文件名
+        periods: 两个时期的显示文本
+        shops: [(门店下标, 门店名称, Sheet 名称), ...]，与占位Sheet 一一对应，门店下标对应 columns
+        columns: compute_comparison_metrics 的结果
+        workers: 进程数
+        progress_callback: callable, 可选，每个分片完成时回调 progress_callback(已完成门店数, len(shops))
+    返回:
+        [(shops 中的下标, 错误类型, 错误信息, 堆栈), ...] 详细Sheet 渲染出错的门店
+    """
+    first_sheet = len(wb.worksheets) - len(shops) + 1
+    chunk_size = -(-len(shops) // workers)
+    chunks = [shops[start:start + chunk_size] for start in range(0, len(shops), chunk_size)]
+
+    errors = []
+    with tempfile.TemporaryDirectory(prefix='jx_report_') as tmp_dir:
+        main_path = os.path.join(tmp_dir, 'main.xlsx')
+        shard_paths = [os.path.join(tmp_dir, f'shard{n}.xlsx') for n in range(len(chunks))]
+
+        with ProcessPoolExecutor(max_workers=len(chunks), mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {}
+            offset = 0
+            for shard_path, chunk in zip(shard_paths, chunks):
+                # 每个分片只带自己门店的指标
+                shard_columns = {
+                    metric: tuple([column[index] for index, _, _ in chunk] for column in metric_columns)
+                    for metric, metric_columns in columns.items()
+                }
+                future = executor.submit(_render_detail_shard, shard_path, periods,
+                                         [(shop_name, sheet_name) for _, shop_name, sheet_name in chunk],
+                                         shard_columns)
+                futures[future] = (offset, len(chunk))
+                offset += len(chunk)
+
+            # 子进程渲染期间保存主工作簿
+            with metrics_span('save'):
+                wb.save(main_path)
+
+            done = 0
+            for future in as_completed(futures):
+                offset, size = futures[future]
+                errors.extend((offset + index, *error) for index, *error in future.result())
+                done += size
+                if progress_callback:
+                    progress_callback(done, len(shops))
+
+        with metrics_span('shards.merge', shards=len(chunks)):
+            _merge_shard_sheets(main_path, shard_paths, first_sheet, output_filename)
+
+    return sorted(errors)
+
+
+# ==================== 机器可读导出（CSV / NDJSON / Parquet）====================
+# 下游系统只需要数据时不构建 openpyxl 工作簿：报表导出为“每门店一行”的宽表，逐行流式写出。
+# 汇总Sheet 与门店详细Sheet 的指标都在这一行中，数值保持数值类型（金额为元，百分比为 x% 中的 x，
+# 分母为0的百分比为空值）；Parquet 需要可选依赖 pyarrow
+EXPORT_FORMATS = {
+    # 格式 -> (扩展名, MIME 类型)
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+    'ndjson': ('.ndjson', 'application/x-ndjson'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+EXPORT_PARQUET_BATCH_ROWS = 1000  # Parquet 每批写入的行数
+
+# 日报导出列：门店信息列 + 取自查询行的计数/金额字段（NULL 按0，与 Excel 报表一致）+ 其余列
+# (列名, 类型)，类型为 str / int / float / bool
+DAILY_EXPORT_COLUMNS = (
+    (('report_date', 'str'), ('seq', 'int'), ('shop_id', 'int'), ('shop_name', 'str'),
+     ('operator', 'str'), ('city', 'str'), ('sales', 'str'),
+     ('region_city', 'str'), ('region_district', 'str'), ('region_business', 'str'))
+    + tuple((field, 'int') for field in DAILY_COUNT_FIELDS)
+    + tuple((field, 'float') for field in DAILY_AMOUNT_FIELDS)
+    + (('intent_rate', 'str'), ('order_user_rank', 'int'), ('verify_amount_rank', 'int'),
+       ('review_rate', 'float'), ('review_qualified', 'bool'), ('collect_rate', 'float'), ('collect_qualified', 'bool'),
+       ('coupon_orders_7days', 'int'), ('coupon_qualified', 'bool'), ('ad_orders_today', 'int'), ('ad_qualified', 'bool'))
+)
+
+
+def check_export_format(format):
+    """校验导出格式（不区分大小写，为空时为 xlsx），返回规范化的格式名"""
+    fmt = (format or 'xlsx').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {format}（可选: {', '.join(EXPORT_FORMATS)}）")
+    if fmt == 'parquet':
+        try:
+            import pyarrow.parquet  # noqa: F401  可选依赖，只在导出 Parquet 时加载
+        except ImportError:
+            raise ValueError("导出 Parquet 需要安装 pyarrow（pip install pyarrow）") from None
+    return fmt
+
+
+def export_filename(filename, format):
+    """把默认文件名的扩展名换成导出格式对应的扩展名"""
+    return os.path.splitext(filename)[0] + EXPORT_FORMATS[format][0]
+
+
+def _export_value(value, column_type):
+    """导出值转为列类型对应的 Python 类型（Decimal -> float 等），None 保持为空值"""
+    if value is None:
+        return None
+    if column_type == 'int':
+        return int(value)
+    if column_type == 'float':
+        return float(value)
+    if column_type == 'bool':
+        return bool(value)
+    return str(value)
+
+
+def write_export_table(output_filename, format, columns, rows):
+    """
+    把一张表逐行流式写入 CSV / NDJSON / Parquet 文件，不在内存中保留整张表
+
+    参数:
+        output_filename: 输出文件名
+        format: csv / ndjson / parquet
+        columns: [(列名, 类型), ...]，类型为 str / int / float / bool
+        rows: 与 columns 对齐的行元组的可迭代对象（可以是生成器）
+    返回:
+        int: 写入的行数
+    """
+    names = [name for name, _ in columns]
+    types = [column_type for _, column_type in columns]
+    count = 0
+
+    if format == 'parquet':
+        import pyarrow
+        import pyarrow.parquet
+
+        arrow_types = {'str': pyarrow.string(), 'int': pyarrow.int64(), 'float': pyarrow.float64(),
+                       'bool': pyarrow.bool_()}
+        schema = pyarrow.schema([(name, arrow_types[column_type]) for name, column_type in columns])
+
+        def write_batch(writer, batch):
+            arrays = [pyarrow.array([_export_value(row[i], column_type) for row in batch], type=arrow_types[column_type])
+                      for i, column_type in enumerate(types)]
+            writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+
+        with pyarrow.parquet.ParquetWriter(output_filename, schema) as writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= EXPORT_PARQUET_BATCH_ROWS:
+                    write_batch(writer, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                write_batch(writer, batch)
+                count += len(batch)
+        return count
+
+    with open(output_filename, 'w', encoding='utf-8', newline='') as f:
+        if format == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in map(_export_value, row, types)])
+                count += 1
+        elif format == 'ndjson':
+            for row in rows:
+                f.write(json.dumps(dict(zip(names, map(_export_value, row, types))), ensure_ascii=False))
+                f.write('\n')
+                count += 1
+        else:
+            raise ValueError(f"不支持的导出格式: {format}")
+    return count
+
+
+def _daily_export_rows(rows, report_date, shop_mapping, region_mapping, coupon_7days_mapping, total=None,
+                       progress_callback=None):
+    """日报导出行（与 DAILY_EXPORT_COLUMNS 对齐），每门店一行；rows 可以是流式读取的行"""
+    for idx, row in enumerate(rows, start=1):
+        if progress_callback:
+            progress_callback(idx - 1, total)
+
+        record = DailyShopRecord(row)
+        shop_id = str(record.shop_id)
+        shop_info = shop_mapping.get(shop_id, {})
+        region_info = region_mapping.get(shop_id, {})
+        city = shop_info.get('city', '')
+        checks = daily_quality_checks(record, coupon_7days_mapping.get(shop_id, 0))
+        review_rate, review_ok = checks['review_rate']
+        collect_rate, collect_ok = checks['collect_rate']
+
+        yield (
+            report_date, idx, record.shop_id, record.shop_name,
+            shop_info.get('operator', ''), city, shop_info.get('sales', ''),
+            region_info.get('city', city), region_info.get('district', ''), region_info.get('business', ''),
+            *(getattr(record, field) for field in DAILY_COUNT_FIELDS),
+            *(getattr(record, field) for field in DAILY_AMOUNT_FIELDS),
+            record.intent_rate, record.order_user_rank, record.verify_amount_rank,
+            None if review_rate is None else round(review_rate, 1), review_ok,
+            None if collect_rate is None else round(collect_rate, 1), collect_ok,
+            *checks['coupon_7days'], *checks['ad_today'],
+        )
+
+
+def comparison_export_columns(metrics=COMPARISON_METRICS):
+    """对比报表导出列：门店信息、两个时期起止日期，以及每个指标的 _p1 / _p2 / _diff 三列"""
+    columns = [('shop_id', 'int'), ('shop_name', 'str'), ('operator', 'str'), ('city', 'str'), ('sales', 'str'),
+               ('period1_start', 'str'), ('period1_end', 'str'), ('period2_start', 'str'), ('period2_end', 'str')]
+    for metric in metrics:
+        column_type = 'int' if COMPARISON_METRICS[metric][0] == 'count' else 'float'
+        columns.extend((f'{metric}_{suffix}', column_type) for suffix in ('p1', 'p2', 'diff'))
+    return columns
+
+
+def _comparison_export_rows(layout, chunks, shop_mapping, dates, error_shops, total=None, progress_callback=None):
+    """
+    对比报表导出行（与 comparison_export_columns 对齐），按 iter_comparison_chunks 的块逐门店产出
+    汇总值无法转换的门店跳过，打印调试信息并记入 error_shops
+    """
+    for start, chunk, columns, metric_errors in chunks:
+        metric_columns = list(columns.values())
+        for offset, (shop_id, p1, p2) in enumerate(chunk):
+            if progress_callback:
+                progress_callback(start + offset, total)
+            shop_name = p2.get('shop_name') or p1.get('shop_name', '未知门店')
+            if offset in metric_errors:
+                _record_shop_error(layout, error_shops, shop_id, shop_name, p1, p2, metric_errors[offset])
+                continue
+            shop_info = shop_mapping.get(str(shop_id), {})
+            yield (
+                shop_id, shop_name,
+                shop_info.get('operator') or None, shop_info.get('city') or None, shop_info.get('sales') or None,
+                *dates,
+                *(column[offset] for metric in metric_columns for column in metric),
+            )
+
+
+def _print_shop_error(layout, shop_id, shop_name, p1, p2, error_type, message, trace_text):
+    """打印门店处理出错的调试信息：错误、两个时期的原始数据、堆栈"""
+    print(f"\n{'❌' * 30}")
+    print(f"❌ 处理门店时出错: {shop_name} (ID: {shop_id})")
+    print(f"❌ 错误类型: {error_type}")
+    print(f"❌ 错误信息: {message}")
+    print(f"{'❌' * 30}")
+
+    debug_print_row(shop_id, shop_name, p1, layout['period_labels'][0])
+    debug_print_row(shop_id, shop_name, p2, layout['period_labels'][1])
+
+    print("\n📋 完整错误堆栈:")
+    sys.stderr.write(trace_text)
+
+
+def _print_error_summary(error_shops):
+    """打印处理失败的门店列表"""
+    if error_shops:
+        print(f"\n{'=' * 60}")
+        print(f"⚠️ 警告: 有 {len(error_shops)} 个门店处理失败:")
+        for err in error_shops:
+            print(f"  - {err['shop_name']} (ID: {err['shop_id']}): {err['error']}")
+        print(f"{'=' * 60}")
+
+
+def _record_shop_error(layout, error_shops, shop_id, shop_name, p1, p2, e):
+    """门店处理出错：打印调试信息并记入 error_shops"""
+    _print_shop_error(layout, shop_id, shop_name, p1, p2, type(e).__name__, str(e),
+                      ''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+    error_shops.append({
+        'shop_id': shop_id,
+        'shop_name': shop_name,
+        'error': str(e),
+        'p1_data': p1,
+        'p2_data': p2
+    })
+
+
+def _comparison_filename(layout, period2_start, period2_end, shop_count):
+    """对比报表默认文件名"""
+    return layout['filename'].format(
+        start=period2_start.replace('-', ''), end=period2_end.replace('-', ''),
+        shop_count=shop_count, now=datetime.now().strftime('%Y%m%d%H%M%S'))
+
+
+def _export_comparison_report(layout, output_filename, format, chunks, shop_mapping, dates, total=None,
+                              progress_callback=None):
+    """
+    对比报表的机器可读导出：逐块计算指标、每门店一行流式写出
+    未指定文件名时先写临时文件，写完后按门店数命名（默认文件名含门店数）
+    """
+    error_shops = []
+    target = output_filename or f".{uuid.uuid4().hex}{EXPORT_FORMATS[format][0]}.part"
+    try:
+        with metrics_span(f'export.{format}') as span:
+            span['rows'] = rows_written = write_export_table(
+                target, format, comparison_export_columns(),
+                _comparison_export_rows(layout, chunks, shop_mapping, dates, error_shops, total, progress_callback))
+        shop_count = rows_written + len(error_shops)
+        if not output_filename:
+            output_filename = export_filename(_comparison_filename(layout, dates[2], dates[3], shop_count), format)
+            os.replace(target, output_filename)
+    finally:
+        if target != output_filename and os.path.exists(target):
+            os.remove(target)
+
+    if progress_callback:
+        progress_callback(shop_count, shop_count)
+
+    print(f"📊 找到 {shop_count} 个门店数据")
+    _print_error_summary(error_shops)
+    print(f"✅ {layout['name']}导出成功: {output_filename}（{format}，共 {rows_written} 个门店）")
+    return output_filename
+
+
+def generate_comparison_report(layout, period1_start, period1_end, period2_start, period2_end, shop_ids=None,
+                               output_filename=None, streaming=False, progress_callback=None, workers=None,
+                               format='xlsx', accounts=None):
+    """
+    按布局生成两个时期对比报表（周报/月报/自定义报表共用）
+    - Sheet 1: 汇总 - 每门店8行的横向结构
+    - Sheet 2-N: 门店详细 - 竖向31行结构
+
+    门店数据由无缓冲游标按块读取（iter_two_period_data），每块算好指标后立即写入，
+    数据读取、指标计算与写入交替进行，不在内存中保留全部门店的数据（分片模式除外）
+
+    参数:
+        layout: dict, COMPARISON_REPORT_LAYOUTS 中的布局
+        period1_start, period1_end: str, 第一个时期起止日期 'YYYY-MM-DD'
+        period2_start, period2_end: str, 第二个时期起止日期 'YYYY-MM-DD'
+        shop_ids: list, 门店ID列表，为空则查询所有门店
+        output_filename: str, 输出文件名，为空时按布局生成
+        streaming: bool, 是否使用流式写入（write-only）模式
+        progress_callback: callable, 可选，进度回调 progress_callback(已处理门店数, 门店总数)
+        workers: int, 门店详细Sheet 分片渲染的进程数（>1 时分片），为空时门店数达到
+                 REPORT_SHARD_MIN_SHOPS 才按 REPORT_SHARD_WORKERS 分片
+        format: str, xlsx（默认）/ csv / ndjson / parquet，非 xlsx 时不构建工作簿，
+                每门店一行导出（见 write_export_table）
+        accounts: list, 可选，账号列表，只统计这些账号下的门店（与 shop_ids 同时提供时取交集）
+    """
+    format = check_export_format(format)
+    shop_ids = resolve_shop_filter(shop_ids, accounts)
+    if shop_ids is not None and not shop_ids:
+        print("警告：没有匹配的门店")
+        return None
+    shop_mapping = get_shop_info_mapping(accounts)
+    dates = (period1_start, period1_end, period2_start, period2_end)
+
+    conn = get_db_connection()
+
+    try:
+        # 门店总数只在需要提前知道时查询：进度回调的总数、按门店数决定是否分片
+        if workers is None:
+            workers = REPORT_SHARD_WORKERS if format == 'xlsx' and REPORT_SHARD_WORKERS > 1 else 0
+            check_shard_min_shops = workers > 1
+        else:
+            check_shard_min_shops = False
+        total = None
+        if progress_callback or check_shard_min_shops:
+            total = count_period_shops(conn, *dates, shop_ids=shop_ids)
+            if check_shard_min_shops and total < REPORT_SHARD_MIN_SHOPS:
+                workers = 0
+
+        # 单次查询同时获取两个时期的数据，按块读取并计算指标
+        chunks = peek_nonempty(iter_comparison_chunks(iter_two_period_data(
+            conn, *dates, group_fields=layout['group_fields'], shop_ids=shop_ids)))
+        if chunks is None:
+            print("警告：没有找到数据")
+            return None
+
+        if format != 'xlsx':
+            return _export_comparison_report(layout, output_filename, format, chunks, shop_mapping, dates, total,
+                                             progress_callback)
+
+        # 创建 Excel
+        wb = create_report_workbook(streaming)
+        if streaming:
+            ws_summary = wb.create_sheet(layout['summary_sheet'])
+        else:
+            ws_summary = wb.active
+            ws_summary.title = layout['summary_sheet']
+        _setup_comparison_summary_sheet(ws_summary, layout)
+        label_col = len(layout['key_columns']) + 1
+
+        periods = (format_period(period1_start, period1_end), format_period(period2_start, period2_end))
+
+        # 评价分析/差评明细Sheet 紧跟汇总Sheet（门店详细Sheet 须在最后，分片模式按顺序替换）；
+        # 门店数据的无缓冲游标正占用 conn，评价查询使用单独的连接
+        if layout.get('review_sheet') or layout.get('review_detail_sheet'):
+            review_conn = get_db_connection()
+            try:
+                if layout.get('review_sheet'):
+                    review_stats = peek_nonempty(iter_review_period_stats(review_conn, *dates, shop_ids=shop_ids))
+                    if review_stats is not None:
+                        with metrics_span('reviews'):
+                            review_shops = _write_review_sheet(wb.create_sheet(layout['review_sheet']), periods,
+                                                               review_stats)
+                        print(f"📊 评价分析：{review_shops} 个门店有评价")
+                if layout.get('review_detail_sheet'):
+                    with metrics_span('reviews.detail') as span:
+                        bad_reviews, truncated = get_bad_reviews(review_conn, period2_start, period2_end, shop_ids)
+                        span['rows'] = len(bad_reviews)
+                        if bad_reviews:
+                            load_review_lazy_fields(review_conn, bad_reviews, REVIEW_DETAIL_SHEET_LAZY_FIELDS)
+                            _write_review_detail_sheet(wb.create_sheet(layout['review_detail_sheet']), bad_reviews)
+                    if truncated:
+                        print(f"⚠️ 差评明细超过 {REVIEW_DETAIL_MAX_ROWS} 条，只展示前 {REVIEW_DETAIL_MAX_ROWS} 条")
+            finally:
+                review_conn.close()
+
+        shard_workers = workers if workers > 1 else 0
+        detail_jobs = []  # 分片模式下待渲染的详细Sheet：(分片指标下标, 门店名称, Sheet 名称)
+        shard_shops = []  # 与 detail_jobs 对齐的 (门店ID, 时期1行, 时期2行)，分片渲染出错时打印调试信息
+        shard_columns = {metric: ([], [], []) for metric in COMPARISON_METRICS}  # 与 detail_jobs 对齐的指标列
+
+        sheet_names_used = {}
+        summary_row_count = 0
+        shop_count = 0
+        error_shops = []
+
+        loop_start = time.perf_counter()
+        for start, chunk, columns, metric_errors in chunks:
+            for offset, (shop_id, p1, p2) in enumerate(chunk):
+                index = start + offset
+                if progress_callback and not shard_workers:
+                    progress_callback(index, total)
+
+                shop_name = p2.get('shop_name') or p1.get('shop_name', '未知门店')
+
+                try:
+                    if offset in metric_errors:
+                        raise metric_errors[offset]
+
+                    shop_info = shop_mapping.get(str(shop_id), {})
+                    key_source = {
+                        'seq': index + 1,
+                        'operator': shop_info.get('operator', '--') or '--',
+                        'city': shop_info.get('city', '--') or '--',
+                        'sales': shop_info.get('sales', '--') or '--',
+                        'shop_name': shop_name,
+                    }
+                    key_values = [key_source[source] for _, _, source in layout['key_columns']]
+
+                    # ==================== 汇总Sheet: 8行/门店 ====================
+                    summary_rows = _comparison_summary_rows(layout, key_values, periods, columns, offset)
+                    append_styled_rows(ws_summary, summary_rows, _comparison_summary_styles(summary_rows, label_col))
+                    # 门店信息列：门店名行到差值行合并
+                    for col in range(1, label_col):
+                        col_letter = get_column_letter(col)
+                        merge_report_cells(
+                            ws_summary,
+                            f"{col_letter}{summary_row_count + 2}:{col_letter}{summary_row_count + len(summary_rows)}")
+                    summary_row_count += len(summary_rows)
+
+                    # ==================== 门店详细Sheet（竖向31行）====================
+                    sheet_name = unique_sheet_name(shop_name, sheet_names_used)
+                    if shard_workers:
+                        # 分片模式：先建空白占位Sheet，内容由子进程渲染后合并（需保留该门店的指标）
+                        wb.create_sheet(title=sheet_name)
+                        detail_jobs.append((len(shard_shops), shop_name, sheet_name))
+                        shard_shops.append((shop_id, p1, p2))
+                        for metric, metric_columns in columns.items():
+                            for target, column in zip(shard_columns[metric], metric_columns):
+                                target.append(column[offset])
+                    else:
+                        ws_detail = wb.create_sheet(title=sheet_name)
+                        _write_comparison_detail_sheet(ws_detail, shop_name, periods, columns, offset)
+
+                except Exception as e:
+                    # 捕获错误并打印详细调试信息
+                    _record_shop_error(layout, error_shops, shop_id, shop_name, p1, p2, e)
+                    continue
+            shop_count += len(chunk)
+
+        record_span('rows.loop', time.perf_counter() - loop_start, shops=shop_count)
+        print(f"📊 找到 {shop_count} 个门店数据")
+
+        # 保存文件
+        if not output_filename:
+            output_filename = _comparison_filename(layout, period2_start, period2_end, shop_count)
+
+        if shard_workers and detail_jobs:
+            print(f"📦 门店详细Sheet 分 {min(shard_workers, len(detail_jobs))} 个进程渲染")
+            with metrics_span('shards', workers=shard_workers, shops=len(detail_jobs)):
+                shard_errors = save_sharded_workbook(wb, output_filename, periods, detail_jobs, shard_columns,
+                                                     shard_workers, progress_callback)
+            # 渲染出错的门店保留（可能不完整的）详细Sheet，汇总Sheet 不受影响
+            for position, error_type, message, trace_text in shard_errors:
+                _, shop_name, _ = detail_jobs[position]
+                shop_id, p1, p2 = shard_shops[position]
+                _print_shop_error(layout, shop_id, shop_name, p1, p2, error_type, message, trace_text)
+                error_shops.append({
+                    'shop_id': shop_id,
+                    'shop_name': shop_name,
+                    'error': message,
+                    'p1_data': p1,
+                    'p2_data': p2
+                })
+        else:
+            with metrics_span('save'):
+                wb.save(output_filename)
 
-    try:
-        # 计算7天前的日期
-        end_date = datetime.strptime(report_date, '%Y-%m-%d')
-        start_date = end_date - timedelta(days=6)
-
-        sql = """
-        SELECT COALESCE(SUM(coupon_pay_order_count), 0) as total
-        FROM kewen_daily_report
-        WHERE shop_id = %s
-          AND report_date BETWEEN %s AND %s
-        """
+        if progress_callback:
+            progress_callback(shop_count, shop_count)
 
-        cursor.execute(sql, (shop_id, start_date.strftime('%Y-%m-%d'), report_date))
-        result = cursor.fetchone()
+        # 打印汇总信息
+        _print_error_summary(error_shops)
 
-        return int(result['total']) if result and result['total'] else 0
+        print(f"✅ {layout['name']}生成成功: {output_filename}")
+        return output_filename
 
     finally:
-        cursor.close()
         conn.close()
 
 
-def get_ad_orders_last_7days(shop_id, report_date):
-    """
-    获取近7天广告单总数
-    参数:
-        shop_id: 门店ID
-        report_date: 报表日期 (str 'YYYY-MM-DD')
-    返回: int 近7天广告单总数
-    数据来源: store_stats.ad_order_count
-    """
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        # 计算7天前的日期
-        end_date = datetime.strptime(report_date, '%Y-%m-%d')
-        start_date = end_date - timedelta(days=6)
-
-        sql = """
-        SELECT COALESCE(SUM(ad_order_count), 0) as total
-        FROM store_stats
-        WHERE store_id = %s
-          AND date BETWEEN %s AND %s
-        """
-
-        cursor.execute(sql, (shop_id, start_date.strftime('%Y-%m-%d'), report_date))
-        result = cursor.fetchone()
+# ==================== 核心功能：生成日报 ====================
+# 日报主查询：关联 kewen_daily_report + promotion_daily_report + store_stats（WHERE / ORDER BY 由调用方追加）
+DAILY_REPORT_SQL = """
+    SELECT
+        k.report_date,
+        k.shop_id,
+        k.shop_name,
+        k.exposure_users,
+        k.visit_users,
+        k.order_users,
+        k.verify_person_count as verify_users,
+        k.order_coupon_count,
+        k.verify_coupon_count,
+        k.promotion_cost,
+        k.new_good_review_count,
+        k.new_review_count,
+        k.new_collect_users,
+        k.consult_users,
+        k.intent_rate,
+        k.order_sale_amount,
+        k.verify_sale_amount,
+        k.verify_after_discount,
+        p.view_phone_count as phone_clicks,
+        p.view_address_count as address_clicks,
+        p.click_avg_price,
+        p.order_count as promotion_order_count,
+        s.order_user_rank,
+        s.verify_amount_rank,
+        s.checkin_count,
+        s.ad_balance,
+        s.ad_order_count,
+        s.is_force_offline
+    FROM kewen_daily_report k
+    LEFT JOIN promotion_daily_report p
+        ON k.shop_id = p.shop_id AND k.report_date = p.report_date
+    LEFT JOIN store_stats s
+        ON k.shop_id = s.store_id AND k.report_date = s.date
+"""
 
-        return int(result['total']) if result and result['total'] else 0
 
-    finally:
-        cursor.close()
-        conn.close()
+def daily_report_filename(report_date, format='xlsx'):
+    """日报默认文件名"""
+    return (f"日报 非餐 {report_date.replace('-', '')} "
+            f"{datetime.now().strftime('%Y%m%d%H%M%S')}{EXPORT_FORMATS[format][0]}")
 
 
-def get_ad_orders_today(shop_id, report_date):
+def _write_daily_report(report_date, rows, shop_mapping, region_mapping, coupon_7days_mapping,
+                        output_filename=None, streaming=False, progress_callback=None, format='xlsx', total=None):
     """
-    获取当天广告单数量
+    把一天的日报查询行写成报表文件（单日生成与日期范围生成共用）
     参数:
-        shop_id: 门店ID
-        report_date: 报表日期 (str 'YYYY-MM-DD')
-    返回: int 当天广告单数量
-    数据来源: store_stats.ad_order_count
+        rows: 非空的查询行（可以是流式读取的行），按 shop_id 排序
+        coupon_7days_mapping: 当天的近7天优惠码订单映射 {shop_id(str): 订单数}
+        total: 门店总数（仅用于进度回调，可为 None）
+    返回:
+        str: 生成的文件路径
     """
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        sql = """
-        SELECT COALESCE(ad_order_count, 0) as total
-        FROM store_stats
-        WHERE store_id = %s
-          AND date = %s
-        """
-
-        cursor.execute(sql, (shop_id, report_date))
-        result = cursor.fetchone()
-
-        return int(result['total']) if result and result['total'] else 0
+    if format != 'xlsx':
+        # 机器可读导出：不构建工作簿，每门店一行流式写出
+        output_filename = output_filename or daily_report_filename(report_date, format)
+        with metrics_span(f'export.{format}') as span:
+            span['rows'] = shop_count = write_export_table(
+                output_filename, format, DAILY_EXPORT_COLUMNS,
+                _daily_export_rows(rows, report_date, shop_mapping, region_mapping, coupon_7days_mapping,
+                                   total, progress_callback))
+        if progress_callback:
+            progress_callback(shop_count, shop_count)
+        print(f"✅ 日报导出成功: {output_filename}（{format}，共 {shop_count} 个门店）")
+        return output_filename
 
-    finally:
-        cursor.close()
-        conn.close()
+    # 1. 创建 Excel 工作簿
+    wb = create_report_workbook(streaming)
 
+    # ==================== Sheet 1: 汇总 ====================
+    if streaming:
+        ws_summary = wb.create_sheet("汇总")
+    else:
+        ws_summary = wb.active
+        ws_summary.title = "汇总"
 
-def clean_sheet_name(name, max_length=31):
-    """
-    清理 Sheet 名称，符合 Excel 规范
-    - 最大 31 字符
-    - 不能包含: \ / * ? : [ ]
-    """
-    if not name:
-        return "Sheet"
+    # 格式化日期
+    date_obj = datetime.strptime(report_date, '%Y-%m-%d')
+    weekday_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+    weekday = weekday_names[date_obj.weekday()]
+    date_str = date_obj.strftime('%m月%d日')
+    date_short = date_obj.strftime('%m/%d')
+
+    # 汇总表头
+    summary_headers = [
+        '星期', '日期', '序号', '运营', '城市', '销售', '门店',
+        '曝光人数', '访问人数', '下单人数', '核销人数', '下单券数', '核销券数',
+        '电话点击', '地址点击', '推广通消耗', '好评', '意向转化率',
+        '下单售价金额', '核销售价金额', '优惠后核销金额',
+        '下单人数商圈排名', '核销金额商圈排名'
+    ]
+
+    # 设置汇总表列宽（G列门店改为46）- 流式模式下必须在写入第一行之前设置
+    summary_widths = [6, 8, 5, 12, 8, 8, 46, 10, 10, 10, 10, 10, 10, 10, 10, 12, 8, 12, 12, 12, 12, 14, 14]
+    for col_idx, width in enumerate(summary_widths, start=1):
+        ws_summary.column_dimensions[get_column_letter(col_idx)].width = width
+
+    append_styled_rows(ws_summary, [summary_headers], [['daily_summary_header'] * len(summary_headers)])
+
+    # 用于处理重名 Sheet
+    sheet_names_used = {}
+
+    # 2. 为每个门店写入汇总行 + 创建详细Sheet
+    shop_count = 0
+    loop_start = time.perf_counter()
+    for idx, row in enumerate(rows, start=1):
+        if progress_callback:
+            progress_callback(idx - 1, total)
+        shop_count = idx
+
+        record = DailyShopRecord(row)
+        shop_id = str(record.shop_id)
+        shop_name = record.shop_name
+
+        # 从映射中获取运营、城市、销售
+        shop_info = shop_mapping.get(shop_id, {})
+        operator = shop_info.get('operator', '')
+        sales = shop_info.get('sales', '')
+        city = shop_info.get('city', '')
+
+        # 获取商圈信息
+        region_info = region_mapping.get(shop_id, {})
+        region_city = region_info.get('city', city)
+        region_district = region_info.get('district', '')
+        region_business = region_info.get('business', '')
+
+        # 格式化商圈排名
+        order_rank = record.order_user_rank
+        verify_rank = record.verify_amount_rank
+        order_rank_str = f"第{order_rank}名" if order_rank and order_rank < 100 else (
+            "大于100名" if order_rank and order_rank >= 100 else "--")
+        verify_rank_str = f"第{verify_rank}名" if verify_rank and verify_rank < 100 else (
+            "大于100名" if verify_rank and verify_rank >= 100 else "--")
+
+        # 写入汇总数据行
+        summary_row = [
+            weekday,
+            date_str,
+            idx,
+            operator,
+            city,
+            sales,
+            shop_name,
+            record.exposure_users,
+            record.visit_users,
+            record.order_users,
+            record.verify_users,
+            record.order_coupon_count,
+            record.verify_coupon_count,
+            record.phone_clicks,
+            record.address_clicks,
+            record.promotion_cost,
+            record.new_good_review_count,
+            record.intent_rate or '0%',
+            record.order_sale_amount,
+            record.verify_sale_amount,
+            record.verify_after_discount,
+            order_rank_str,
+            verify_rank_str
+        ]
+        append_styled_rows(ws_summary, [summary_row], [['plain'] * len(summary_row)])
+
+        # ==================== Sheet 2-N: 门店详细（竖向表格）====================
+        # 创建详细 Sheet（清理名称并处理重名）
+        ws_detail = wb.create_sheet(title=unique_sheet_name(shop_name, sheet_names_used))
+
+        # 计算达标状态（留评率、收藏率、近7天优惠码订单、当天广告单）
+        checks = daily_quality_checks(record, coupon_7days_mapping.get(shop_id, 0))
+        review_rate, review_ok = checks['review_rate']
+        collect_rate, collect_ok = checks['collect_rate']
+        coupon_7days, coupon_ok = checks['coupon_7days']
+        ad_today, ad_ok = checks['ad_today']
+        review_rate_str = f"{review_rate or 0:.1f}%"
+        review_qualified = "达标" if review_ok else "未达标"
+        collect_rate_str = f"{collect_rate or 0:.1f}%"
+        collect_qualified = "达标" if collect_ok else "未达标"
+        coupon_qualified = "达标" if coupon_ok else "未达标"
+        ad_qualified = "达标" if ad_ok else "未达标"
+
+        # 强制下线状态信息
+        is_force_offline = record.is_force_offline
+        if is_force_offline > 0:
+            status_info = f"⚠️ 警告：有{is_force_offline}个团单被强制下线！"
+        else:
+            status_info = "今天邮件已查看，无违规无异常。"
+
+        # 商圈排名显示（格式：城市 | 区 | 商圈：第X名）
+        region_display = f"{region_city} | {region_district} | {region_business}" if region_business else city
+        order_rank_display = f"{region_display}：第{order_rank}名" if order_rank and order_rank < 100 else f"{region_display}：大于100名"
+        verify_rank_display = f"{region_display}：第{verify_rank}名" if verify_rank and verify_rank < 100 else f"{region_display}：大于100名"
+
+        # 构建竖向表格数据
+        detail_data = [
+            [shop_name, status_info, ''],
+            [f"数据报表", f"日期({date_short})", ''],
+            ['【美团点评广告结果数据】', '', ''],
+            ['曝光人数：', record.exposure_users, ''],
+            ['访问人数：', record.visit_users, ''],
+            ['下单人数：', record.order_users, ''],
+            ['下单券数：', record.order_coupon_count, ''],
+            ['核销人数：', record.verify_users, ''],
+            ['核销券数：', record.verify_coupon_count, ''],
+            ['电话点击：', record.phone_clicks, ''],
+            ['地址点击：', record.address_clicks, ''],
+            ['在线咨询：', record.consult_users, ''],
+            ['', '', ''],
+            ['【店内干预数据】', '', ''],
+            ['新增收藏：', record.new_collect_users, ''],
+            ['新增打卡：', record.checkin_count, ''],
+            ['新增评价：', record.new_review_count, ''],
+            ['', '', ''],
+            ['【推广通数据】', '', ''],
+            ['推广通消耗：', record.promotion_cost, ''],
+            ['推广通点击单价：', record.click_avg_price, ''],
+            ['推广通下单量：', record.promotion_order_count, ''],
+            ['推广通余额：', record.ad_balance, ''],
+            ['', '', ''],
+            [f'留评率（30%达标）：', review_rate_str, review_qualified],
+            [f'收藏率（40%达标）：', collect_rate_str, collect_qualified],
+            [f'近7天优惠码订单是否达标：', coupon_7days, coupon_qualified],
+            [f'广告单：', f"当天{ad_today}单", ad_qualified],
+            ['', '', ''],
+            ['下单售价金额：', record.order_sale_amount, ''],
+            ['核销售价金额：', record.verify_sale_amount, ''],
+            ['下单人数商圈排名：', order_rank_display, ''],
+            ['核销金额商圈排名：', verify_rank_display, ''],
+            ['', '', ''],
+            ['团单被强制下线数量：', is_force_offline, ''],
+            ['', '', ''],
+            ['运营：', operator, ''],
+            ['销售：', sales, ''],
+            ['城市：', city, ''],
+        ]
 
-    # 替换非法字符
-    illegal_chars = ['\\', '/', '*', '?', ':', '[', ']']
-    for char in illegal_chars:
-        name = name.replace(char, '')
+        # 设置详细Sheet样式（A列宽改为40）
+        ws_detail.column_dimensions['A'].width = 40
+        ws_detail.column_dimensions['B'].width = 30
+        ws_detail.column_dimensions['C'].width = 15
 
-    # 截断到最大长度
-    if len(name) > max_length:
-        name = name[:max_length]
+        # 每个单元格写入时一次性带上最终样式
+        append_styled_rows(ws_detail, detail_data, [
+            _daily_detail_row_styles(row_num, row_data, is_force_offline)
+            for row_num, row_data in enumerate(detail_data, start=1)
+        ])
 
-    return name or "Sheet"
+    record_span('rows.loop', time.perf_counter() - loop_start, shops=shop_count)
+    if progress_callback:
+        progress_callback(shop_count, shop_count)
 
+    # 3. 保存文件
+    output_filename = output_filename or daily_report_filename(report_date)
 
-def apply_border(ws, min_row, max_row, min_col, max_col):
-    """应用边框样式"""
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
-        for cell in row:
-            cell.border = thin_border
+    with metrics_span('save'):
+        wb.save(output_filename)
+    print(f"✅ 日报生成成功: {output_filename}（共 {shop_count} 个门店）")
+    return output_filename
 
 
-# ==================== 核心功能：生成日报 ====================
-def generate_daily_report(report_date, accounts=None, output_filename=None):
+@instrumented_report('daily')
+def generate_daily_report(report_date, accounts=None, output_filename=None, streaming=False,
+                          progress_callback=None, format='xlsx'):
     """
     生成日报
     - Sheet 1: "汇总" - 横向表格，每行一个门店
@@ -380,955 +3434,233 @@ def generate_daily_report(report_date, accounts=None, output_filename=None):
         report_date: str, 报表日期，格式: 'YYYY-MM-DD'
         accounts: list, 可选，门店账号列表（platform_accounts.account的值），如["13718175572a","19318574226a"]，如果提供则只生成这些账号的日报
         output_filename: str, 输出文件名，默认自动生成
+        streaming: bool, 是否使用流式写入（write-only）模式，门店很多时内存占用基本不随门店数增长
+        progress_callback: callable, 可选，进度回调 progress_callback(已处理门店数, 门店总数)
+        format: str, xlsx（默认）/ csv / ndjson / parquet，非 xlsx 时不构建工作簿，每门店一行导出
 
     返回:
         str: 生成的文件路径
     """
-    # 1. 如果指定了accounts，先获取对应的shop_id列表
-    shop_ids_filter = None
+    format = check_export_format(format)
+
+    # 1. 如果指定了accounts，从账号索引取对应的shop_id列表
+    shop_ids_filter = resolve_shop_filter(accounts=accounts)
     if accounts:
-        print(f"正在查询指定账号的门店信息: {accounts}")
-        conn_temp = CONNECTION_POOL.get_connection()
-        cursor_temp = conn_temp.cursor(dictionary=True)
-        try:
-            placeholders = ','.join(['%s'] * len(accounts))
-            sql_accounts = f"""
-            SELECT stores_json, compareRegions_json
-            FROM platform_accounts
-            WHERE account IN ({placeholders})
-            """
-            cursor_temp.execute(sql_accounts, accounts)
-            account_data = cursor_temp.fetchall()
-
-            # 从stores_json中提取shop_id
-            shop_ids_filter = []
-            for acc in account_data:
-                stores_json = acc.get('stores_json')
-                if stores_json:
-                    try:
-                        if isinstance(stores_json, str):
-                            stores = json.loads(stores_json)
-                        else:
-                            stores = stores_json
-
-                        if isinstance(stores, list):
-                            for store in stores:
-                                if isinstance(store, dict):
-                                    shop_id = str(store.get('shop_id', ''))
-                                    if shop_id:
-                                        shop_ids_filter.append(shop_id)
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-
-            print(f"找到 {len(shop_ids_filter)} 个门店")
-        finally:
-            cursor_temp.close()
-            conn_temp.close()
+        print(f"指定账号: {accounts}，找到 {len(shop_ids_filter)} 个门店")
+        if not shop_ids_filter:
+            print("警告：指定账号下没有门店")
+            return None
 
     # 2. 获取门店信息映射
     print("正在加载门店信息...")
     shop_mapping = get_shop_info_mapping(accounts)
     region_mapping = get_region_info_mapping(accounts)
 
+    # 近7天优惠码订单等近N天指标（一次范围查询，循环内只做字典查找）；须在主查询流式读取前完成
+    trailing_kpis = get_daily_trailing_kpis(report_date, report_date, shop_ids_filter).get(report_date, {})
+    coupon_7days_mapping = trailing_kpis.get('coupon_orders_7days', {})
+
     # 3. 从连接池获取连接
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
+    conn = get_db_connection()
+    stream = None
 
     try:
-        # SQL 查询：关联 kewen_daily_report + promotion_daily_report + store_stats
-        sql = """
-        SELECT
-            k.report_date,
-            k.shop_id,
-            k.shop_name,
-            k.exposure_users,
-            k.visit_users,
-            k.order_users,
-            k.verify_person_count as verify_users,
-            k.order_coupon_count,
-            k.verify_coupon_count,
-            k.promotion_cost,
-            k.new_good_review_count,
-            k.new_review_count,
-            k.new_collect_users,
-            k.consult_users,
-            k.intent_rate,
-            k.order_sale_amount,
-            k.verify_sale_amount,
-            k.verify_after_discount,
-            p.view_phone_count as phone_clicks,
-            p.view_address_count as address_clicks,
-            p.click_avg_price,
-            p.order_count as promotion_order_count,
-            s.order_user_rank,
-            s.verify_amount_rank,
-            s.checkin_count,
-            s.ad_balance,
-            s.ad_order_count,
-            s.is_force_offline
-        FROM kewen_daily_report k
-        LEFT JOIN promotion_daily_report p
-            ON k.shop_id = p.shop_id AND k.report_date = p.report_date
-        LEFT JOIN store_stats s
-            ON k.shop_id = s.store_id AND k.report_date = s.date
-        WHERE k.report_date = %s
-        """
-
-        # 添加shop_id过滤条件
+        # 日期与shop_id过滤条件（主查询和计数查询共用）
+        where_sql = " WHERE k.report_date = %s"
         params = [report_date]
         if shop_ids_filter:
             placeholders = ','.join(['%s'] * len(shop_ids_filter))
-            sql += f" AND k.shop_id IN ({placeholders})"
+            where_sql += f" AND k.shop_id IN ({placeholders})"
             params.extend(shop_ids_filter)
 
-        sql += " ORDER BY k.shop_id"
+        sql = DAILY_REPORT_SQL + where_sql + " ORDER BY k.shop_id"
 
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
+        # 门店总数只用于进度回调，没有回调时不额外查询
+        total = None
+        if progress_callback:
+            total = count_rows(conn, "SELECT COUNT(*) FROM kewen_daily_report k" + where_sql, params)
 
-        if not rows:
+        # 无缓冲游标按块读取，边读边写
+        stream = QueryStream(conn, sql, params)
+        rows = peek_nonempty(stream.views())
+        if rows is None:
             print(f"警告：{report_date} 没有数据")
             return None
 
-        # 3. 创建 Excel 工作簿
-        wb = openpyxl.Workbook()
-
-        # ==================== Sheet 1: 汇总 ====================
-        ws_summary = wb.active
-        ws_summary.title = "汇总"
-
-        # 格式化日期
-        date_obj = datetime.strptime(report_date, '%Y-%m-%d')
-        weekday_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
-        weekday = weekday_names[date_obj.weekday()]
-        date_str = date_obj.strftime('%m月%d日')
-        date_short = date_obj.strftime('%m/%d')
-
-        # 汇总表头
-        summary_headers = [
-            '星期', '日期', '序号', '运营', '城市', '销售', '门店',
-            '曝光人数', '访问人数', '下单人数', '核销人数', '下单券数', '核销券数',
-            '电话点击', '地址点击', '推广通消耗', '好评', '意向转化率',
-            '下单售价金额', '核销售价金额', '优惠后核销金额',
-            '下单人数商圈排名', '核销金额商圈排名'
-        ]
-        ws_summary.append(summary_headers)
-
-        # 汇总表头样式
-        header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-        header_font = Font(bold=True, size=10)
-        for cell in ws_summary[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        # 用于处理重名 Sheet
-        sheet_names_used = {}
-
-        # 4. 为每个门店写入汇总行 + 创建详细Sheet
-        for idx, row in enumerate(rows, start=1):
-            shop_id = str(row['shop_id'])
-            shop_name = row['shop_name'] or f'门店{shop_id}'
-
-            # 从映射中获取运营、城市、销售
-            shop_info = shop_mapping.get(shop_id, {})
-            operator = shop_info.get('operator', '')
-            sales = shop_info.get('sales', '')
-            city = shop_info.get('city', '')
-
-            # 获取商圈信息
-            region_info = region_mapping.get(shop_id, {})
-            region_city = region_info.get('city', city)
-            region_district = region_info.get('district', '')
-            region_business = region_info.get('business', '')
-
-            # 格式化商圈排名
-            order_rank = row['order_user_rank']
-            verify_rank = row['verify_amount_rank']
-            order_rank_str = f"第{order_rank}名" if order_rank and order_rank < 100 else (
-                "大于100名" if order_rank and order_rank >= 100 else "--")
-            verify_rank_str = f"第{verify_rank}名" if verify_rank and verify_rank < 100 else (
-                "大于100名" if verify_rank and verify_rank >= 100 else "--")
-
-            # 写入汇总数据行
-            summary_row = [
-                weekday,
-                date_str,
-                idx,
-                operator,
-                city,
-                sales,
-                shop_name,
-                row['exposure_users'] or 0,
-                row['visit_users'] or 0,
-                row['order_users'] or 0,
-                row['verify_users'] or 0,
-                row['order_coupon_count'] or 0,
-                row['verify_coupon_count'] or 0,
-                row['phone_clicks'] or 0,
-                row['address_clicks'] or 0,
-                round(row['promotion_cost'], 2) if row['promotion_cost'] else 0,
-                row['new_good_review_count'] or 0,
-                row['intent_rate'] or '0%',
-                round(row['order_sale_amount'], 2) if row['order_sale_amount'] else 0,
-                round(row['verify_sale_amount'], 2) if row['verify_sale_amount'] else 0,
-                round(row['verify_after_discount'], 2) if row['verify_after_discount'] else 0,
-                order_rank_str,
-                verify_rank_str
-            ]
-            ws_summary.append(summary_row)
-
-            # ==================== Sheet 2-N: 门店详细（竖向表格）====================
-            # 清理 Sheet 名称
-            sheet_name = clean_sheet_name(shop_name)
-
-            # 处理重名（添加序号）
-            if sheet_name in sheet_names_used:
-                sheet_names_used[sheet_name] += 1
-                sheet_name = f"{sheet_name[:28]}_{sheet_names_used[sheet_name]}"
-            else:
-                sheet_names_used[sheet_name] = 1
-
-            # 创建详细 Sheet
-            ws_detail = wb.create_sheet(title=sheet_name)
-
-            # 计算达标状态
-            order_users = row['order_users'] or 0
-            verify_users = row['verify_users'] or 0
-            new_review_count = row['new_review_count'] or 0
-            new_collect_users = row['new_collect_users'] or 0
-
-            # 留评率 = 新增评价 / 核销人数
-            review_rate = (new_review_count / verify_users * 100) if verify_users > 0 else 0
-            review_rate_str = f"{review_rate:.1f}%"
-            review_qualified = "达标" if review_rate >= 30 else "未达标"
-
-            # 收藏率 = 新增收藏 / 下单人数
-            collect_rate = (new_collect_users / order_users * 100) if order_users > 0 else 0
-            collect_rate_str = f"{collect_rate:.1f}%"
-            collect_qualified = "达标" if collect_rate >= 40 else "未达标"
-
-            # 近7天优惠码订单（7天>=10单达标）
-            coupon_7days = get_coupon_orders_last_7days(shop_id, report_date)
-            coupon_qualified = "达标" if coupon_7days >= 10 else "未达标"
-
-            # 当天广告单（当天>=1单达标）
-            ad_today = get_ad_orders_today(shop_id, report_date)
-            ad_qualified = "达标" if ad_today >= 1 else "未达标"
-
-            # 强制下线状态信息
-            is_force_offline = row['is_force_offline'] or 0
-            if is_force_offline > 0:
-                status_info = f"⚠️ 警告：有{is_force_offline}个团单被强制下线！"
-            else:
-                status_info = "今天邮件已查看，无违规无异常。"
-
-            # 商圈排名显示（格式：城市 | 区 | 商圈：第X名）
-            region_display = f"{region_city} | {region_district} | {region_business}" if region_business else city
-            order_rank_display = f"{region_display}：第{order_rank}名" if order_rank and order_rank < 100 else f"{region_display}：大于100名"
-            verify_rank_display = f"{region_display}：第{verify_rank}名" if verify_rank and verify_rank < 100 else f"{region_display}：大于100名"
-
-            # 构建竖向表格数据
-            detail_data = [
-                [shop_name, status_info, ''],
-                [f"数据报表", f"日期({date_short})", ''],
-                ['【美团点评广告结果数据】', '', ''],
-                ['曝光人数：', row['exposure_users'] or 0, ''],
-                ['访问人数：', row['visit_users'] or 0, ''],
-                ['下单人数：', row['order_users'] or 0, ''],
-                ['下单券数：', row['order_coupon_count'] or 0, ''],
-                ['核销人数：', row['verify_users'] or 0, ''],
-                ['核销券数：', row['verify_coupon_count'] or 0, ''],
-                ['电话点击：', row['phone_clicks'] or 0, ''],
-                ['地址点击：', row['address_clicks'] or 0, ''],
-                ['在线咨询：', row['consult_users'] or 0, ''],
-                ['', '', ''],
-                ['【店内干预数据】', '', ''],
-                ['新增收藏：', row['new_collect_users'] or 0, ''],
-                ['新增打卡：', row['checkin_count'] or 0, ''],
-                ['新增评价：', row['new_review_count'] or 0, ''],
-                ['', '', ''],
-                ['【推广通数据】', '', ''],
-                ['推广通消耗：', round(row['promotion_cost'], 2) if row['promotion_cost'] else 0, ''],
-                ['推广通点击单价：', round(row['click_avg_price'], 2) if row['click_avg_price'] else 0, ''],
-                ['推广通下单量：', row['promotion_order_count'] or 0, ''],
-                ['推广通余额：', round(row['ad_balance'], 2) if row['ad_balance'] else 0, ''],
-                ['', '', ''],
-                [f'留评率（30%达标）：', review_rate_str, review_qualified],
-                [f'收藏率（40%达标）：', collect_rate_str, collect_qualified],
-                [f'近7天优惠码订单是否达标：', coupon_7days, coupon_qualified],
-                [f'广告单：', f"当天{ad_today}单", ad_qualified],
-                ['', '', ''],
-                ['下单售价金额：', round(row['order_sale_amount'], 2) if row['order_sale_amount'] else 0, ''],
-                ['核销售价金额：', round(row['verify_sale_amount'], 2) if row['verify_sale_amount'] else 0, ''],
-                ['下单人数商圈排名：', order_rank_display, ''],
-                ['核销金额商圈排名：', verify_rank_display, ''],
-                ['', '', ''],
-                ['团单被强制下线数量：', is_force_offline, ''],
-                ['', '', ''],
-                ['运营：', operator, ''],
-                ['销售：', sales, ''],
-                ['城市：', city, ''],
-            ]
-
-            # 写入详细数据
-            for row_data in detail_data:
-                ws_detail.append(row_data)
-
-            # 设置详细Sheet样式（A列宽改为40）
-            ws_detail.column_dimensions['A'].width = 40
-            ws_detail.column_dimensions['B'].width = 30
-            ws_detail.column_dimensions['C'].width = 15
-
-            # 所有单元格居中对齐
-            for row_num in range(1, len(detail_data) + 1):
-                for col_num in range(1, 4):
-                    ws_detail.cell(row=row_num, column=col_num).alignment = Alignment(horizontal='center', vertical='center')
-
-            # 标题行样式
-            ws_detail['A1'].font = Font(bold=True, size=12)
-            ws_detail['B1'].font = Font(bold=True, size=10, color="FF0000" if is_force_offline > 0 else "008000")
-
-            # 分类标题样式
-            section_rows = [3, 14, 19]  # 【美团点评广告结果数据】等行
-            for r in section_rows:
-                ws_detail.cell(row=r, column=1).font = Font(bold=True, size=10, color="0066CC")
-
-            # 达标/未达标样式
-            qualified_rows = [25, 26, 27, 28]
-            for r in qualified_rows:
-                cell = ws_detail.cell(row=r, column=3)
-                if cell.value == "未达标":
-                    cell.font = Font(bold=True, color="FF0000")
-                elif cell.value == "达标":
-                    cell.font = Font(bold=True, color="008000")
-
-            # 应用边框
-            apply_border(ws_detail, 1, len(detail_data), 1, 3)
-
-        # 设置汇总表列宽（G列门店改为46）
-        summary_widths = [6, 8, 5, 12, 8, 8, 46, 10, 10, 10, 10, 10, 10, 10, 10, 12, 8, 12, 12, 12, 12, 14, 14]
-        for col_idx, width in enumerate(summary_widths, start=1):
-            ws_summary.column_dimensions[get_column_letter(col_idx)].width = width
-
-        # 汇总表所有数据居中对齐
-        for row in ws_summary.iter_rows(min_row=1, max_row=len(rows) + 1, min_col=1, max_col=len(summary_headers)):
-            for cell in row:
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        # 应用汇总表边框
-        apply_border(ws_summary, 1, len(rows) + 1, 1, len(summary_headers))
-
-        # 5. 保存文件
-        if not output_filename:
-            output_filename = f"日报 非餐 {report_date.replace('-', '')} {datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
-
-        wb.save(output_filename)
-        print(f"✅ 日报生成成功: {output_filename}（共 {len(rows)} 个门店）")
-        return output_filename
+        return _write_daily_report(report_date, rows, shop_mapping, region_mapping, coupon_7days_mapping,
+                                   output_filename, streaming, progress_callback, format, total)
 
     finally:
-        cursor.close()
+        if stream is not None:
+            stream.close()
         conn.close()
 
 
-# ==================== 核心功能：生成周报 ====================
-def generate_weekly_report(week1_start, week1_end, week2_start, week2_end, output_filename=None):
-    """
-    生成周报（两周对比）
-    - Sheet 1: "汇总" - 每门店8行的横向结构
-    - Sheet 2-N: 门店详细 - 竖向31行结构
-
-    参数:
-        week1_start: str, 第一周开始日期 'YYYY-MM-DD'
-        week1_end: str, 第一周结束日期 'YYYY-MM-DD'
-        week2_start: str, 第二周开始日期 'YYYY-MM-DD'
-        week2_end: str, 第二周结束日期 'YYYY-MM-DD'
-        output_filename: str, 输出文件名
-    """
-    # 获取门店信息映射
-    shop_mapping = get_shop_info_mapping()
+# ==================== 按日期范围生成日报（补数/重跑）====================
+# 并行写出时子进程使用的门店/商圈映射（进程初始化时传入一次，不随每天的任务重复传输）
+_DAILY_RANGE_WORKER_MAPPINGS = None
 
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
 
-    try:
-        # 查询周数据（包含 store_stats）
-        sql_week = """
-        SELECT
-            k.shop_id,
-            k.shop_name,
-            SUM(k.verify_after_discount) as verify_after_discount,
-            SUM(k.exposure_users) as exposure_users,
-            SUM(k.visit_users) as visit_users,
-            SUM(k.order_users) as order_users,
-            SUM(k.order_coupon_count) as order_coupon_count,
-            SUM(k.verify_person_count) as verify_users,
-            SUM(k.verify_coupon_count) as verify_coupon_count,
-            SUM(k.order_sale_amount) as order_sale_amount,
-            SUM(k.verify_sale_amount) as verify_sale_amount,
-            SUM(k.coupon_pay_order_count) as coupon_orders,
-            SUM(p.view_phone_count) as phone_clicks,
-            SUM(k.promotion_cost) as promotion_cost,
-            SUM(k.promotion_exposure_count) as promotion_exposure,
-            SUM(k.promotion_click_count) as promotion_clicks,
-            SUM(p.order_count) as promotion_orders,
-            SUM(p.view_groupbuy_count) as view_groupbuy,
-            SUM(p.view_phone_count) as view_phone,
-            SUM(k.consult_users) as consult_users,
-            SUM(p.view_address_count) as address_clicks,
-            SUM(k.new_collect_users) as new_collect,
-            SUM(k.new_good_review_count) as new_good_reviews,
-            SUM(k.new_review_count) as new_reviews,
-            SUM(s.checkin_count) as checkin_count
-        FROM kewen_daily_report k
-        LEFT JOIN promotion_daily_report p
-            ON k.shop_id = p.shop_id AND k.report_date = p.report_date
-        LEFT JOIN store_stats s
-            ON k.shop_id = s.store_id AND k.report_date = s.date
-        WHERE k.report_date BETWEEN %s AND %s
-        GROUP BY k.shop_id, k.shop_name
-        ORDER BY k.shop_id
-        """
+def _init_daily_range_worker(shop_mapping, region_mapping):
+    global _DAILY_RANGE_WORKER_MAPPINGS
+    _DAILY_RANGE_WORKER_MAPPINGS = (shop_mapping, region_mapping)
 
-        # 获取第一周数据
-        cursor.execute(sql_week, (week1_start, week1_end))
-        week1_data = {row['shop_id']: row for row in cursor.fetchall()}
 
-        # 获取第二周数据
-        cursor.execute(sql_week, (week2_start, week2_end))
-        week2_data = {row['shop_id']: row for row in cursor.fetchall()}
+def _write_daily_report_worker(report_date, columns, values, coupon_7days_mapping, output_filename, streaming,
+                               format):
+    """并行写出的子进程：把主进程读出的一天的查询行（元组）写成报表文件"""
+    shop_mapping, region_mapping = _DAILY_RANGE_WORKER_MAPPINGS
+    rows = (RowView(columns, row) for row in values)
+    return _write_daily_report(report_date, rows, shop_mapping, region_mapping, coupon_7days_mapping,
+                               output_filename, streaming, format=format)
 
-        # 获取所有门店列表
-        all_shop_ids = set(week1_data.keys()) | set(week2_data.keys())
 
-        if not all_shop_ids:
-            print("警告：没有找到数据")
-            return None
+@instrumented_report('daily_range')
+def generate_daily_reports(start_date, end_date, accounts=None, output_dir=None, streaming=False,
+                           progress_callback=None, format='xlsx', workers=None):
+    """
+    按日期范围生成日报（每天一个文件，内容与逐天调用 generate_daily_report 相同），用于补数/重跑
+    - 门店/商圈映射只加载一次
+    - 主查询只执行一次：整个范围按 (日期, 门店) 排序流式读取，按日期分组逐天写出
+    - 近7天优惠码订单等近N天指标只查询一次（见 get_daily_trailing_kpis），每天的值由滚动窗口算出
 
-        print(f"📊 找到 {len(all_shop_ids)} 个门店数据")
+    参数:
+        start_date, end_date: str, 日期范围 'YYYY-MM-DD'（含两端）
+        accounts: list, 可选，门店账号列表，如果提供则只生成这些账号的日报
+        output_dir: str, 可选，输出目录（默认当前目录），文件名同 generate_daily_report 的默认文件名
+        streaming: bool, 是否使用流式写入（write-only）模式
+        progress_callback: callable, 可选，按天回调 progress_callback(已完成天数, 总天数)
+        format: str, xlsx（默认）/ csv / ndjson / parquet
+        workers: int, 可选，>1 时按天分给多个进程并行写出（主进程读取数据，子进程只写文件，
+                 同时在途的天数不超过进程数）
 
-        # 创建 Excel
-        wb = openpyxl.Workbook()
-        ws_summary = wb.active
-        ws_summary.title = "汇总"
+    返回:
+        list: 生成的文件路径（按日期顺序，没有数据的日期跳过）
+    """
+    format = check_export_format(format)
 
-        # 格式化日期周期
-        week1_period = f"{datetime.strptime(week1_start, '%Y-%m-%d').strftime('%Y.%m.%d')}-{datetime.strptime(week1_end, '%Y-%m-%d').strftime('%Y.%m.%d')}"
-        week2_period = f"{datetime.strptime(week2_start, '%Y-%m-%d').strftime('%Y.%m.%d')}-{datetime.strptime(week2_end, '%Y-%m-%d').strftime('%Y.%m.%d')}"
-
-        # 辅助函数 - 修改为安全版本
-        def get_val(data, key, default=0):
-            """安全获取值，处理None"""
-            if not data:
-                return default
-            value = data.get(key)
-            if value is None:
-                return default
-            return value
-
-        def calc_rate(numerator, denominator):
-            if denominator and denominator > 0:
-                return round(numerator / denominator * 100, 1)
-            return 0
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    days = [(start + timedelta(days=n)).strftime('%Y-%m-%d') for n in range((end - start).days + 1)]
+    if not days:
+        raise ValueError(f"日期范围无效: {start_date} ~ {end_date}")
 
-        def calc_avg_price(total, count):
-            if count and count > 0:
-                return round(total / count, 2)
-            return 0
+    shop_ids_filter = resolve_shop_filter(accounts=accounts)
+    if accounts:
+        print(f"指定账号: {accounts}，找到 {len(shop_ids_filter)} 个门店")
+        if not shop_ids_filter:
+            print("警告：指定账号下没有门店")
+            return []
 
-        # 用于处理重名 Sheet
-        sheet_names_used = {}
+    print("正在加载门店信息...")
+    shop_mapping = get_shop_info_mapping(accounts)
+    region_mapping = get_region_info_mapping(accounts)
 
-        # 记录有问题的门店
-        error_shops = []
+    # 近N天指标按滚动窗口一次算出整个范围；须在主查询流式读取前完成
+    trailing_kpis_by_date = get_daily_trailing_kpis(start_date, end_date, shop_ids_filter)
 
-        # 序号计数器
-        shop_seq = 0
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
 
-        # 为每个门店生成数据
-        for shop_id in sorted(all_shop_ids):
-            w1 = week1_data.get(shop_id, {})
-            w2 = week2_data.get(shop_id, {})
-            shop_name = w2.get('shop_name') or w1.get('shop_name', '未知门店')
+    files = {}
+    workers = workers if workers and workers > 1 else 0
+    executor = None
+    pending = {}
 
-            # 获取门店信息
-            shop_id_str = str(shop_id)
-            shop_info = shop_mapping.get(shop_id_str, {})
-            operator = shop_info.get('operator', '--')
-            sales = shop_info.get('sales', '--') or '--'
-            city = shop_info.get('city', '--') or '--'
+    def collect(futures):
+        for future in futures:
+            files[pending.pop(future)] = future.result()
+            if progress_callback:
+                progress_callback(len(files), len(days))
 
-            # 序号递增
-            shop_seq += 1
+    conn = get_db_connection()
+    stream = None
 
-            try:
-                # ==================== 汇总Sheet: 8行/门店 ====================
-                # 第一周指标
-                w1_verify_discount = get_val(w1, 'verify_after_discount')
-                w1_exposure = get_val(w1, 'exposure_users')
-                w1_visit = get_val(w1, 'visit_users')
-                w1_order_users = get_val(w1, 'order_users')
-                w1_order_coupons = get_val(w1, 'order_coupon_count')
-                w1_verify_users = get_val(w1, 'verify_users')
-                w1_verify_coupons = get_val(w1, 'verify_coupon_count')
-                w1_order_amount = get_val(w1, 'order_sale_amount')
-                w1_verify_amount = get_val(w1, 'verify_sale_amount')
-                w1_coupon_orders = get_val(w1, 'coupon_orders')
-                w1_phone_clicks = get_val(w1, 'phone_clicks')
-
-                w1_exposure_rate = f"{calc_rate(w1_visit, w1_exposure)}%"
-                w1_order_rate = f"{calc_rate(w1_order_users, w1_visit)}%"
-                w1_avg_price = calc_avg_price(w1_verify_discount, w1_verify_users)
-
-                # 第二周指标
-                w2_verify_discount = get_val(w2, 'verify_after_discount')
-                w2_exposure = get_val(w2, 'exposure_users')
-                w2_visit = get_val(w2, 'visit_users')
-                w2_order_users = get_val(w2, 'order_users')
-                w2_order_coupons = get_val(w2, 'order_coupon_count')
-                w2_verify_users = get_val(w2, 'verify_users')
-                w2_verify_coupons = get_val(w2, 'verify_coupon_count')
-                w2_order_amount = get_val(w2, 'order_sale_amount')
-                w2_verify_amount = get_val(w2, 'verify_sale_amount')
-                w2_coupon_orders = get_val(w2, 'coupon_orders')
-                w2_phone_clicks = get_val(w2, 'phone_clicks')
-
-                w2_exposure_rate = f"{calc_rate(w2_visit, w2_exposure)}%"
-                w2_order_rate = f"{calc_rate(w2_order_users, w2_visit)}%"
-                w2_avg_price = calc_avg_price(w2_verify_discount, w2_verify_users)
-
-                # 计算差值
-                diff_verify_discount = round(w2_verify_discount - w1_verify_discount, 2)
-                diff_exposure = w2_exposure - w1_exposure
-                diff_visit = w2_visit - w1_visit
-                diff_order_users = w2_order_users - w1_order_users
-                diff_order_coupons = w2_order_coupons - w1_order_coupons
-                diff_verify_users = w2_verify_users - w1_verify_users
-                diff_verify_coupons = w2_verify_coupons - w1_verify_coupons
-                diff_order_amount = round(w2_order_amount - w1_order_amount, 2)
-                diff_verify_amount = round(w2_verify_amount - w1_verify_amount, 2)
-                diff_coupon_orders = w2_coupon_orders - w1_coupon_orders
-                diff_phone_clicks = w2_phone_clicks - w1_phone_clicks
-                diff_avg_price = round(w2_avg_price - w1_avg_price, 2)
-
-                # 差值百分比
-                def calc_rate_diff(rate1_str, rate2_str):
-                    val1 = float(rate1_str.rstrip('%')) if rate1_str != '0%' else 0
-                    val2 = float(rate2_str.rstrip('%')) if rate2_str != '0%' else 0
-                    return f"{round(val2 - val1, 1)}%"
-
-                diff_exposure_rate = calc_rate_diff(w1_exposure_rate, w2_exposure_rate)
-                diff_order_rate = calc_rate_diff(w1_order_rate, w2_order_rate)
-
-                # 推广通相关数据（提前计算，用于后面）
-                w1_promo_cost = get_val(w1, 'promotion_cost')
-                w1_promo_exposure = get_val(w1, 'promotion_exposure')
-                w1_promo_clicks = get_val(w1, 'promotion_clicks')
-                w1_promo_orders = get_val(w1, 'promotion_orders')
-                w1_view_groupbuy = get_val(w1, 'view_groupbuy')
-                w1_view_phone = get_val(w1, 'view_phone')
-                w1_consult = get_val(w1, 'consult_users')
-                w1_address = get_val(w1, 'address_clicks')
-                w1_collect = get_val(w1, 'new_collect')
-                w1_good_reviews = get_val(w1, 'new_good_reviews')
-
-                w1_click_price = calc_avg_price(w1_promo_cost, w1_promo_clicks)
-                w1_promo_rate = f"{calc_rate(w1_promo_orders, w1_promo_clicks)}%"
-                w1_collect_rate = f"{calc_rate(w1_collect, w1_visit)}%"
-                w1_review_rate = f"{calc_rate(w1_good_reviews, w1_verify_users)}%"
-
-                w2_promo_cost = get_val(w2, 'promotion_cost')
-                w2_promo_exposure = get_val(w2, 'promotion_exposure')
-                w2_promo_clicks = get_val(w2, 'promotion_clicks')
-                w2_promo_orders = get_val(w2, 'promotion_orders')
-                w2_view_groupbuy = get_val(w2, 'view_groupbuy')
-                w2_view_phone = get_val(w2, 'view_phone')
-                w2_consult = get_val(w2, 'consult_users')
-                w2_address = get_val(w2, 'address_clicks')
-                w2_collect = get_val(w2, 'new_collect')
-                w2_good_reviews = get_val(w2, 'new_good_reviews')
-
-                w2_click_price = calc_avg_price(w2_promo_cost, w2_promo_clicks)
-                w2_promo_rate = f"{calc_rate(w2_promo_orders, w2_promo_clicks)}%"
-                w2_collect_rate = f"{calc_rate(w2_collect, w2_visit)}%"
-                w2_review_rate = f"{calc_rate(w2_good_reviews, w2_verify_users)}%"
-
-                # 推广通差值
-                diff_promo_cost = round(w2_promo_cost - w1_promo_cost, 2)
-                diff_promo_exposure = w2_promo_exposure - w1_promo_exposure
-                diff_promo_clicks = w2_promo_clicks - w1_promo_clicks
-                diff_click_price = round(w2_click_price - w1_click_price, 2)
-                diff_promo_orders = w2_promo_orders - w1_promo_orders
-                diff_promo_rate = calc_rate_diff(w1_promo_rate, w2_promo_rate)
-                diff_view_groupbuy = w2_view_groupbuy - w1_view_groupbuy
-                diff_view_phone = w2_view_phone - w1_view_phone
-                diff_consult = w2_consult - w1_consult
-                diff_address = w2_address - w1_address
-                diff_collect = w2_collect - w1_collect
-                diff_collect_rate = calc_rate_diff(w1_collect_rate, w2_collect_rate)
-                diff_good_reviews = w2_good_reviews - w1_good_reviews
-                diff_review_rate = calc_rate_diff(w1_review_rate, w2_review_rate)
-
-                # ==================== 汇总Sheet 8行结构（与示例一致）====================
-                # 行1: 核销数据表头（周报/月报不包含序号、运营、城市、销售）
-                header_row1 = [
-                    '门店', '数据周期', '优惠后核销额', '曝光人数', '访问人数', '曝光访问转化率',
-                    '下单人数', '下单券数', '下单转化率', '核销人数', '核销券数',
-                    '下单售价金额', '核销售价金额', '优惠码订单', '电话点击', '客单价'
-                ]
-                ws_summary.append(header_row1)
-
-                # 行2: 第一周核销数据（带门店信息）
-                row2 = [
-                    shop_name, week1_period,
-                    round(w1_verify_discount, 2), w1_exposure, w1_visit, w1_exposure_rate,
-                    w1_order_users, w1_order_coupons, w1_order_rate,
-                    w1_verify_users, w1_verify_coupons,
-                    round(w1_order_amount, 2), round(w1_verify_amount, 2),
-                    w1_coupon_orders, w1_phone_clicks, w1_avg_price
-                ]
-                ws_summary.append(row2)
-
-                # 行3: 第二周核销数据（前1列为空）
-                row3 = [
-                    '', week2_period,
-                    round(w2_verify_discount, 2), w2_exposure, w2_visit, w2_exposure_rate,
-                    w2_order_users, w2_order_coupons, w2_order_rate,
-                    w2_verify_users, w2_verify_coupons,
-                    round(w2_order_amount, 2), round(w2_verify_amount, 2),
-                    w2_coupon_orders, w2_phone_clicks, w2_avg_price
-                ]
-                ws_summary.append(row3)
-
-                # 行4: 核销差值（前1列为空）
-                row4 = [
-                    '', '差值',
-                    diff_verify_discount, diff_exposure, diff_visit, diff_exposure_rate,
-                    diff_order_users, diff_order_coupons, diff_order_rate,
-                    diff_verify_users, diff_verify_coupons,
-                    diff_order_amount, diff_verify_amount,
-                    diff_coupon_orders, diff_phone_clicks, diff_avg_price
-                ]
-                ws_summary.append(row4)
-
-                # 行5: 推广通表头（前1列为空）
-                header_row2 = [
-                    '', '数据周期', '推广通花费', '推广通曝光', '推广通点击', '推广通点击均价',
-                    '推广通订单量', '推广通下单转化率', '推广通查看团购', '推广通查看电话',
-                    '在线咨询', '地址点击', '门店收藏', '收藏率', '新增好评数', '留评率'
-                ]
-                ws_summary.append(header_row2)
-
-                # 行6: 第一周推广通数据（前1列为空）
-                row6 = [
-                    '', week1_period,
-                    round(w1_promo_cost, 2), w1_promo_exposure, w1_promo_clicks, w1_click_price,
-                    w1_promo_orders, w1_promo_rate, w1_view_groupbuy, w1_view_phone,
-                    w1_consult, w1_address, w1_collect, w1_collect_rate,
-                    w1_good_reviews, w1_review_rate
-                ]
-                ws_summary.append(row6)
-
-                # 行7: 第二周推广通数据（前1列为空）
-                row7 = [
-                    '', week2_period,
-                    round(w2_promo_cost, 2), w2_promo_exposure, w2_promo_clicks, w2_click_price,
-                    w2_promo_orders, w2_promo_rate, w2_view_groupbuy, w2_view_phone,
-                    w2_consult, w2_address, w2_collect, w2_collect_rate,
-                    w2_good_reviews, w2_review_rate
-                ]
-                ws_summary.append(row7)
-
-                # 行8: 推广通差值（前1列为空）
-                row8 = [
-                    '', '差值',
-                    diff_promo_cost, diff_promo_exposure, diff_promo_clicks, diff_click_price,
-                    diff_promo_orders, diff_promo_rate, diff_view_groupbuy, diff_view_phone,
-                    diff_consult, diff_address, diff_collect, diff_collect_rate,
-                    diff_good_reviews, diff_review_rate
-                ]
-                ws_summary.append(row8)
-
-                # ==================== 门店详细Sheet（竖向31行）====================
-                sheet_name = clean_sheet_name(shop_name)
-                if sheet_name in sheet_names_used:
-                    sheet_names_used[sheet_name] += 1
-                    sheet_name = f"{sheet_name[:28]}_{sheet_names_used[sheet_name]}"
-                else:
-                    sheet_names_used[sheet_name] = 1
-
-                ws_detail = wb.create_sheet(title=sheet_name)
-
-                # 计算额外指标（直接计算百分比值，不使用公式）
-                w1_exposure_rate_val = f"{calc_rate(w1_visit, w1_exposure)}%" if w1_exposure > 0 else "0%"
-                w2_exposure_rate_val = f"{calc_rate(w2_visit, w2_exposure)}%" if w2_exposure > 0 else "0%"
-                w1_intent_rate_val = f"{calc_rate(w1_order_users, w1_visit)}%" if w1_visit > 0 else "0%"
-                w2_intent_rate_val = f"{calc_rate(w2_order_users, w2_visit)}%" if w2_visit > 0 else "0%"
-                w1_review_rate_val = f"{calc_rate(w1_good_reviews, w1_verify_users)}%" if w1_verify_users > 0 else "0%"
-                w2_review_rate_val = f"{calc_rate(w2_good_reviews, w2_verify_users)}%" if w2_verify_users > 0 else "0%"
-                w1_collect_rate_val = f"{calc_rate(w1_collect, w1_order_users)}%" if w1_order_users > 0 else "0%"
-                w2_collect_rate_val = f"{calc_rate(w2_collect, w2_order_users)}%" if w2_order_users > 0 else "0%"
-
-                w1_checkin = get_val(w1, 'checkin_count')
-                w2_checkin = get_val(w2, 'checkin_count')
-
-                # 计算差值（用于差值列显示）
-                diff_exposure_val = w2_exposure - w1_exposure
-                diff_visit_val = w2_visit - w1_visit
-                diff_exposure_rate_val = f"{round(calc_rate(w2_visit, w2_exposure) - calc_rate(w1_visit, w1_exposure), 2)}%"
-                diff_order_users_val = w2_order_users - w1_order_users
-                diff_verify_users_val = w2_verify_users - w1_verify_users
-                diff_intent_rate_val = f"{round(calc_rate(w2_order_users, w2_visit) - calc_rate(w1_order_users, w1_visit), 2)}%"
-                diff_order_coupons_val = w2_order_coupons - w1_order_coupons
-                diff_verify_coupons_val = w2_verify_coupons - w1_verify_coupons
-                diff_order_amount_val = round(w2_order_amount - w1_order_amount, 2)
-                diff_verify_amount_val = round(w2_verify_amount - w1_verify_amount, 2)
-                diff_verify_discount_val = round(w2_verify_discount - w1_verify_discount, 2)
-                diff_avg_price_val = round(w2_avg_price - w1_avg_price, 2)
-                diff_phone_val = w2_phone_clicks - w1_phone_clicks
-                diff_address_val = w2_address - w1_address
-                diff_consult_val = w2_consult - w1_consult
-                diff_good_reviews_val = w2_good_reviews - w1_good_reviews
-                diff_review_rate_val = f"{round(calc_rate(w2_good_reviews, w2_verify_users) - calc_rate(w1_good_reviews, w1_verify_users), 2)}%"
-                diff_collect_val = w2_collect - w1_collect
-                diff_collect_rate_val = f"{round(calc_rate(w2_collect, w2_order_users) - calc_rate(w1_collect, w1_order_users), 2)}%"
-                diff_checkin_val = w2_checkin - w1_checkin
-                diff_promo_orders_val = w2_promo_orders - w1_promo_orders
-                diff_promo_cost_val = round(w2_promo_cost - w1_promo_cost, 2)
-                diff_promo_exposure_val = w2_promo_exposure - w1_promo_exposure
-                diff_promo_clicks_val = w2_promo_clicks - w1_promo_clicks
-                diff_click_price_val = round(w2_click_price - w1_click_price, 2)
-                diff_view_groupbuy_val = w2_view_groupbuy - w1_view_groupbuy
-                diff_view_phone_val = w2_view_phone - w1_view_phone
-
-                # 构建竖向表格（31行）- 使用计算后的值而不是公式
-                detail_data = [
-                    [shop_name, '', '', ''],
-                    ['指标项/时间周期', week1_period, week2_period, '差值\n（红色为上升/黑色为下降）'],
-                    ['曝光人数：', w1_exposure, w2_exposure, diff_exposure_val],
-                    ['访问人数：', w1_visit, w2_visit, diff_visit_val],
-                    ['曝光访问转化率：', w1_exposure_rate_val, w2_exposure_rate_val, diff_exposure_rate_val],
-                    ['下单人数：', w1_order_users, w2_order_users, diff_order_users_val],
-                    ['核销人数：', w1_verify_users, w2_verify_users, diff_verify_users_val],
-                    ['意向转化率：', w1_intent_rate_val, w2_intent_rate_val, diff_intent_rate_val],
-                    ['下单券数：', w1_order_coupons, w2_order_coupons, diff_order_coupons_val],
-                    ['核销券数：', w1_verify_coupons, w2_verify_coupons, diff_verify_coupons_val],
-                    ['下单售价金额：', round(w1_order_amount, 2), round(w2_order_amount, 2), diff_order_amount_val],
-                    ['核销售价金额：', round(w1_verify_amount, 2), round(w2_verify_amount, 2), diff_verify_amount_val],
-                    ['优惠后核销金额：', round(w1_verify_discount, 2), round(w2_verify_discount, 2), diff_verify_discount_val],
-                    ['客单价：', w1_avg_price, w2_avg_price, diff_avg_price_val],
-                    ['电话点击：', w1_phone_clicks, w2_phone_clicks, diff_phone_val],
-                    ['地址点击：', w1_address, w2_address, diff_address_val],
-                    ['在线咨询：', w1_consult, w2_consult, diff_consult_val],
-                    ['门店干预数据', '', '', ''],
-                    ['新增好评：', w1_good_reviews, w2_good_reviews, diff_good_reviews_val],
-                    ['留评率：', w1_review_rate_val, w2_review_rate_val, diff_review_rate_val],
-                    ['门店收藏：', w1_collect, w2_collect, diff_collect_val],
-                    ['收藏率：', w1_collect_rate_val, w2_collect_rate_val, diff_collect_rate_val],
-                    ['打卡人数：', w1_checkin, w2_checkin, diff_checkin_val],
-                    ['推广通数据', '', '', ''],
-                    ['推广通订单量', w1_promo_orders, w2_promo_orders, diff_promo_orders_val],
-                    ['推广通花费', round(w1_promo_cost, 2), round(w2_promo_cost, 2), diff_promo_cost_val],
-                    ['推广通曝光（次）', w1_promo_exposure, w2_promo_exposure, diff_promo_exposure_val],
-                    ['推广通点击（次）', w1_promo_clicks, w2_promo_clicks, diff_promo_clicks_val],
-                    ['推广通点击均价（元）', w1_click_price, w2_click_price, diff_click_price_val],
-                    ['查看团购（次）', w1_view_groupbuy, w2_view_groupbuy, diff_view_groupbuy_val],
-                    ['查看电话（次）', w1_view_phone, w2_view_phone, diff_view_phone_val],
-                ]
-
-                for row_data in detail_data:
-                    ws_detail.append(row_data)
-
-                # 合并门店名单元格 A1:D1
-                ws_detail.merge_cells('A1:D1')
-
-                # 合并第18行和第24行的A:D单元格
-                ws_detail.merge_cells('A18:D18')
-                ws_detail.merge_cells('A24:D24')
-
-                # 设置详细Sheet样式 - 列宽: A=25, B=36, C=36, D=20
-                ws_detail.column_dimensions['A'].width = 25
-                ws_detail.column_dimensions['B'].width = 36
-                ws_detail.column_dimensions['C'].width = 36
-                ws_detail.column_dimensions['D'].width = 20
-
-                # 设置行高：第1行=31，第2行到最后=20
-                ws_detail.row_dimensions[1].height = 31
-                for row_num in range(2, len(detail_data) + 1):
-                    ws_detail.row_dimensions[row_num].height = 20
-
-                # 定义颜色
-                header_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")  # RGB(189,215,238)
-                a_col_fill = PatternFill(start_color="DEEBF7", end_color="DEEBF7", fill_type="solid")  # RGB(222,235,247)
-
-                # 定义字体 - 宋体（SimSun）
-                title_font = Font(name='宋体', size=16, color="000000")
-                bcd_font = Font(name='宋体', size=14, color="000000")
-
-                # 标题样式 - 门店名居中加粗，宋体16号
-                ws_detail['A1'].font = Font(name='宋体', bold=True, size=16, color="000000")
-                ws_detail['A1'].alignment = Alignment(horizontal='center', vertical='center')
-
-                # 第2行（标题行）样式 - 背景色#BDD7EE，宋体16号黑色
-                for col in range(1, 5):
-                    cell = ws_detail.cell(row=2, column=col)
-                    cell.font = Font(name='宋体', bold=True, size=16, color="000000")
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-
-                # 第18行和第24行样式 - 背景色#BDD7EE，宋体16号黑色
-                for r in [18, 24]:
-                    cell = ws_detail.cell(row=r, column=1)
-                    cell.font = Font(name='宋体', bold=True, size=16, color="000000")
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center', vertical='center')
-
-                # A列其他行背景色 #DEEBF7，B/C/D列字体宋体14号
-                for row_num in range(3, len(detail_data) + 1):
-                    if row_num not in [18, 24]:  # 跳过已处理的分类标题行
-                        # A列背景色
-                        ws_detail.cell(row=row_num, column=1).fill = a_col_fill
-                        ws_detail.cell(row=row_num, column=1).font = Font(name='宋体', size=14, color="000000")
-                        # B/C/D列字体
-                        for col in range(2, 5):
-                            ws_detail.cell(row=row_num, column=col).font = bcd_font
-
-                # 应用边框
-                apply_border(ws_detail, 1, len(detail_data), 1, 4)
-
-                # 所有单元格居中对齐
-                for row_num in range(1, len(detail_data) + 1):
-                    for col_num in range(1, 5):
-                        ws_detail.cell(row=row_num, column=col_num).alignment = Alignment(horizontal='center', vertical='center')
-
-                # 设置差值列颜色（正数红色，负数黑色）- 保持宋体14号
-                for row_num in range(3, len(detail_data) + 1):
-                    if row_num in [18, 24]:  # 跳过分类标题行
-                        continue
-                    cell = ws_detail.cell(row=row_num, column=4)
-                    cell_value = cell.value
-                    # 判断是否为正数（数值或百分比字符串）
-                    is_positive = False
-                    if isinstance(cell_value, (int, float)):
-                        is_positive = cell_value > 0
-                    elif isinstance(cell_value, str) and '%' in cell_value:
-                        try:
-                            num_val = float(cell_value.replace('%', ''))
-                            is_positive = num_val > 0
-                        except:
-                            pass
-                    if is_positive:
-                        cell.font = Font(name='宋体', size=14, color="FF0000")
-
-            except Exception as e:
-                # 捕获错误并打印详细调试信息
-                print(f"\n{'❌' * 30}")
-                print(f"❌ 处理门店时出错: {shop_name} (ID: {shop_id})")
-                print(f"❌ 错误类型: {type(e).__name__}")
-                print(f"❌ 错误信息: {str(e)}")
-                print(f"{'❌' * 30}")
-
-                # 打印第一周数据
-                debug_print_row(shop_id, shop_name, w1, "第一周数据 (week1_data)")
-
-                # 打印第二周数据
-                debug_print_row(shop_id, shop_name, w2, "第二周数据 (week2_data)")
-
-                # 打印完整的堆栈跟踪
-                print("\n📋 完整错误堆栈:")
-                traceback.print_exc()
-
-                # 记录出错的门店
-                error_shops.append({
-                    'shop_id': shop_id,
-                    'shop_name': shop_name,
-                    'error': str(e),
-                    'w1_data': w1,
-                    'w2_data': w2
-                })
+    try:
+        where_sql = " WHERE k.report_date BETWEEN %s AND %s"
+        params = [start_date, end_date]
+        if shop_ids_filter:
+            placeholders = ','.join(['%s'] * len(shop_ids_filter))
+            where_sql += f" AND k.shop_id IN ({placeholders})"
+            params.extend(shop_ids_filter)
 
-                # 继续处理下一个门店
+        stream = QueryStream(conn, DAILY_REPORT_SQL + where_sql + " ORDER BY k.report_date, k.shop_id", params)
+        date_index = stream.columns['report_date']
+
+        if workers:
+            print(f"📦 按天分 {workers} 个进程写出")
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=_init_daily_range_worker,
+                                           initargs=(shop_mapping, region_mapping))
+
+        for report_date, values in itertools.groupby(stream, key=lambda row: _date_text(row[date_index])):
+            output_filename = os.path.join(output_dir or '', daily_report_filename(report_date, format))
+            coupon_7days_mapping = trailing_kpis_by_date.get(report_date, {}).get('coupon_orders_7days', {})
+
+            if not workers:
+                rows = (RowView(stream.columns, row) for row in values)
+                files[report_date] = _write_daily_report(report_date, rows, shop_mapping, region_mapping,
+                                                         coupon_7days_mapping, output_filename, streaming,
+                                                         format=format)
+                if progress_callback:
+                    progress_callback(len(files), len(days))
                 continue
 
-        # 汇总表样式（周报/月报不含序号、运营、城市、销售四列）
-        # 设置列宽：A列(门店)=78，B列(数据周期)=26，其他列=15
-        ws_summary.column_dimensions['A'].width = 78
-        ws_summary.column_dimensions['B'].width = 26
-        for i in range(3, 17):
-            ws_summary.column_dimensions[get_column_letter(i)].width = 15
-
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+            # 在途天数达到进程数时先等一天写完，主进程内存只保留这几天的数据
+            if len(pending) >= workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(_write_daily_report_worker, report_date, stream.columns, list(values),
+                                     coupon_7days_mapping, output_filename, streaming, format)
+            pending[future] = report_date
 
-        # 浅绿色背景（门店行）#CCFFCC = RGB(204,255,204)
-        green_fill = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
-        # 红色字体
-        red_font = Font(color="FF0000")
-
-        for row in ws_summary.iter_rows(min_row=1, max_row=ws_summary.max_row, min_col=1, max_col=16):
-            for cell in row:
-                cell.border = thin_border
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-
-                # 表头行（第1列为"门店"）- 浅绿色背景加粗
-                if cell.column == 1 and cell.value == '门店':
-                    for c in row:
-                        c.font = Font(bold=True, size=10)
-                        c.fill = green_fill
-                elif cell.column == 2 and cell.value == '数据周期' and ws_summary.cell(row[0].row, 1).value == '':
-                    for c in row:
-                        c.font = Font(bold=True, size=10)
-                        c.fill = green_fill
-
-                # 差值行 - "差值"文字红色，数值红色，不设灰色背景
-                if cell.column == 2 and cell.value == '差值':
-                    for c in row:
-                        # 差值行所有数值都设为红色
-                        if c.column == 2:  # "差值"文字本身也红色
-                            c.font = red_font
-                        elif c.column > 2:  # 数值列红色
-                            c.font = red_font
-
-        # 合并A列单元格：每个门店8行，合并第2-8行（门店名行到差值行）
-        # 规则：第1行是表头，第2行是门店名，第3-8行A列为空需要合并
-        # 即合并 2-8, 10-16, 18-24, 26-32 ...
-        row_idx = 2  # 从第2行开始（第一个门店名行）
-        while row_idx <= ws_summary.max_row:
-            merge_end = row_idx + 6  # 合并7行 (row_idx 到 row_idx+6)
-            if merge_end <= ws_summary.max_row:
-                # 只合并A列（门店）
-                ws_summary.merge_cells(start_row=row_idx, start_column=1, end_row=merge_end, end_column=1)
-            row_idx += 8  # 跳到下一个门店块
+        collect(list(pending))
 
-        # 保存文件
-        if not output_filename:
-            output_filename = f"周报 非餐 {week2_start.replace('-', '')}~{week2_end.replace('-', '')} {datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if stream is not None:
+            stream.close()
+        conn.close()
 
-        wb.save(output_filename)
+    for report_date in days:
+        if report_date not in files:
+            print(f"警告：{report_date} 没有数据")
+    print(f"✅ 日报批量生成完成: {start_date} ~ {end_date}，共 {len(files)} 个文件")
+    return [files[report_date] for report_date in days if report_date in files]
 
-        # 打印汇总信息
-        if error_shops:
-            print(f"\n{'=' * 60}")
-            print(f"⚠️ 警告: 有 {len(error_shops)} 个门店处理失败:")
-            for err in error_shops:
-                print(f"  - {err['shop_name']} (ID: {err['shop_id']}): {err['error']}")
-            print(f"{'=' * 60}")
-
-        print(f"✅ 周报生成成功: {output_filename}")
-        return output_filename
 
-    finally:
-        cursor.close()
-        conn.close()
+# ==================== 核心功能：生成周报 ====================
+@instrumented_report('weekly')
+def generate_weekly_report(week1_start, week1_end, week2_start, week2_end, output_filename=None, streaming=False,
+                           progress_callback=None, workers=None, format='xlsx', accounts=None):
+    """
+    生成周报（两周对比）
+    - Sheet 1: "汇总" - 每门店8行的横向结构
+    - Sheet 2-N: 门店详细 - 竖向31行结构
+
+    参数:
+        week1_start: str, 第一周开始日期 'YYYY-MM-DD'
+        week1_end: str, 第一周结束日期 'YYYY-MM-DD'
+        week2_start: str, 第二周开始日期 'YYYY-MM-DD'
+        week2_end: str, 第二周结束日期 'YYYY-MM-DD'
+        output_filename: str, 输出文件名
+        streaming: bool, 是否使用流式写入（write-only）模式
+        progress_callback: callable, 可选，进度回调 progress_callback(已处理门店数, 门店总数)
+        workers: int, 可选，门店详细Sheet 分片渲染的进程数（见 generate_comparison_report）
+        format: str, 可选，xlsx（默认）/ csv / ndjson / parquet（见 generate_comparison_report）
+        accounts: list, 可选，账号列表，只统计这些账号下的门店
+    """
+    return generate_comparison_report(COMPARISON_REPORT_LAYOUTS['weekly'], week1_start, week1_end,
+                                      week2_start, week2_end, output_filename=output_filename,
+                                      streaming=streaming, progress_callback=progress_callback, workers=workers,
+                                      format=format, accounts=accounts)
 
 
 # ==================== 核心功能：生成月报 ====================
-def generate_monthly_report(month1_start, month1_end, month2_start, month2_end, output_filename=None):
+@instrumented_report('monthly')
+def generate_monthly_report(month1_start, month1_end, month2_start, month2_end, output_filename=None, streaming=False,
+                            progress_callback=None, workers=None, format='xlsx', accounts=None):
     """
     生成月报（两个月对比）
     结构与周报完全相同，只是时间跨度从周变为月
@@ -1339,20 +3671,25 @@ def generate_monthly_report(month1_start, month1_end, month2_start, month2_end,
         month2_start: str, 第二个月开始日期 'YYYY-MM-DD'
         month2_end: str, 第二个月结束日期 'YYYY-MM-DD'
         output_filename: str, 输出文件名
+        streaming: bool, 是否使用流式写入（write-only）模式
+        progress_callback: callable, 可选，进度回调 progress_callback(已处理门店数, 门店总数)
+        workers: int, 可选，门店详细Sheet 分片渲染的进程数（见 generate_comparison_report）
+        format: str, 可选，xlsx（默认）/ csv / ndjson / parquet（见 generate_comparison_report）
+        accounts: list, 可选，账号列表，只统计这些账号下的门店
     """
-    # 生成默认文件名
-    if not output_filename:
-        output_filename = f"月报 非餐 {month2_start.replace('-', '')}~{month2_end.replace('-', '')} {datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
-
-    # 复用周报逻辑
-    return generate_weekly_report(month1_start, month1_end, month2_start, month2_end, output_filename)
+    return generate_comparison_report(COMPARISON_REPORT_LAYOUTS['monthly'], month1_start, month1_end,
+                                      month2_start, month2_end, output_filename=output_filename,
+                                      streaming=streaming, progress_callback=progress_callback, workers=workers,
+                                      format=format, accounts=accounts)
 
 
 # ==================== 核心功能：生成自定义报表 ====================
-def generate_custom_report(period1_start, period1_end, period2_start, period2_end, shop_ids=None, output_filename=None):
+@instrumented_report('custom')
+def generate_custom_report(period1_start, period1_end, period2_start, period2_end, shop_ids=None, output_filename=None,
+                           streaming=False, progress_callback=None, workers=None, format='xlsx', accounts=None):
     """
     生成自定义报表（两个自定义时间段对比，支持筛选门店）
-    结构与周报相同
+    结构与周报相同，汇总Sheet 多出序号、运营、城市、销售四列
 
     参数:
         period1_start: str, 第一个时期开始日期
@@ -1361,582 +3698,334 @@ def generate_custom_report(period1_start, period1_end, period2_start, period2_en
         period2_end: str, 第二个时期结束日期
         shop_ids: list, 门店ID列表，为空则查询所有门店
         output_filename: str, 输出文件名
+        streaming: bool, 是否使用流式写入（write-only）模式
+        progress_callback: callable, 可选，进度回调 progress_callback(已处理门店数, 门店总数)
+        workers: int, 可选，门店详细Sheet 分片渲染的进程数（见 generate_comparison_report）
+        format: str, 可选，xlsx（默认）/ csv / ndjson / parquet（见 generate_comparison_report）
+        accounts: list, 可选，账号列表，只统计这些账号下的门店
     """
-    # 获取门店信息映射
-    shop_mapping = get_shop_info_mapping()
+    return generate_comparison_report(COMPARISON_REPORT_LAYOUTS['custom'], period1_start, period1_end,
+                                      period2_start, period2_end, shop_ids=shop_ids,
+                                      output_filename=output_filename, streaming=streaming,
+                                      progress_callback=progress_callback, workers=workers, format=format,
+                                      accounts=accounts)
+
+
+# ==================== 核心功能：生成团队汇总报表 ====================
+# 主管/运营/销售的合计：复用周报/自定义报表的门店级时期汇总查询（iter_two_period_data），
+# 一次遍历把各门店的汇总值（整数，金额为分）累加到 运营 → 主管 → 全部 以及 销售 各级分组，
+# 比率/均价由分组合计重新计算（不是门店比率的平均）。只输出汇总Sheet，不生成门店详细Sheet
+TEAM_REPORT_METRICS = tuple(metric for block in PERIOD_SUMMARY_BLOCKS for _, metric in block)
+TEAM_REPORT_TITLES = tuple(title for block in PERIOD_SUMMARY_BLOCKS for title, _ in block)
+TEAM_REPORT_FIELDS = tuple(sorted({field for metric in TEAM_REPORT_METRICS
+                                   for field in COMPARISON_METRICS[metric][1:]}))
+TEAM_UNASSIGNED = '未分配'
+
+
+def _team_member(member_id, name):
+    """分组成员 (ID, 显示名称)：按 ID 分组（同名的不同用户不合并），未配置时为 (None, “未分配”)"""
+    return (member_id, name or TEAM_UNASSIGNED) if member_id is not None else (None, TEAM_UNASSIGNED)
+
+
+# 分组层级 -> 分组键（取自门店映射的 (ID, 名称) 元组；销售只有姓名，以姓名作为 ID）
+TEAM_REPORT_LEVELS = {
+    'operator': lambda info: (_team_member(info.get('manager_id'), info.get('manager')),
+                              _team_member(info.get('operator_id'), info.get('operator'))),
+    'manager': lambda info: (_team_member(info.get('manager_id'), info.get('manager')),),
+    'sales': lambda info: (_team_member(info.get('sales') or None, info.get('sales')),),
+    'all': lambda info: (),
+}
 
-    conn = CONNECTION_POOL.get_connection()
-    cursor = conn.cursor(dictionary=True)
 
-    try:
-        # 构建 SQL，支持门店筛选
-        shop_filter = ""
-        if shop_ids:
-            shop_filter = f"AND k.shop_id IN ({','.join(map(str, shop_ids))})"
+def accumulate_team_totals(shops, shop_mapping, chunk_size=None, progress_callback=None, total=None):
+    """
+    一次遍历门店流，按块把两个时期的汇总值累加到各层级分组
 
-        sql_period = f"""
-        SELECT
-            k.shop_id,
-            k.shop_name,
-            k.city,
-            SUM(k.verify_after_discount) as verify_after_discount,
-            SUM(k.exposure_users) as exposure_users,
-            SUM(k.visit_users) as visit_users,
-            SUM(k.order_users) as order_users,
-            SUM(k.order_coupon_count) as order_coupon_count,
-            SUM(k.verify_person_count) as verify_users,
-            SUM(k.verify_coupon_count) as verify_coupon_count,
-            SUM(k.order_sale_amount) as order_sale_amount,
-            SUM(k.verify_sale_amount) as verify_sale_amount,
-            SUM(k.coupon_pay_order_count) as coupon_orders,
-            SUM(p.view_phone_count) as phone_clicks,
-            SUM(k.promotion_cost) as promotion_cost,
-            SUM(k.promotion_exposure_count) as promotion_exposure,
-            SUM(k.promotion_click_count) as promotion_clicks,
-            SUM(p.order_count) as promotion_orders,
-            SUM(p.view_groupbuy_count) as view_groupbuy,
-            SUM(p.view_phone_count) as view_phone,
-            SUM(k.consult_users) as consult_users,
-            SUM(p.view_address_count) as address_clicks,
-            SUM(k.new_collect_users) as new_collect,
-            SUM(k.new_good_review_count) as new_good_reviews,
-            SUM(k.new_review_count) as new_reviews,
-            SUM(s.checkin_count) as checkin_count
-        FROM kewen_daily_report k
-        LEFT JOIN promotion_daily_report p
-            ON k.shop_id = p.shop_id AND k.report_date = p.report_date
-        LEFT JOIN store_stats s
-            ON k.shop_id = s.store_id AND k.report_date = s.date
-        WHERE k.report_date BETWEEN %s AND %s {shop_filter}
-        GROUP BY k.shop_id, k.shop_name, k.city
-        ORDER BY k.shop_id
-        """
+    参数:
+        shops: iter_two_period_data 的产出 (shop_id, 时期1行, 时期2行)
+        shop_mapping: get_shop_info_mapping 的结果
+        chunk_size: int, 每块门店数，默认 REPORT_FETCH_CHUNK_ROWS
+        progress_callback / total: 每块处理完后回调 progress_callback(已处理门店数, total)
+    返回:
+        (totals, shop_count, errors)
+        totals: {层级: {分组键: [门店数, 时期1合计, 时期2合计]}}，分组键为 TEAM_REPORT_LEVELS 的 (ID, 名称) 元组，
+                合计为与 TEAM_REPORT_FIELDS 对齐的整数列表
+                （金额为分，取整方式与 compute_comparison_metrics 相同）
+        errors: [(shop_id, 异常)]，数值无法转换的门店不计入合计
+    """
+    chunk_size = chunk_size or REPORT_FETCH_CHUNK_ROWS
+    totals = {level: {} for level in TEAM_REPORT_LEVELS}
+    shop_count = 0
+    errors = []
+    shops = iter(shops)
+    while True:
+        chunk = list(itertools.islice(shops, chunk_size))
+        if not chunk:
+            break
+        chunk_errors = {}
+        period_rows = []
+        for n in (1, 2):
+            columns = _load_period_columns([shop[n] for shop in chunk], TEAM_REPORT_FIELDS, chunk_errors)
+            period_rows.append(list(zip(*(_to_list(columns[field]) for field in TEAM_REPORT_FIELDS))))
+
+        for index, (shop_id, _, _) in enumerate(chunk):
+            if index in chunk_errors:
+                errors.append((shop_id, chunk_errors[index]))
+                continue
+            info = shop_mapping.get(str(shop_id), {})
+            values1, values2 = period_rows[0][index], period_rows[1][index]
+            for level, group_key in TEAM_REPORT_LEVELS.items():
+                key = group_key(info)
+                group = totals[level].get(key)
+                if group is None:
+                    totals[level][key] = [1, list(values1), list(values2)]
+                else:
+                    group[0] += 1
+                    group[1] = [a + b for a, b in zip(group[1], values1)]
+                    group[2] = [a + b for a, b in zip(group[2], values2)]
 
-        # 获取两个时期的数据
-        cursor.execute(sql_period, (period1_start, period1_end))
-        period1_data = {row['shop_id']: row for row in cursor.fetchall()}
+        shop_count += len(chunk)
+        if progress_callback:
+            progress_callback(shop_count, total)
+    return totals, shop_count, errors
 
-        cursor.execute(sql_period, (period2_start, period2_end))
-        period2_data = {row['shop_id']: row for row in cursor.fetchall()}
 
-        all_shop_ids_set = set(period1_data.keys()) | set(period2_data.keys())
+def _team_metric_columns(groups):
+    """分组合计 [门店数, 时期1合计, 时期2合计] 列表 -> compute_comparison_metrics 的指标列（下标与 groups 对齐）"""
+    def to_row(values):
+        return {field: Decimal(value) / 100 if field in COMPARISON_AMOUNT_FIELDS else value
+                for field, value in zip(TEAM_REPORT_FIELDS, values)}
 
-        if not all_shop_ids_set:
-            print("警告：没有找到数据")
-            return None
+    columns, _ = compute_comparison_metrics([to_row(group[1]) for group in groups],
+                                            [to_row(group[2]) for group in groups], TEAM_REPORT_METRICS)
+    return columns
 
-        print(f"📊 找到 {len(all_shop_ids_set)} 个门店数据")
 
-        # 创建 Excel
-        wb = openpyxl.Workbook()
-        ws_summary = wb.active
-        ws_summary.title = "自定义报表"
-
-        # 格式化日期周期
-        period1_str = f"{datetime.strptime(period1_start, '%Y-%m-%d').strftime('%Y.%m.%d')}-{datetime.strptime(period1_end, '%Y-%m-%d').strftime('%Y.%m.%d')}"
-        period2_str = f"{datetime.strptime(period2_start, '%Y-%m-%d').strftime('%Y.%m.%d')}-{datetime.strptime(period2_end, '%Y-%m-%d').strftime('%Y.%m.%d')}"
-
-        # 辅助函数 - 安全版本
-        def get_val(data, key, default=0):
-            """安全获取值，处理None"""
-            if not data:
-                return default
-            value = data.get(key)
-            if value is None:
-                return default
-            return value
-
-        def calc_rate(numerator, denominator):
-            if denominator and denominator > 0:
-                return round(numerator / denominator * 100, 1)
-            return 0
+def _write_team_sheet(ws, key_columns, entries, periods):
+    """
+    团队汇总Sheet：表头 + 每个分组3行（时期1、时期2、差值），分组列与门店数列3行合并
+    key_columns: [(列标题, 列宽), ...]
+    entries: [(分组列的值, [门店数, 时期1合计, 时期2合计], 是否小计/合计行), ...]
+    """
+    key_count = len(key_columns)
+    header = [title for title, _ in key_columns] + ['门店数', '数据周期'] + list(TEAM_REPORT_TITLES)
+    widths = [width for _, width in key_columns] + [10, 26] + [15] * len(TEAM_REPORT_TITLES)
+    for col, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    append_styled_rows(ws, [header], [['period_summary_header'] * len(header)])
+
+    columns = _team_metric_columns([group for _, group, _ in entries])
+    label_col = key_count + 2
+    for index, (key_values, group, is_subtotal) in enumerate(entries):
+        blank = [''] * (key_count + 1)
+        rows = [
+            list(key_values) + [group[0], periods[0]] + [
+                _format_metric(m, columns[m][0][index]) for m in TEAM_REPORT_METRICS],
+            blank + [periods[1]] + [_format_metric(m, columns[m][1][index]) for m in TEAM_REPORT_METRICS],
+            blank + ['差值'] + [
+                _format_metric(m, columns[m][2][index], PERIOD_SUMMARY_RATE_DIGITS) for m in TEAM_REPORT_METRICS],
+        ]
+        style = 'team_subtotal' if is_subtotal else 'plain'
+        styles = [[style] * len(header), [style] * len(header),
+                  [style] * (label_col - 1) + ['period_summary_diff'] * (len(header) - label_col + 1)]
+        append_styled_rows(ws, rows, styles)
+        first_row = index * 3 + 2
+        for col in range(1, label_col):
+            col_letter = get_column_letter(col)
+            merge_report_cells(ws, f"{col_letter}{first_row}:{col_letter}{first_row + 2}")
 
-        def calc_avg_price(total, count):
-            if count and count > 0:
-                return round(total / count, 2)
-            return 0
 
-        # 用于处理重名 Sheet
-        sheet_names_used = {}
-        seq_num = 1
+def _team_sort_key(member):
+    """分组成员按名称（同名时按 ID）排序，“未分配”排在最后"""
+    member_id, name = member
+    return (member_id is None, name, str(member_id))
 
-        # 记录有问题的门店
-        error_shops = []
 
-        for shop_id in sorted(all_shop_ids_set):
-            p1 = period1_data.get(shop_id, {})
-            p2 = period2_data.get(shop_id, {})
-            shop_name = p2.get('shop_name') or p1.get('shop_name', '未知门店')
+def _team_names(key):
+    """分组键 -> 各分组列显示的名称"""
+    return tuple(name for _, name in key)
 
-            # 从映射中获取运营、城市、销售
-            shop_id_str = str(shop_id)
-            shop_info = shop_mapping.get(shop_id_str, {})
-            operator = shop_info.get('operator', '--') or '--'
-            sales = shop_info.get('sales', '--') or '--'
-            city = shop_info.get('city', '--') or '--'
 
-            try:
-                # ==================== 汇总表数据（与周报相同的8行结构）====================
-                # 时期1指标
-                p1_verify_discount = get_val(p1, 'verify_after_discount')
-                p1_exposure = get_val(p1, 'exposure_users')
-                p1_visit = get_val(p1, 'visit_users')
-                p1_order_users = get_val(p1, 'order_users')
-                p1_order_coupons = get_val(p1, 'order_coupon_count')
-                p1_verify_users = get_val(p1, 'verify_users')
-                p1_verify_coupons = get_val(p1, 'verify_coupon_count')
-                p1_order_amount = get_val(p1, 'order_sale_amount')
-                p1_verify_amount = get_val(p1, 'verify_sale_amount')
-                p1_coupon_orders = get_val(p1, 'coupon_orders')
-                p1_phone_clicks = get_val(p1, 'phone_clicks')
-
-                p1_exposure_rate = f"{calc_rate(p1_visit, p1_exposure)}%"
-                p1_order_rate = f"{calc_rate(p1_order_users, p1_visit)}%"
-                p1_avg_price = calc_avg_price(p1_verify_discount, p1_verify_users)
-
-                # 时期2指标
-                p2_verify_discount = get_val(p2, 'verify_after_discount')
-                p2_exposure = get_val(p2, 'exposure_users')
-                p2_visit = get_val(p2, 'visit_users')
-                p2_order_users = get_val(p2, 'order_users')
-                p2_order_coupons = get_val(p2, 'order_coupon_count')
-                p2_verify_users = get_val(p2, 'verify_users')
-                p2_verify_coupons = get_val(p2, 'verify_coupon_count')
-                p2_order_amount = get_val(p2, 'order_sale_amount')
-                p2_verify_amount = get_val(p2, 'verify_sale_amount')
-                p2_coupon_orders = get_val(p2, 'coupon_orders')
-                p2_phone_clicks = get_val(p2, 'phone_clicks')
-
-                p2_exposure_rate = f"{calc_rate(p2_visit, p2_exposure)}%"
-                p2_order_rate = f"{calc_rate(p2_order_users, p2_visit)}%"
-                p2_avg_price = calc_avg_price(p2_verify_discount, p2_verify_users)
-
-                # 差值计算
-                diff_verify_discount = round(p2_verify_discount - p1_verify_discount, 2)
-                diff_exposure = p2_exposure - p1_exposure
-                diff_visit = p2_visit - p1_visit
-
-                def calc_rate_diff(rate1_str, rate2_str):
-                    val1 = float(rate1_str.rstrip('%')) if rate1_str != '0%' else 0
-                    val2 = float(rate2_str.rstrip('%')) if rate2_str != '0%' else 0
-                    return f"{round(val2 - val1, 1)}%"
-
-                diff_exposure_rate = calc_rate_diff(p1_exposure_rate, p2_exposure_rate)
-                diff_order_users = p2_order_users - p1_order_users
-                diff_order_coupons = p2_order_coupons - p1_order_coupons
-                diff_order_rate = calc_rate_diff(p1_order_rate, p2_order_rate)
-                diff_verify_users = p2_verify_users - p1_verify_users
-                diff_verify_coupons = p2_verify_coupons - p1_verify_coupons
-                diff_order_amount = round(p2_order_amount - p1_order_amount, 2)
-                diff_verify_amount = round(p2_verify_amount - p1_verify_amount, 2)
-                diff_coupon_orders = p2_coupon_orders - p1_coupon_orders
-                diff_phone_clicks = p2_phone_clicks - p1_phone_clicks
-                diff_avg_price = round(p2_avg_price - p1_avg_price, 2)
-
-                # 推广通数据
-                p1_promo_cost = get_val(p1, 'promotion_cost')
-                p1_promo_exposure = get_val(p1, 'promotion_exposure')
-                p1_promo_clicks = get_val(p1, 'promotion_clicks')
-                p1_promo_orders = get_val(p1, 'promotion_orders')
-                p1_view_groupbuy = get_val(p1, 'view_groupbuy')
-                p1_view_phone = get_val(p1, 'view_phone')
-                p1_consult = get_val(p1, 'consult_users')
-                p1_address = get_val(p1, 'address_clicks')
-                p1_collect = get_val(p1, 'new_collect')
-                p1_good_reviews = get_val(p1, 'new_good_reviews')
-                p1_click_price = calc_avg_price(p1_promo_cost, p1_promo_clicks)
-                p1_promo_rate = f"{calc_rate(p1_promo_orders, p1_promo_clicks)}%"
-                p1_collect_rate = f"{calc_rate(p1_collect, p1_visit)}%"
-                p1_review_rate = f"{calc_rate(p1_good_reviews, p1_verify_users)}%"
-
-                p2_promo_cost = get_val(p2, 'promotion_cost')
-                p2_promo_exposure = get_val(p2, 'promotion_exposure')
-                p2_promo_clicks = get_val(p2, 'promotion_clicks')
-                p2_promo_orders = get_val(p2, 'promotion_orders')
-                p2_view_groupbuy = get_val(p2, 'view_groupbuy')
-                p2_view_phone = get_val(p2, 'view_phone')
-                p2_consult = get_val(p2, 'consult_users')
-                p2_address = get_val(p2, 'address_clicks')
-                p2_collect = get_val(p2, 'new_collect')
-                p2_good_reviews = get_val(p2, 'new_good_reviews')
-                p2_click_price = calc_avg_price(p2_promo_cost, p2_promo_clicks)
-                p2_promo_rate = f"{calc_rate(p2_promo_orders, p2_promo_clicks)}%"
-                p2_collect_rate = f"{calc_rate(p2_collect, p2_visit)}%"
-                p2_review_rate = f"{calc_rate(p2_good_reviews, p2_verify_users)}%"
-
-                diff_promo_cost = round(p2_promo_cost - p1_promo_cost, 2)
-                diff_promo_exposure = p2_promo_exposure - p1_promo_exposure
-                diff_promo_clicks = p2_promo_clicks - p1_promo_clicks
-                diff_click_price = round(p2_click_price - p1_click_price, 2)
-                diff_promo_orders = p2_promo_orders - p1_promo_orders
-                diff_promo_rate = calc_rate_diff(p1_promo_rate, p2_promo_rate)
-                diff_view_groupbuy = p2_view_groupbuy - p1_view_groupbuy
-                diff_view_phone = p2_view_phone - p1_view_phone
-                diff_consult = p2_consult - p1_consult
-                diff_address = p2_address - p1_address
-                diff_collect = p2_collect - p1_collect
-                diff_collect_rate = calc_rate_diff(p1_collect_rate, p2_collect_rate)
-                diff_good_reviews = p2_good_reviews - p1_good_reviews
-                diff_review_rate = calc_rate_diff(p1_review_rate, p2_review_rate)
-
-                # ==================== 汇总Sheet 8行结构（与周报一致）====================
-                # 行1: 核销数据表头（新增4列：序号、运营、城市、销售）
-                header_row1 = [
-                    '序号', '运营', '城市', '销售', '门店', '数据周期', '优惠后核销额', '曝光人数', '访问人数', '曝光访问转化率',
-                    '下单人数', '下单券数', '下单转化率', '核销人数', '核销券数',
-                    '下单售价金额', '核销售价金额', '优惠码订单', '电话点击', '客单价'
-                ]
-                ws_summary.append(header_row1)
-
-                # 行2: 第一个时期核销数据（带门店信息）
-                row2 = [
-                    seq_num, operator, city, sales, shop_name, period1_str,
-                    round(p1_verify_discount, 2), p1_exposure, p1_visit, p1_exposure_rate,
-                    p1_order_users, p1_order_coupons, p1_order_rate,
-                    p1_verify_users, p1_verify_coupons,
-                    round(p1_order_amount, 2), round(p1_verify_amount, 2),
-                    p1_coupon_orders, p1_phone_clicks, p1_avg_price
-                ]
-                ws_summary.append(row2)
-
-                # 行3: 第二个时期核销数据（前5列为空）
-                row3 = [
-                    '', '', '', '', '', period2_str,
-                    round(p2_verify_discount, 2), p2_exposure, p2_visit, p2_exposure_rate,
-                    p2_order_users, p2_order_coupons, p2_order_rate,
-                    p2_verify_users, p2_verify_coupons,
-                    round(p2_order_amount, 2), round(p2_verify_amount, 2),
-                    p2_coupon_orders, p2_phone_clicks, p2_avg_price
-                ]
-                ws_summary.append(row3)
-
-                # 行4: 核销差值（前5列为空）
-                row4 = [
-                    '', '', '', '', '', '差值',
-                    diff_verify_discount, diff_exposure, diff_visit, diff_exposure_rate,
-                    diff_order_users, diff_order_coupons, diff_order_rate,
-                    diff_verify_users, diff_verify_coupons,
-                    diff_order_amount, diff_verify_amount,
-                    diff_coupon_orders, diff_phone_clicks, diff_avg_price
-                ]
-                ws_summary.append(row4)
-
-                # 行5: 推广通表头（前5列为空）
-                header_row2 = [
-                    '', '', '', '', '', '数据周期', '推广通花费', '推广通曝光', '推广通点击', '推广通点击均价',
-                    '推广通订单量', '推广通下单转化率', '推广通查看团购', '推广通查看电话',
-                    '在线咨询', '地址点击', '门店收藏', '收藏率', '新增好评数', '留评率'
-                ]
-                ws_summary.append(header_row2)
-
-                # 行6: 第一个时期推广通数据（前5列为空）
-                row6 = [
-                    '', '', '', '', '', period1_str,
-                    round(p1_promo_cost, 2), p1_promo_exposure, p1_promo_clicks, p1_click_price,
-                    p1_promo_orders, p1_promo_rate, p1_view_groupbuy, p1_view_phone,
-                    p1_consult, p1_address, p1_collect, p1_collect_rate,
-                    p1_good_reviews, p1_review_rate
-                ]
-                ws_summary.append(row6)
-
-                # 行7: 第二个时期推广通数据（前5列为空）
-                row7 = [
-                    '', '', '', '', '', period2_str,
-                    round(p2_promo_cost, 2), p2_promo_exposure, p2_promo_clicks, p2_click_price,
-                    p2_promo_orders, p2_promo_rate, p2_view_groupbuy, p2_view_phone,
-                    p2_consult, p2_address, p2_collect, p2_collect_rate,
-                    p2_good_reviews, p2_review_rate
-                ]
-                ws_summary.append(row7)
-
-                # 行8: 推广通差值（前5列为空）
-                row8 = [
-                    '', '', '', '', '', '差值',
-                    diff_promo_cost, diff_promo_exposure, diff_promo_clicks, diff_click_price,
-                    diff_promo_orders, diff_promo_rate, diff_view_groupbuy, diff_view_phone,
-                    diff_consult, diff_address, diff_collect, diff_collect_rate,
-                    diff_good_reviews, diff_review_rate
-                ]
-                ws_summary.append(row8)
-
-                # ==================== 门店详细Sheet（竖向31行）====================
-                sheet_name = clean_sheet_name(shop_name)
-                if sheet_name in sheet_names_used:
-                    sheet_names_used[sheet_name] += 1
-                    sheet_name = f"{sheet_name[:28]}_{sheet_names_used[sheet_name]}"
-                else:
-                    sheet_names_used[sheet_name] = 1
-
-                ws_detail = wb.create_sheet(title=sheet_name)
-
-                # 计算额外指标（直接计算百分比值，不使用公式）
-                p1_exposure_rate_val = f"{calc_rate(p1_visit, p1_exposure)}%" if p1_exposure > 0 else "0%"
-                p2_exposure_rate_val = f"{calc_rate(p2_visit, p2_exposure)}%" if p2_exposure > 0 else "0%"
-                p1_intent_rate_val = f"{calc_rate(p1_order_users, p1_visit)}%" if p1_visit > 0 else "0%"
-                p2_intent_rate_val = f"{calc_rate(p2_order_users, p2_visit)}%" if p2_visit > 0 else "0%"
-                p1_review_rate_val = f"{calc_rate(p1_good_reviews, p1_verify_users)}%" if p1_verify_users > 0 else "0%"
-                p2_review_rate_val = f"{calc_rate(p2_good_reviews, p2_verify_users)}%" if p2_verify_users > 0 else "0%"
-                p1_collect_rate_val = f"{calc_rate(p1_collect, p1_order_users)}%" if p1_order_users > 0 else "0%"
-                p2_collect_rate_val = f"{calc_rate(p2_collect, p2_order_users)}%" if p2_order_users > 0 else "0%"
-
-                p1_checkin = get_val(p1, 'checkin_count')
-                p2_checkin = get_val(p2, 'checkin_count')
-
-                # 计算差值
-                diff_exposure_val = p2_exposure - p1_exposure
-                diff_visit_val = p2_visit - p1_visit
-                diff_exposure_rate_val = f"{round(calc_rate(p2_visit, p2_exposure) - calc_rate(p1_visit, p1_exposure), 2)}%"
-                diff_order_users_val = p2_order_users - p1_order_users
-                diff_verify_users_val = p2_verify_users - p1_verify_users
-                diff_intent_rate_val = f"{round(calc_rate(p2_order_users, p2_visit) - calc_rate(p1_order_users, p1_visit), 2)}%"
-                diff_order_coupons_val = p2_order_coupons - p1_order_coupons
-                diff_verify_coupons_val = p2_verify_coupons - p1_verify_coupons
-                diff_order_amount_val = round(p2_order_amount - p1_order_amount, 2)
-                diff_verify_amount_val = round(p2_verify_amount - p1_verify_amount, 2)
-                diff_verify_discount_val = round(p2_verify_discount - p1_verify_discount, 2)
-                diff_avg_price_val = round(p2_avg_price - p1_avg_price, 2)
-                diff_phone_val = p2_phone_clicks - p1_phone_clicks
-                diff_address_val = p2_address - p1_address
-                diff_consult_val = p2_consult - p1_consult
-                diff_good_reviews_val = p2_good_reviews - p1_good_reviews
-                diff_review_rate_val = f"{round(calc_rate(p2_good_reviews, p2_verify_users) - calc_rate(p1_good_reviews, p1_verify_users), 2)}%"
-                diff_collect_val = p2_collect - p1_collect
-                diff_collect_rate_val = f"{round(calc_rate(p2_collect, p2_order_users) - calc_rate(p1_collect, p1_order_users), 2)}%"
-                diff_checkin_val = p2_checkin - p1_checkin
-                diff_promo_orders_val = p2_promo_orders - p1_promo_orders
-                diff_promo_cost_val = round(p2_promo_cost - p1_promo_cost, 2)
-                diff_promo_exposure_val = p2_promo_exposure - p1_promo_exposure
-                diff_promo_clicks_val = p2_promo_clicks - p1_promo_clicks
-                diff_click_price_val = round(p2_click_price - p1_click_price, 2)
-                diff_view_groupbuy_val = p2_view_groupbuy - p1_view_groupbuy
-                diff_view_phone_val = p2_view_phone - p1_view_phone
-
-                # 构建竖向表格（31行）- 使用计算后的值而不是公式
-                detail_data = [
-                    [shop_name, '', '', ''],
-                    ['指标项/时间周期', period1_str, period2_str, '差值\n（红色为上升/黑色为下降）'],
-                    ['曝光人数：', p1_exposure, p2_exposure, diff_exposure_val],
-                    ['访问人数：', p1_visit, p2_visit, diff_visit_val],
-                    ['曝光访问转化率：', p1_exposure_rate_val, p2_exposure_rate_val, diff_exposure_rate_val],
-                    ['下单人数：', p1_order_users, p2_order_users, diff_order_users_val],
-                    ['核销人数：', p1_verify_users, p2_verify_users, diff_verify_users_val],
-                    ['意向转化率：', p1_intent_rate_val, p2_intent_rate_val, diff_intent_rate_val],
-                    ['下单券数：', p1_order_coupons, p2_order_coupons, diff_order_coupons_val],
-                    ['核销券数：', p1_verify_coupons, p2_verify_coupons, diff_verify_coupons_val],
-                    ['下单售价金额：', round(p1_order_amount, 2), round(p2_order_amount, 2), diff_order_amount_val],
-                    ['核销售价金额：', round(p1_verify_amount, 2), round(p2_verify_amount, 2), diff_verify_amount_val],
-                    ['优惠后核销金额：', round(p1_verify_discount, 2), round(p2_verify_discount, 2), diff_verify_discount_val],
-                    ['客单价：', p1_avg_price, p2_avg_price, diff_avg_price_val],
-                    ['电话点击：', p1_phone_clicks, p2_phone_clicks, diff_phone_val],
-                    ['地址点击：', p1_address, p2_address, diff_address_val],
-                    ['在线咨询：', p1_consult, p2_consult, diff_consult_val],
-                    ['门店干预数据', '', '', ''],
-                    ['新增好评：', p1_good_reviews, p2_good_reviews, diff_good_reviews_val],
-                    ['留评率：', p1_review_rate_val, p2_review_rate_val, diff_review_rate_val],
-                    ['门店收藏：', p1_collect, p2_collect, diff_collect_val],
-                    ['收藏率：', p1_collect_rate_val, p2_collect_rate_val, diff_collect_rate_val],
-                    ['打卡人数：', p1_checkin, p2_checkin, diff_checkin_val],
-                    ['推广通数据', '', '', ''],
-                    ['推广通订单量', p1_promo_orders, p2_promo_orders, diff_promo_orders_val],
-                    ['推广通花费', round(p1_promo_cost, 2), round(p2_promo_cost, 2), diff_promo_cost_val],
-                    ['推广通曝光（次）', p1_promo_exposure, p2_promo_exposure, diff_promo_exposure_val],
-                    ['推广通点击（次）', p1_promo_clicks, p2_promo_clicks, diff_promo_clicks_val],
-                    ['推广通点击均价（元）', p1_click_price, p2_click_price, diff_click_price_val],
-                    ['查看团购（次）', p1_view_groupbuy, p2_view_groupbuy, diff_view_groupbuy_val],
-                    ['查看电话（次）', p1_view_phone, p2_view_phone, diff_view_phone_val],
-                ]
-
-                for row_data in detail_data:
-                    ws_detail.append(row_data)
-
-                # 合并门店名单元格 A1:D1
-                ws_detail.merge_cells('A1:D1')
-
-                # 合并第18行和第24行的A:D单元格
-                ws_detail.merge_cells('A18:D18')
-                ws_detail.merge_cells('A24:D24')
-
-                # 设置详细Sheet样式 - 列宽: A=25, B=36, C=36, D=20
-                ws_detail.column_dimensions['A'].width = 25
-                ws_detail.column_dimensions['B'].width = 36
-                ws_detail.column_dimensions['C'].width = 36
-                ws_detail.column_dimensions['D'].width = 20
-
-                # 设置行高：第1行=31，第2行到最后=20
-                ws_detail.row_dimensions[1].height = 31
-                for row_num in range(2, len(detail_data) + 1):
-                    ws_detail.row_dimensions[row_num].height = 20
-
-                # 定义颜色
-                header_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")  # RGB(189,215,238)
-                a_col_fill = PatternFill(start_color="DEEBF7", end_color="DEEBF7", fill_type="solid")  # RGB(222,235,247)
-
-                # 定义字体 - 宋体（SimSun）
-                title_font = Font(name='宋体', size=16, color="000000")
-                bcd_font = Font(name='宋体', size=14, color="000000")
-
-                # 标题样式 - 门店名居中加粗，宋体16号
-                ws_detail['A1'].font = Font(name='宋体', bold=True, size=16, color="000000")
-                ws_detail['A1'].alignment = Alignment(horizontal='center', vertical='center')
-
-                # 第2行（标题行）样式 - 背景色#BDD7EE，宋体16号黑色
-                for col in range(1, 5):
-                    cell = ws_detail.cell(row=2, column=col)
-                    cell.font = Font(name='宋体', bold=True, size=16, color="000000")
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-
-                # 第18行和第24行样式 - 背景色#BDD7EE，宋体16号黑色
-                for r in [18, 24]:
-                    cell = ws_detail.cell(row=r, column=1)
-                    cell.font = Font(name='宋体', bold=True, size=16, color="000000")
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center', vertical='center')
-
-                # A列其他行背景色 #DEEBF7，B/C/D列字体宋体14号
-                for row_num in range(3, len(detail_data) + 1):
-                    if row_num not in [18, 24]:  # 跳过已处理的分类标题行
-                        # A列背景色
-                        ws_detail.cell(row=row_num, column=1).fill = a_col_fill
-                        ws_detail.cell(row=row_num, column=1).font = Font(name='宋体', size=14, color="000000")
-                        # B/C/D列字体
-                        for col in range(2, 5):
-                            ws_detail.cell(row=row_num, column=col).font = bcd_font
-
-                # 应用边框
-                apply_border(ws_detail, 1, len(detail_data), 1, 4)
-
-                # 所有单元格居中对齐
-                for row_num in range(1, len(detail_data) + 1):
-                    for col_num in range(1, 5):
-                        ws_detail.cell(row=row_num, column=col_num).alignment = Alignment(horizontal='center', vertical='center')
-
-                # 设置差值列颜色（正数红色，负数黑色）- 保持宋体14号
-                for row_num in range(3, len(detail_data) + 1):
-                    if row_num in [18, 24]:  # 跳过分类标题行
-                        continue
-                    cell = ws_detail.cell(row=row_num, column=4)
-                    cell_value = cell.value
-                    is_positive = False
-                    if isinstance(cell_value, (int, float)):
-                        is_positive = cell_value > 0
-                    elif isinstance(cell_value, str) and '%' in cell_value:
-                        try:
-                            num_val = float(cell_value.replace('%', ''))
-                            is_positive = num_val > 0
-                        except:
-                            pass
-                    if is_positive:
-                        cell.font = Font(name='宋体', size=14, color="FF0000")
-
-                seq_num += 1
-
-            except Exception as e:
-                # 捕获错误并打印详细调试信息
-                print(f"\n{'❌' * 30}")
-                print(f"❌ 处理门店时出错: {shop_name} (ID: {shop_id})")
-                print(f"❌ 错误类型: {type(e).__name__}")
-                print(f"❌ 错误信息: {str(e)}")
-                print(f"{'❌' * 30}")
-
-                # 打印时期1数据
-                debug_print_row(shop_id, shop_name, p1, "时期1数据 (period1_data)")
-
-                # 打印时期2数据
-                debug_print_row(shop_id, shop_name, p2, "时期2数据 (period2_data)")
-
-                # 打印完整的堆栈跟踪
-                print("\n📋 完整错误堆栈:")
-                traceback.print_exc()
-
-                # 记录出错的门店
-                error_shops.append({
-                    'shop_id': shop_id,
-                    'shop_name': shop_name,
-                    'error': str(e),
-                    'p1_data': p1,
-                    'p2_data': p2
-                })
+@instrumented_report('team')
+def generate_team_report(period1_start, period1_end, period2_start, period2_end, shop_ids=None,
+                         output_filename=None, progress_callback=None, accounts=None):
+    """
+    生成团队汇总报表（两个时期对比，按 运营 → 主管 → 全部 及 销售 汇总）
+    - Sheet 1: "运营汇总" - 每个主管下各运营、主管小计，最后为全部门店合计
+    - Sheet 2: "销售汇总" - 各销售及全部门店合计
+    每个分组3行（时期1、时期2、差值），指标与周报汇总Sheet 相同；不生成门店详细Sheet
 
-                seq_num += 1
-                continue
+    门店级时期汇总与周报/自定义报表使用同一查询（优先读预汇总表），数据按块读取并在一次遍历中累加，
+    内存只与分组数有关
 
-        # 汇总表样式（与周报保持一致，20列）
-        # 设置列宽：A列(序号)=8，B列(运营)=18，C列(城市)=10，D列(销售)=10，E列(门店)=78，F列(数据周期)=26，其他列=15
-        ws_summary.column_dimensions['A'].width = 8
-        ws_summary.column_dimensions['B'].width = 18
-        ws_summary.column_dimensions['C'].width = 10
-        ws_summary.column_dimensions['D'].width = 10
-        ws_summary.column_dimensions['E'].width = 78
-        ws_summary.column_dimensions['F'].width = 26
-        for i in range(7, 21):
-            ws_summary.column_dimensions[get_column_letter(i)].width = 15
-
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+    参数:
+        period1_start, period1_end: str, 第一个时期起止日期 'YYYY-MM-DD'
+        period2_start, period2_end: str, 第二个时期起止日期 'YYYY-MM-DD'
+        shop_ids: list, 可选，门店ID列表，为空则统计所有门店
+        output_filename: str, 输出文件名
+        progress_callback: callable, 可选，进度回调 progress_callback(已处理门店数, 门店总数)
+        accounts: list, 可选，账号列表，只统计这些账号下的门店（与 shop_ids 同时提供时取交集）
+    """
+    shop_ids = resolve_shop_filter(shop_ids, accounts)
+    if shop_ids is not None and not shop_ids:
+        print("警告：没有匹配的门店")
+        return None
+    shop_mapping = get_shop_info_mapping(accounts)
+    dates = (period1_start, period1_end, period2_start, period2_end)
 
-        # 浅绿色背景（门店行）#CCFFCC = RGB(204,255,204)
-        green_fill = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
-        # 红色字体
-        red_font = Font(color="FF0000")
-
-        for row in ws_summary.iter_rows(min_row=1, max_row=ws_summary.max_row, min_col=1, max_col=20):
-            for cell in row:
-                cell.border = thin_border
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-
-                # 表头行（第1列为"序号"）- 浅绿色背景加粗
-                if cell.column == 1 and cell.value == '序号':
-                    for c in row:
-                        c.font = Font(bold=True, size=10)
-                        c.fill = green_fill
-                elif cell.column == 6 and cell.value == '数据周期' and ws_summary.cell(row[0].row, 1).value == '':
-                    for c in row:
-                        c.font = Font(bold=True, size=10)
-                        c.fill = green_fill
-
-                # 差值行 - "差值"文字红色，数值红色，不设灰色背景
-                if cell.column == 6 and cell.value == '差值':
-                    for c in row:
-                        # 差值行所有数值都设为红色
-                        if c.column == 6:  # "差值"文字本身也红色
-                            c.font = red_font
-                        elif c.column > 6:  # 数值列红色
-                            c.font = red_font
-
-        # 合并A列单元格：每个门店8行，合并第2-8行（门店名行到差值行）
-        # 规则：第1行是表头，第2行是门店名，第3-8行A列为空需要合并
-        # 即合并 2-8, 10-16, 18-24, 26-32 ...
-        row_idx = 2  # 从第2行开始（第一个门店名行）
-        while row_idx <= ws_summary.max_row:
-            merge_end = row_idx + 6  # 合并7行 (row_idx 到 row_idx+6)
-            if merge_end <= ws_summary.max_row:
-                # 合并A-E列（序号、运营、城市、销售、门店）
-                for col in range(1, 6):  # 列1-5
-                    ws_summary.merge_cells(start_row=row_idx, start_column=col, end_row=merge_end, end_column=col)
-            row_idx += 8  # 跳到下一个门店块
+    conn = get_db_connection()
 
-        # 保存文件
-        if not output_filename:
-            shop_count = len(all_shop_ids_set)
-            output_filename = f"自定义 {shop_count}家门店非餐 {period2_start.replace('-', '')}~{period2_end.replace('-', '')} {datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
+    try:
+        total = count_period_shops(conn, *dates, shop_ids=shop_ids) if progress_callback else None
+        loop_start = time.perf_counter()
+        totals, shop_count, errors = accumulate_team_totals(
+            iter_two_period_data(conn, *dates, shop_ids=shop_ids), shop_mapping,
+            progress_callback=progress_callback, total=total)
+        record_span('rows.loop', time.perf_counter() - loop_start, shops=shop_count)
+    finally:
+        conn.close()
+
+    if not shop_count:
+        print("警告：没有找到数据")
+        return None
+    print(f"📊 找到 {shop_count} 个门店数据")
+
+    periods = (format_period(period1_start, period1_end), format_period(period2_start, period2_end))
+    all_totals = totals['all'].get(())
+
+    # 运营汇总：主管 -> 运营，每个主管后接小计，最后为全部门店合计
+    operator_entries = []
+    for manager in sorted(totals['manager'], key=lambda key: _team_sort_key(key[0])):
+        operators = sorted((key for key in totals['operator'] if key[0] == manager[0]),
+                           key=lambda key: _team_sort_key(key[1]))
+        operator_entries += [(_team_names(key), totals['operator'][key], False) for key in operators]
+        operator_entries.append(((manager[0][1], '小计'), totals['manager'][manager], True))
+    # 销售汇总
+    sales_entries = [(_team_names(key), totals['sales'][key], False)
+                     for key in sorted(totals['sales'], key=lambda key: _team_sort_key(key[0]))]
+    if all_totals:
+        operator_entries.append((('全部', ''), all_totals, True))
+        sales_entries.append((('全部',), all_totals, True))
+
+    wb = create_report_workbook()
+    ws_operator = wb.active
+    ws_operator.title = '运营汇总'
+    with metrics_span('styling.team'):
+        _write_team_sheet(ws_operator, (('主管', 14), ('运营', 14)), operator_entries, periods)
+        _write_team_sheet(wb.create_sheet('销售汇总'), (('销售', 14),), sales_entries, periods)
+
+    if errors:
+        print(f"⚠️ {len(errors)} 个门店数据异常，未计入汇总：")
+        for shop_id, e in errors:
+            print(f"   门店ID {shop_id}: {type(e).__name__}: {e}")
 
+    if not output_filename:
+        output_filename = '团队汇总 非餐 {start}~{end} {now}.xlsx'.format(
+            start=period2_start.replace('-', ''), end=period2_end.replace('-', ''),
+            now=datetime.now().strftime('%Y%m%d%H%M%S'))
+    with metrics_span('save'):
         wb.save(output_filename)
 
-        # 打印汇总信息
-        if error_shops:
-            print(f"\n{'=' * 60}")
-            print(f"⚠️ 警告: 有 {len(error_shops)} 个门店处理失败:")
-            for err in error_shops:
-                print(f"  - {err['shop_name']} (ID: {err['shop_id']}): {err['error']}")
-            print(f"{'=' * 60}")
-
-        print(f"✅ 自定义报表生成成功: {output_filename}")
-        return output_filename
+    if progress_callback:
+        progress_callback(shop_count, shop_count)
+
+    print(f"✅ 团队汇总报表生成成功: {output_filename}"
+          f"（{len(totals['manager'])} 个主管、{len(totals['operator'])} 个运营、{len(totals['sales'])} 个销售）")
+    return output_filename
+
+
+# ==================== 按类型生成报表 ====================
+REPORT_GENERATORS = {
+    'daily': generate_daily_report,
+    'weekly': generate_weekly_report,
+    'monthly': generate_monthly_report,
+    'custom': generate_custom_report,
+    'team': generate_team_report,
+}
+
+
+def run_report(report_type, params):
+    """
+    按报表类型生成报表（模块级函数，可在线程池或进程池中执行）
+
+    参数:
+        report_type: str, daily / weekly / monthly / custom / team
+        params: dict, 对应生成函数的参数
+
+    返回:
+        dict: {'type', 'status', 'filename' 或 'message', 'elapsed'(秒)}
+    """
+    start = time.perf_counter()
+    generator = REPORT_GENERATORS.get(report_type)
+    if generator is None:
+        result = {'type': report_type, 'status': 'error', 'message': f'未知的报表类型: {report_type}'}
+    else:
+        try:
+            filename = generator(**params)
+            if filename:
+                result = {'type': report_type, 'status': 'success', 'filename': filename}
+            else:
+                result = {'type': report_type, 'status': 'error', 'message': '没有数据'}
+        except Exception as e:
+            result = {'type': report_type, 'status': 'error', 'message': str(e)}
+    result['elapsed'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+# ==================== 报表数据版本 ====================
+def get_report_date_range(report_type, params):
+    """
+    报表读取的源数据日期范围
+    日报还会读取近N天指标（DAILY_TRAILING_KPIS），因此范围从报表日期前 最大天数 - 1 天开始
+    返回: (start_date, end_date) 'YYYY-MM-DD'
+    """
+    if report_type == 'daily':
+        report_date = params['report_date']
+        start_date = datetime.strptime(report_date, '%Y-%m-%d') - timedelta(days=daily_trailing_lookback_days())
+        return start_date.strftime('%Y-%m-%d'), report_date
+
+    prefix = {'weekly': 'week', 'monthly': 'month', 'custom': 'period', 'team': 'period'}[report_type]
+    dates = [params[f'{prefix}{n}_{edge}'] for n in (1, 2) for edge in ('start', 'end')]
+    return min(dates), max(dates)
+
+
+def get_report_data_version(report_type, params):
+    """
+    报表源数据的版本号：日期范围内各源表的 MAX(updated_at) + 行数，以及账号/运营映射的版本
+    （周报/自定义报表还包括评价详情表）
+    任何一项变化（数据重新上传、补录、删除、账号配置变更）都会得到不同的版本号
+    返回: str
+    """
+    start_date, end_date = get_report_date_range(report_type, params)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+        SELECT
+            (SELECT MAX(updated_at) FROM kewen_daily_report WHERE report_date BETWEEN %s AND %s) as kewen_updated_at,
+            (SELECT COUNT(*) FROM kewen_daily_report WHERE report_date BETWEEN %s AND %s) as kewen_count,
+            (SELECT MAX(updated_at) FROM promotion_daily_report WHERE report_date BETWEEN %s AND %s) as promotion_updated_at,
+            (SELECT COUNT(*) FROM promotion_daily_report WHERE report_date BETWEEN %s AND %s) as promotion_count,
+            (SELECT MAX(updated_at) FROM store_stats WHERE date BETWEEN %s AND %s) as stats_updated_at,
+            (SELECT COUNT(*) FROM store_stats WHERE date BETWEEN %s AND %s) as stats_count
+        """, [start_date, end_date] * 6)
+        row = cursor.fetchone()
+
+        version = list(row.values()) + list(ShopMappingCache._load_version(cursor))
+
+        # 带评价分析Sheet 的报表：日期范围内评价详情表的 MAX(updated_at) + 行数（走 idx_add_time）
+        if COMPARISON_REPORT_LAYOUTS.get(report_type, {}).get('review_sheet'):
+            end_next = (datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            for source_table, _ in REVIEW_SOURCES.values():
+                cursor.execute(f"""
+                SELECT MAX(updated_at) as updated_at, COUNT(*) as review_count
+                FROM {source_table}
+                WHERE add_time >= %s AND add_time < %s
+                """, (start_date, end_next))
+                version += list(cursor.fetchone().values())
+        return '|'.join(str(value) for value in version)
 
     finally:
         cursor.close()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共夹具：报表读取 benchmark.py 的 SQLite 替身库（按 jx_data_info.sql 建表），不需要 MySQL
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+import report_generator  # noqa: E402
+
+
+@pytest.fixture
+def report_db(tmp_path, monkeypatch):
+    """
+    空的 SQLite 替身库，报表的全局连接池指向它；测试结束后恢复原连接池并清空映射缓存
+    返回: 写入测试数据用的 sqlite3 连接（autocommit）
+    """
+    path = str(tmp_path / 'report.sqlite3')
+    conn = sqlite3.connect(path, isolation_level=None)
+    benchmark.create_sqlite_schema(conn, benchmark.SCHEMA_FILE)
+    monkeypatch.chdir(tmp_path)
+
+    previous = report_generator.set_connection_pool(benchmark.SQLitePool(path))
+    report_generator.invalidate_mapping_cache()
+    yield conn
+    report_generator.set_connection_pool(previous)
+    report_generator.invalidate_mapping_cache()
+    conn.close()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""对比指标的整列计算（numpy / 标准库 array 两种实现）与原逐门店浮点公式一致"""
+
+import array
+from decimal import Decimal
+
+import pytest
+
+import report_generator as rg
+
+# 每个门店 (时期1行, 时期2行)：金额为 MySQL 返回的 Decimal
+SHOPS = [
+    # 普通值
+    ({'verify_after_discount': Decimal('1234.56'), 'exposure_users': 980, 'visit_users': 123, 'order_users': 17,
+      'verify_users': 9, 'new_collect': 4, 'promotion_cost': Decimal('88.80'), 'promotion_clicks': 37,
+      'promotion_orders': 3, 'new_good_reviews': 2},
+     {'verify_after_discount': Decimal('2001.01'), 'exposure_users': 1010, 'visit_users': 131, 'order_users': 22,
+      'verify_users': 11, 'new_collect': 6, 'promotion_cost': Decimal('90.05'), 'promotion_clicks': 41,
+      'promotion_orders': 5, 'new_good_reviews': 3}),
+    # 分母为0
+    ({'verify_after_discount': Decimal('10.00'), 'exposure_users': 0, 'visit_users': 5, 'verify_users': 0},
+     {'exposure_users': 0, 'visit_users': 0, 'order_users': 0, 'verify_users': 0, 'promotion_clicks': 0}),
+    # 某时期没有数据 / 字段为 NULL
+    ({}, {'exposure_users': 50, 'visit_users': 7, 'order_users': None, 'verify_after_discount': None}),
+    ({'exposure_users': 40, 'visit_users': 9, 'order_users': 2, 'verify_users': 1,
+      'verify_after_discount': Decimal('99.99')}, {}),
+    # .5 进位边界：6.25% / 18.75%，均价 0.125 / 0.375 元
+    ({'exposure_users': 16, 'visit_users': 1, 'order_users': 1, 'verify_users': 2,
+      'verify_after_discount': Decimal('0.25')},
+     {'exposure_users': 16, 'visit_users': 3, 'order_users': 1, 'verify_users': 2,
+      'verify_after_discount': Decimal('0.75')}),
+]
+
+
+def _get_val(row, key):
+    return (row.get(key) if row else None) or 0
+
+
+def _calc_rate(numerator, denominator):
+    if denominator and denominator > 0:
+        return round(numerator / denominator * 100, 1)
+    return 0
+
+
+def _calc_avg_price(total, count):
+    if count and count > 0:
+        return round(total / count, 2)
+    return 0
+
+
+def _baseline(metric, row1, row2):
+    """原报表的逐门店浮点公式 -> (时期1, 时期2, 差值)"""
+    kind, *fields = rg.COMPARISON_METRICS[metric]
+    if kind == 'count':
+        v1, v2 = _get_val(row1, fields[0]), _get_val(row2, fields[0])
+        return v1, v2, v2 - v1
+    if kind == 'amount':
+        v1, v2 = _get_val(row1, fields[0]), _get_val(row2, fields[0])
+        return round(v1, 2), round(v2, 2), round(v2 - v1, 2)
+    calc = _calc_rate if kind == 'rate' else _calc_avg_price
+    v1, v2 = (calc(_get_val(row, fields[0]), _get_val(row, fields[1])) for row in (row1, row2))
+    return v1, v2, round(v2 - v1, 2)
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(rg, 'numpy', None)
+    return request.param
+
+
+def test_columns_match_baseline_formulas(backend):
+    columns, errors = rg.compute_comparison_metrics([r1 for r1, _ in SHOPS], [r2 for _, r2 in SHOPS])
+    assert errors == {}
+    for metric in rg.COMPARISON_METRICS:
+        for index, (row1, row2) in enumerate(SHOPS):
+            # 分母为0的百分比/差值为 None，显示为 0%，与原公式的 0 相同
+            got = tuple(0 if value is None else value for value in (column[index] for column in columns[metric]))
+            assert got == pytest.approx(tuple(float(value) for value in _baseline(metric, row1, row2))), \
+                (backend, metric, index)
+
+
+def test_half_even_div(backend):
+    """商的 .5 取偶数，分母为0时为0"""
+    numerator, denominator = [5, 15, 25, 7, 9], [2, 2, 2, 0, 4]
+    if backend == 'numpy':
+        numerator, denominator = (rg.numpy.array(column, dtype=rg.numpy.int64) for column in (numerator, denominator))
+    else:
+        numerator, denominator = array.array('q', numerator), array.array('q', denominator)
+    assert rg._to_list(rg._half_even_div(numerator, denominator)) == [2, 8, 12, 0, 2]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""ReportConnectionPool：按需建连、排队先来先得、超时、归还时交接与坏连接丢弃"""
+
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+import report_generator as rg
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.in_transaction = False
+        self.broken = False
+        self.closed = False
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def reset_session(self):
+        if self.broken:
+            raise mysql.connector.errors.OperationalError(msg='连接已断开')
+
+    def ping(self, reconnect=False):
+        if self.broken:
+            raise mysql.connector.errors.InterfaceError(msg='连接已断开')
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """替换 mysql.connector.connect，返回已建立的假连接列表"""
+    created = []
+
+    def connect(**config):
+        created.append(FakeConnection(len(created)))
+        return created[-1]
+
+    monkeypatch.setattr(rg.mysql.connector, 'connect', connect)
+    return created
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.001)
+
+
+def test_connections_are_created_on_demand_and_reused(connections):
+    pool = rg.ReportConnectionPool('test', pool_size=2)
+    first, second = pool.get_connection(), pool.get_connection()
+    assert len(connections) == 2
+
+    first.in_transaction = True
+    first.close()
+    assert connections[0].in_transaction is False  # 归还时回滚未提交事务
+    again = pool.get_connection()
+    assert again.number == 0 and len(connections) == 2
+    assert pool.stats()['in_use'] == 2
+
+    again.close()
+    second.close()
+    assert pool.stats()['idle'] == 2
+
+
+def test_checkout_times_out_when_pool_is_full(connections):
+    pool = rg.ReportConnectionPool('test', pool_size=1, timeout=0.05)
+    held = pool.get_connection()
+    with pytest.raises(rg.PoolExhausted):
+        pool.get_connection()
+
+    stats = pool.stats()
+    assert (stats['timeouts'], stats['waits'], stats['waiting']) == (1, 1, 0)
+    held.close()
+    pool.get_connection().close()  # 超时的请求不占用名额
+
+
+def test_released_connection_is_handed_to_waiters_in_fifo_order(connections):
+    pool = rg.ReportConnectionPool('test', pool_size=1, timeout=5)
+    held = pool.get_connection()
+    order = []
+
+    def worker(name):
+        conn = pool.get_connection()
+        order.append((name, conn.number))
+        conn.close()
+
+    threads = []
+    for name in range(3):
+        thread = threading.Thread(target=worker, args=(name,))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: pool.stats()['waiting'] == name + 1)
+
+    held.close()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [(0, 0), (1, 0), (2, 0)]
+    assert len(connections) == 1
+    stats = pool.stats()
+    assert (stats['in_use'], stats['idle'], stats['waiting'], stats['timeouts']) == (0, 1, 0, 0)
+
+
+def test_broken_connection_is_discarded_and_slot_handed_off(connections):
+    pool = rg.ReportConnectionPool('test', pool_size=1, timeout=5)
+    held = pool.get_connection()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.get_connection()))
+    waiter.start()
+    _wait_for(lambda: pool.stats()['waiting'] == 1)
+
+    connections[0].broken = True
+    held.close()  # 重置会话失败：丢弃连接，名额交给等待者，由它新建连接
+    waiter.join(5)
+
+    assert connections[0].closed
+    assert result[0].number == 1
+    assert pool.stats()['discarded'] == 1
+    result[0].close()
+
+
+def test_idle_connection_is_pinged_and_replaced_when_dead(connections):
+    pool = rg.ReportConnectionPool('test', pool_size=1, ping_seconds=0)
+    pool.get_connection().close()
+    connections[0].broken = True
+
+    conn = pool.get_connection()
+    assert conn.number == 1
+    assert connections[0].closed
+    assert pool.stats()['reconnects'] == 1
+    conn.close()
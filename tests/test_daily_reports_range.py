@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""按日期范围生成日报：每天的文件与逐天调用 generate_daily_report 的结果一致"""
+
+import os
+from datetime import date, timedelta
+
+import openpyxl
+import pytest
+
+import benchmark
+import report_generator as rg
+
+# 数据覆盖 12-01 ~ 12-14：范围开头的近7天窗口跨到范围之前，12-15 没有数据（跳过）
+START_DATE, END_DATE = '2025-12-10', '2025-12-15'
+
+
+def _snapshot(path):
+    wb = openpyxl.load_workbook(path)
+    return [(ws.title,
+             [tuple(cell.value for cell in row) for row in ws.iter_rows()],
+             sorted(str(cell_range) for cell_range in ws.merged_cells.ranges),
+             [tuple(cell.style for cell in row) for row in ws.iter_rows()])
+            for ws in wb.worksheets]
+
+
+@pytest.mark.parametrize('accounts', [None, ['bench0001a']])
+def test_date_range_matches_single_days(report_db, tmp_path, accounts):
+    benchmark.insert_dataset(report_db, benchmark.generate_dataset(shops=24, days=14, end_date=date(2025, 12, 14)), '?')
+
+    paths = rg.generate_daily_reports(START_DATE, END_DATE, accounts=accounts, output_dir=str(tmp_path / 'range'))
+    assert len(paths) == 5
+    for offset, path in enumerate(paths):
+        report_date = (date.fromisoformat(START_DATE) + timedelta(days=offset)).isoformat()
+        assert report_date.replace('-', '') in os.path.basename(path)
+        single = rg.generate_daily_report(report_date, accounts=accounts,
+                                          output_filename=str(tmp_path / f'single_{report_date}.xlsx'))
+        assert _snapshot(path) == _snapshot(single), os.path.basename(path)
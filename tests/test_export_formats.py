@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""机器可读导出（CSV / NDJSON）与同一数据生成的 Excel 报表取值一致"""
+
+import csv
+import json
+from datetime import date
+
+import openpyxl
+import pytest
+
+import benchmark
+import report_generator as rg
+
+REPORT_DATE = '2025-12-14'
+WEEKS = ('2025-12-01', '2025-12-07', '2025-12-08', '2025-12-14')
+
+# 日报汇总Sheet 列标题 -> 导出列
+DAILY_SUMMARY_COLUMNS = {
+    '序号': 'seq', '运营': 'operator', '城市': 'city', '销售': 'sales', '门店': 'shop_name',
+    '曝光人数': 'exposure_users', '访问人数': 'visit_users', '下单人数': 'order_users', '核销人数': 'verify_users',
+    '下单券数': 'order_coupon_count', '核销券数': 'verify_coupon_count', '电话点击': 'phone_clicks',
+    '地址点击': 'address_clicks', '推广通消耗': 'promotion_cost', '好评': 'new_good_review_count',
+    '意向转化率': 'intent_rate', '下单售价金额': 'order_sale_amount', '核销售价金额': 'verify_sale_amount',
+    '优惠后核销金额': 'verify_after_discount',
+}
+
+
+def _read_export(path, format, columns):
+    """读回导出文件：CSV 按导出列类型还原（空串为空值）"""
+    with open(path, encoding='utf-8', newline='') as f:
+        if format == 'ndjson':
+            return [json.loads(line) for line in f]
+        types = dict(columns)
+        parse = {'str': str, 'int': int, 'float': float, 'bool': lambda value: value == 'True'}
+        return [{name: None if value == '' else parse[types[name]](value) for name, value in row.items()}
+                for row in csv.DictReader(f)]
+
+
+@pytest.fixture
+def dataset(report_db):
+    benchmark.insert_dataset(report_db, benchmark.generate_dataset(shops=6, days=14, end_date=date(2025, 12, 14)), '?')
+    return report_db
+
+
+@pytest.mark.parametrize('format', ['csv', 'ndjson'])
+def test_daily_export_matches_summary_sheet(dataset, tmp_path, format):
+    xlsx = rg.generate_daily_report(REPORT_DATE, output_filename=str(tmp_path / 'daily.xlsx'))
+    exported = rg.generate_daily_report(REPORT_DATE, output_filename=str(tmp_path / f'daily.{format}'), format=format)
+
+    sheet_rows = list(openpyxl.load_workbook(xlsx)['汇总'].iter_rows(values_only=True))
+    header, sheet_rows = sheet_rows[0], sheet_rows[1:]
+    rows = _read_export(exported, format, rg.DAILY_EXPORT_COLUMNS)
+    assert len(rows) == len(sheet_rows) == 6
+    for sheet_row, row in zip(sheet_rows, rows):
+        assert row['report_date'] == REPORT_DATE
+        for title, value in zip(header, sheet_row):
+            if title in DAILY_SUMMARY_COLUMNS:
+                assert row[DAILY_SUMMARY_COLUMNS[title]] == value, (row['shop_id'], title)
+
+
+def test_weekly_export_matches_detail_sheets(dataset, tmp_path):
+    xlsx = rg.generate_weekly_report(*WEEKS, output_filename=str(tmp_path / 'weekly.xlsx'))
+    exported = rg.generate_weekly_report(*WEEKS, output_filename=str(tmp_path / 'weekly.ndjson'), format='ndjson')
+
+    detail_sheets = openpyxl.load_workbook(xlsx).worksheets[1:]
+    rows = _read_export(exported, 'ndjson', rg.comparison_export_columns())
+    assert len(rows) == len(detail_sheets) == 6
+    for ws, row in zip(detail_sheets, rows):
+        assert (row['period1_start'], row['period1_end'], row['period2_start'], row['period2_end']) == WEEKS
+        values = {label: (p1, p2, diff) for label, p1, p2, diff in ws.iter_rows(min_row=3, values_only=True)}
+        for label, metric in rg.PERIOD_DETAIL_ROWS:
+            if metric is None:
+                continue
+            assert values[label] == (
+                rg._format_metric(metric, row[f'{metric}_p1']),
+                rg._format_metric(metric, row[f'{metric}_p2']),
+                rg._format_metric(metric, row[f'{metric}_diff'], rg.PERIOD_DETAIL_RATE_DIGITS),
+            ), (row['shop_id'], label)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""门店映射缓存：版本号只随映射读取的列变化"""
+
+import json
+
+import report_generator as rg
+
+
+def _version():
+    conn = rg.get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return rg.ShopMappingCache._load_version(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def test_mapping_version_ignores_login_and_cookie_updates(report_db):
+    report_db.execute("INSERT INTO saas_users (id, username, password, name, role, manager_id) "
+                      "VALUES (20, 'u20', '-', '李专员', 'operation_specialist', NULL)")
+    report_db.execute("INSERT INTO platform_accounts (account, operator_id, stores_json) VALUES ('acc1', 20, ?)",
+                      (json.dumps([{'shop_id': 1}]),))
+    version = _version()
+
+    report_db.execute("UPDATE saas_users SET last_login_at = '2025-12-16 08:00:00', updated_at = '2025-12-16 08:00:00'")
+    report_db.execute("UPDATE platform_accounts SET cookie = '{}', updated_at = '2025-12-16 08:00:00'")
+    assert _version() == version
+
+    report_db.execute("UPDATE saas_users SET name = '李四'")
+    renamed = _version()
+    assert renamed != version
+
+    report_db.execute("UPDATE platform_accounts SET stores_json = ?", (json.dumps([{'shop_id': 1}, {'shop_id': 2}]),))
+    assert _version() != renamed
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""时期内改名的门店：原始日表与预汇总表两条路径都合并为一行（汇总值相加，名称/城市取最后一天）"""
+
+import benchmark
+import report_generator as rg
+
+PERIODS = ('2025-12-08', '2025-12-14', '2025-12-01', '2025-12-07')
+GROUP_FIELDS = ('shop_id', 'shop_name', 'city')
+
+
+def _load(conn):
+    rows = [(f'2025-12-{day:02d}', 1, '旧店名' if day < 11 else '新店名', '北京' if day < 11 else '上海', 10)
+            for day in range(1, 15)]
+    rows += [(f'2025-12-{day:02d}', 2, '门店2', '广州', 5) for day in range(1, 15)]
+    conn.executemany("INSERT INTO kewen_daily_report (report_date, shop_id, shop_name, city, exposure_users) "
+                     "VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def _periods():
+    conn = rg.get_db_connection()
+    try:
+        return [(shop_id, {field: p1[field] for field in (*GROUP_FIELDS, 'exposure_users')},
+                 {field: p2[field] for field in (*GROUP_FIELDS, 'exposure_users')})
+                for shop_id, p1, p2 in rg.iter_two_period_data(conn, *PERIODS, group_fields=GROUP_FIELDS)]
+    finally:
+        conn.close()
+
+
+def test_raw_and_rollup_paths_merge_renamed_shop(report_db, monkeypatch):
+    _load(report_db)
+    monkeypatch.setattr(rg, 'ROLLUP_ENABLED', False)
+    raw = _periods()
+
+    monkeypatch.setattr(rg, 'ROLLUP_ENABLED', True)
+    monkeypatch.setattr(rg, '_ROLLUP_TABLES_MISSING', False)
+    benchmark.create_sqlite_schema(report_db, benchmark.ROLLUP_SCHEMA_FILE)
+    rollup = _periods()
+
+    assert raw == rollup
+    assert raw[0] == (1, {'shop_id': 1, 'shop_name': '新店名', 'city': '上海', 'exposure_users': 70},
+                      {'shop_id': 1, 'shop_name': '旧店名', 'city': '北京', 'exposure_users': 70})
+    assert raw[1][1]['exposure_users'] == 35
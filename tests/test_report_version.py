@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""报表数据版本：日报的读取范围覆盖近N天指标的全部天数"""
+
+import report_generator as rg
+
+
+def test_daily_date_range_follows_longest_trailing_kpi(monkeypatch):
+    assert rg.get_report_date_range('daily', {'report_date': '2025-12-14'}) == ('2025-12-08', '2025-12-14')
+
+    monkeypatch.setitem(rg.DAILY_TRAILING_KPIS, 'new_reviews_30days', ('sum', ('new_reviews',), 30))
+    assert rg.get_report_date_range('daily', {'report_date': '2025-12-14'}) == ('2025-11-15', '2025-12-14')
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""评价日汇总：详情表的“无回复/无订单”占位值不计入回复数与消费后评价数"""
+
+import benchmark
+import report_generator as rg
+
+PLACEHOLDER_TIME = '1997-12-08 00:00:00'
+
+
+def _add_review(conn, review_id, shop_id, add_time, shop_reply_time=PLACEHOLDER_TIME, order_id=0,
+                consume_date='1997-12-08', updated_at=None):
+    conn.execute("INSERT INTO review_detail_dianping (id, review_id, shop_id, shop_name, add_time, star, pic_count, "
+                 "video_count, shop_reply, shop_reply_time, order_id, consume_date, updated_at) "
+                 "VALUES (?, ?, ?, ?, ?, 50, 0, 0, ?, ?, ?, ?, ?)",
+                 (review_id, str(review_id), shop_id, f'门店{shop_id}', add_time,
+                  '暂无回复' if shop_reply_time == PLACEHOLDER_TIME else '感谢光临', shop_reply_time,
+                  order_id, consume_date, updated_at or add_time))
+
+
+def _daily(conn, shop_id, review_date):
+    return conn.execute("SELECT review_count, reply_count, reply_seconds, after_consume_count FROM shop_review_daily "
+                        "WHERE platform = 'dianping' AND shop_id = ? AND review_date = ?",
+                        (shop_id, review_date)).fetchone()
+
+
+def test_placeholder_rows_are_not_replies_or_after_consume(report_db):
+    benchmark.create_sqlite_schema(report_db, benchmark.REVIEW_SCHEMA_FILE)
+    # 两条占位行（未回复、无订单）
+    _add_review(report_db, 1, 1, '2025-12-01 10:00:00')
+    _add_review(report_db, 2, 1, '2025-12-01 11:00:00')
+    # 1 小时后回复、有订单
+    _add_review(report_db, 3, 1, '2025-12-01 12:00:00', '2025-12-01 13:00:00', order_id=123)
+    # 无订单但有真实消费日期
+    _add_review(report_db, 4, 1, '2025-12-01 14:00:00', consume_date='2025-11-30')
+    rg.sync_review_stats()
+
+    assert _daily(report_db, 1, '2025-12-01') == (4, 1, 3600, 2)
+
+
+def test_incremental_sync_rebuilds_each_shop_range_only(report_db):
+    benchmark.create_sqlite_schema(report_db, benchmark.REVIEW_SCHEMA_FILE)
+    for shop_id in (1, 2):
+        _add_review(report_db, shop_id * 10 + 1, shop_id, '2024-12-03 10:00:00')
+        _add_review(report_db, shop_id * 10 + 2, shop_id, '2025-12-01 10:00:00')
+    rg.sync_review_stats()  # 首次全量构建
+    assert _daily(report_db, 2, '2024-12-03')[0] == 1
+
+    # 标记门店2的历史行：门店2只新增了近期评价，历史行不应被重算
+    report_db.execute("UPDATE shop_review_daily SET review_count = -1 WHERE shop_id = 2 AND review_date = '2024-12-03'")
+    # 门店1一年前的评价被商家回复（updated_at 更新），门店2新增评价
+    report_db.execute("UPDATE review_detail_dianping SET shop_reply_time = '2024-12-03 11:00:00', "
+                      "updated_at = '2025-12-16 00:00:00' WHERE id = 11")
+    _add_review(report_db, 23, 2, '2025-12-01 12:00:00')
+    rg.sync_review_stats()
+
+    assert _daily(report_db, 1, '2024-12-03') == (1, 1, 3600, 0)
+    assert _daily(report_db, 2, '2025-12-01')[0] == 2
+    assert _daily(report_db, 2, '2024-12-03')[0] == -1
+    assert report_db.execute("SELECT last_id FROM review_sync_state WHERE platform = 'dianping'").fetchone()[0] == 23
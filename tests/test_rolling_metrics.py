@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""RollingMetrics：近N天合计与逐日暴力求和一致"""
+
+import random
+
+import pytest
+
+from report_generator import RollingMetrics
+
+FIELDS = ('coupon_orders', 'ad_orders')
+WINDOW = 7
+
+
+def _brute_sum(daily, field, days, day):
+    index = FIELDS.index(field)
+    return sum(values[index] for fed_day, values in daily.items() if day - days < fed_day <= day)
+
+
+def test_sum_matches_brute_force_window():
+    rnd = random.Random(7)
+    rolling = RollingMetrics(FIELDS, WINDOW)
+    daily = {shop_id: {} for shop_id in ('1', '2', '3')}
+    start = 739000
+
+    for day in range(start, start + 40):
+        for shop_id, fed in daily.items():
+            # 门店有缺数的日期，也有同一天分多次喂入
+            if rnd.random() < 0.3:
+                continue
+            for _ in range(rnd.choice((1, 1, 2))):
+                values = [rnd.randint(0, 9) for _ in FIELDS]
+                rolling.add(shop_id, day, values)
+                fed[day] = [a + b for a, b in zip(fed.get(day, [0] * len(FIELDS)), values)]
+
+        # 窗口内的历史日期、当天以及之后的日期都可查询
+        for shop_id, fed in daily.items():
+            for query_day in range(day - 3, day + 3):
+                for days in range(1, WINDOW + 1):
+                    if query_day - days < day - WINDOW:
+                        continue
+                    for field in FIELDS:
+                        assert rolling.sum(shop_id, field, days, query_day) == _brute_sum(fed, field, days, query_day), \
+                            (shop_id, field, days, query_day)
+
+
+def test_unknown_shop_and_rate():
+    rolling = RollingMetrics(FIELDS, WINDOW)
+    assert rolling.sum('9', 'coupon_orders', 7, 739000) == 0
+    assert rolling.rate('9', 'coupon_orders', 'ad_orders', 7, 739000) is None
+
+    rolling.add('1', 739000, [3, 4])
+    rolling.add('1', 739002, [1, 0])
+    assert rolling.rate('1', 'coupon_orders', 'ad_orders', 7, 739002) == 100.0
+    assert rolling.mean('1', 'coupon_orders', 2, 739002) == 0.5
+
+
+def test_out_of_order_and_out_of_window_requests_are_rejected():
+    rolling = RollingMetrics(FIELDS, WINDOW)
+    rolling.add('1', 739010, [1, 1])
+    with pytest.raises(ValueError):
+        rolling.add('1', 739009, [1, 1])
+    with pytest.raises(ValueError):
+        rolling.sum('1', 'coupon_orders', WINDOW + 1, 739010)
+
+    rolling.add('1', 739030, [1, 1])
+    with pytest.raises(ValueError):
+        rolling.sum('1', 'coupon_orders', 1, 739015)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""预汇总表增量同步：每个门店只重算自己上传的日期范围"""
+
+import benchmark
+import report_generator as rg
+
+DATES = ('2024-12-02', '2024-12-03', '2025-12-01', '2025-12-02')
+
+
+def _fact(conn, shop_id, report_date):
+    return conn.execute("SELECT exposure_users FROM shop_daily_fact WHERE shop_id = ? AND report_date = ?",
+                        (shop_id, report_date)).fetchone()[0]
+
+
+def _week(conn, shop_id, week_start):
+    return conn.execute("SELECT exposure_users FROM shop_weekly_rollup WHERE shop_id = ? AND week_start = ?",
+                        (shop_id, week_start)).fetchone()[0]
+
+
+def test_incremental_sync_rebuilds_each_shop_range_only(report_db):
+    benchmark.create_sqlite_schema(report_db, benchmark.ROLLUP_SCHEMA_FILE)
+    report_db.execute("INSERT INTO rollup_sync_state (name, last_log_id, synced_at) VALUES (?, 0, NULL)",
+                      (rg.ROLLUP_STATE_NAME,))
+    for shop_id in (1, 2):
+        for report_date in DATES:
+            report_db.execute("INSERT INTO kewen_daily_report (report_date, shop_id, shop_name, exposure_users) "
+                              "VALUES (?, ?, ?, 10)", (report_date, shop_id, f'门店{shop_id}'))
+    report_db.execute("INSERT INTO data_upload_log (id, account_id, shop_id, table_name, data_date_start, "
+                      "data_date_end, upload_status) VALUES (1, 'acc1', '1', 'kewen_daily_report', ?, ?, 2)",
+                      (DATES[0], DATES[-1]))
+    rg.sync_rollup_tables()  # 首次全量构建
+    assert _fact(report_db, 2, '2024-12-03') == 10
+
+    # 标记门店2的历史行：门店2只上传了近期数据，历史行不应被重算
+    report_db.execute("UPDATE shop_daily_fact SET exposure_users = -1 WHERE shop_id = 2 AND report_date = '2024-12-03'")
+    # 门店1补录一年前的数据，门店2上传近期数据
+    report_db.execute("UPDATE kewen_daily_report SET exposure_users = 100 WHERE shop_id = 1 AND report_date = '2024-12-03'")
+    report_db.execute("UPDATE kewen_daily_report SET exposure_users = 200 WHERE shop_id = 2 AND report_date = '2025-12-02'")
+    report_db.execute("INSERT INTO data_upload_log (id, account_id, shop_id, table_name, data_date_start, "
+                      "data_date_end, upload_status) VALUES "
+                      "(2, 'acc1', '1', 'kewen_daily_report', '2024-12-03', '2024-12-03', 2), "
+                      "(3, 'acc1', '2', 'kewen_daily_report', '2025-12-02', '2025-12-02', 2)")
+    rg.sync_rollup_tables()
+
+    assert _fact(report_db, 1, '2024-12-03') == 100
+    assert _fact(report_db, 2, '2025-12-02') == 200
+    assert _week(report_db, 1, '2024-12-02') == 110
+    assert _week(report_db, 2, '2025-12-01') == 210
+    assert _fact(report_db, 2, '2024-12-03') == -1
+    assert report_db.execute("SELECT last_log_id FROM rollup_sync_state").fetchone()[0] == 3
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""多进程分片生成：合并后的工作簿与单进程生成的内容、合并单元格、样式一致"""
+
+from datetime import date
+
+import openpyxl
+
+import benchmark
+import report_generator as rg
+
+WEEKS = ('2025-12-01', '2025-12-07', '2025-12-08', '2025-12-14')
+
+
+def _snapshot(path):
+    wb = openpyxl.load_workbook(path)
+    return [(ws.title,
+             [tuple(cell.value for cell in row) for row in ws.iter_rows()],
+             sorted(str(cell_range) for cell_range in ws.merged_cells.ranges),
+             [tuple(cell.style for cell in row) for row in ws.iter_rows()])
+            for ws in wb.worksheets]
+
+
+def test_sharded_weekly_report_matches_single_process(report_db, tmp_path):
+    benchmark.insert_dataset(report_db, benchmark.generate_dataset(shops=12, days=14, end_date=date(2025, 12, 14)), '?')
+
+    single = rg.generate_weekly_report(*WEEKS, output_filename=str(tmp_path / 'single.xlsx'))
+    sharded = rg.generate_weekly_report(*WEEKS, output_filename=str(tmp_path / 'sharded.xlsx'), workers=3)
+
+    expected = _snapshot(single)
+    assert len(expected) == 13  # 汇总 + 12 家门店
+    assert _snapshot(sharded) == expected
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""团队汇总报表：运营 → 主管 的层级与按用户ID分组"""
+
+import json
+
+import openpyxl
+
+import report_generator as rg
+
+PERIODS = ('2025-12-01', '2025-12-01', '2025-12-02', '2025-12-02')
+
+# (id, 姓名, 上级ID)：两个同名主管、两个同名运营，王专员没有上级
+USERS = [
+    (10, '张经理', None),
+    (11, '张经理', None),
+    (20, '李专员', 10),
+    (21, '李专员', 11),
+    (22, '王专员', None),
+]
+# (账号, 运营ID, 门店ID列表, 销售)
+ACCOUNTS = [
+    ('acc1', 20, [1, 2], '销售甲'),
+    ('acc2', 21, [3], '销售甲'),
+    ('acc3', 22, [4], None),
+    ('acc4', None, [5], '销售乙'),
+]
+
+
+def _exposure(shop_id, day_no):
+    return shop_id * 100 + day_no
+
+
+def _populate(conn):
+    for user_id, name, manager_id in USERS:
+        conn.execute("INSERT INTO saas_users (id, username, password, name, role, manager_id) VALUES (?, ?, '-', ?, ?, ?)",
+                     (user_id, f'u{user_id}', name,
+                      'operation_specialist' if manager_id else 'operation_manager', manager_id))
+    for account, operator_id, shop_ids, sales in ACCOUNTS:
+        conn.execute("INSERT INTO platform_accounts (account, operator_id, stores_json, sales_name) VALUES (?, ?, ?, ?)",
+                     (account, operator_id, json.dumps([{'shop_id': shop_id} for shop_id in shop_ids]), sales))
+        for shop_id in shop_ids:
+            for day_no, day in enumerate(('2025-12-01', '2025-12-02'), start=1):
+                conn.execute("INSERT INTO kewen_daily_report (report_date, shop_id, shop_name, exposure_users, visit_users) "
+                             "VALUES (?, ?, ?, ?, ?)", (day, shop_id, f'门店{shop_id}', _exposure(shop_id, day_no), 1))
+
+
+def _groups(ws, key_count):
+    """每个分组3行（时期1、时期2、差值）-> [(分组列, 门店数, 时期1曝光人数, 时期2曝光人数)]"""
+    header = [cell.value for cell in ws[1]]
+    exposure_col = header.index('曝光人数')
+    rows = list(ws.iter_rows(min_row=2, values_only=True))
+    return [(rows[i][:key_count], rows[i][key_count], rows[i][exposure_col], rows[i + 1][exposure_col])
+            for i in range(0, len(rows), 3)]
+
+
+def test_shop_mapping_resolves_operator_and_manager(report_db):
+    _populate(report_db)
+    mapping = rg.get_shop_info_mapping()
+
+    assert mapping['1'] == {'operator': '李专员', 'operator_id': 20, 'manager': '张经理', 'manager_id': 10,
+                            'sales': '销售甲', 'city': ''}
+    assert (mapping['3']['operator_id'], mapping['3']['manager_id']) == (21, 11)
+    assert (mapping['4']['operator'], mapping['4']['manager_id']) == ('王专员', None)
+    assert (mapping['5']['operator_id'], mapping['5']['manager_id']) == (None, None)
+
+
+def test_team_report_groups_by_operator_and_manager_ids(report_db):
+    _populate(report_db)
+    filename = rg.generate_team_report(*PERIODS)
+    wb = openpyxl.load_workbook(filename)
+
+    def exposure(shop_ids):
+        return (sum(_exposure(shop_id, 1) for shop_id in shop_ids), sum(_exposure(shop_id, 2) for shop_id in shop_ids))
+
+    unassigned = rg.TEAM_UNASSIGNED
+    # 同名的两个主管、两个运营分别成组；王专员和未配置运营的门店归入“未分配”主管
+    assert _groups(wb['运营汇总'], 2) == [
+        (('张经理', '李专员'), 2, *exposure([1, 2])),
+        (('张经理', '小计'), 2, *exposure([1, 2])),
+        (('张经理', '李专员'), 1, *exposure([3])),
+        (('张经理', '小计'), 1, *exposure([3])),
+        ((unassigned, '王专员'), 1, *exposure([4])),
+        ((unassigned, unassigned), 1, *exposure([5])),
+        ((unassigned, '小计'), 2, *exposure([4, 5])),
+        (('全部', None), 5, *exposure([1, 2, 3, 4, 5])),
+    ]
+    assert _groups(wb['销售汇总'], 1) == [
+        (('销售乙',), 1, *exposure([5])),
+        (('销售甲',), 3, *exposure([1, 2, 3])),
+        ((unassigned,), 1, *exposure([4])),
+        (('全部',), 5, *exposure([1, 2, 3, 4, 5])),
+    ]
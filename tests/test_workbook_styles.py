@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""报表工作簿样式表：与样式使用顺序无关（分片合并依赖这一点）"""
+
+import zipfile
+
+import report_generator as rg
+
+
+def _styles_xml(path, style_names, streaming):
+    wb = rg.create_report_workbook(streaming=streaming)
+    ws = wb.create_sheet('门店') if streaming else wb.active
+    rg.append_styled_rows(ws, [list(range(len(style_names)))], [list(style_names)])
+    wb.save(path)
+    with zipfile.ZipFile(path) as archive:
+        return archive.read('xl/styles.xml')
+
+
+def test_style_table_is_independent_of_usage_order(tmp_path):
+    names = list(rg.REPORT_NAMED_STYLES)
+    expected = _styles_xml(tmp_path / 'a.xlsx', names, streaming=False)
+    assert _styles_xml(tmp_path / 'b.xlsx', names[::-1], streaming=False) == expected
+    assert _styles_xml(tmp_path / 'c.xlsx', names[1::2], streaming=True) == expected